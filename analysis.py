@@ -0,0 +1,190 @@
+"""
+Structural analysis of automata: which states can be reached, which states can still lead to a final state,
+the strongly connected components, the alphabet, and how many transitions go in and out of each state.
+"""
+from collections import Counter
+
+from engine import EPSILON, stronglyconnected
+
+
+class AnalysisIndex:
+    """
+    The structure of an Automaton, worked out once and then kept up to date as the automaton is changed.
+    (See Automaton.analyze)
+
+    The degrees and the alphabet are always kept up to date, since every change only affects a few of them.
+    The reachable and co-reachable sets are kept up to date when transitions and states are added, by searching
+    only from where the new transition leads. When something is removed, a search would have to start over,
+    so they are just thrown away and searched again the next time they are needed. The strongly connected
+    components are always thrown away when a transition changes.
+    """
+
+    def __init__(self, automaton):
+        """
+        :param automaton: The Automaton to analyze. Its states and transitions are looked at as they are changed,
+                    so the index has to be told about every change. (The Automaton does that itself)
+        """
+        self.automaton = automaton
+        # outdegree[A] is the number of states that A has transitions to, and indegree[A] the number that have
+        # transitions to A. (Several inputs between the same pair of states count as one transition)
+        self.outdegree = {}
+        self.indegree = {}
+        # symbolcounts[x] is the number of transitions that can be taken on the input x
+        self.symbolcounts = Counter()
+        states = automaton.states
+        for state in states:
+            self.outdegree[state] = len(states[state])
+            self.indegree.setdefault(state, 0)
+            for otherstate, inputs in states[state].items():
+                self.indegree[otherstate] = self.indegree.get(otherstate, 0) + 1
+                self.symbolcounts.update(inputs)
+        # These are worked out when they are first needed (See the functions with the same names)
+        self.reachableset = None
+        self.coreachableset = None
+        self.components = None
+
+    def reachable(self):
+        """
+        :return: The set of states which can be reached from the start state
+        """
+        if self.reachableset is None:
+            self.reachableset = set()
+            if self.automaton.startstate in self.automaton.states:
+                search(self.reachableset, [self.automaton.startstate], self.automaton.states)
+        return self.reachableset
+
+    def coreachable(self):
+        """
+        :return: The set of states from which a final state can be reached. (States which are not in this set are
+                "dead": once the automaton gets there, it can never accept anything anymore)
+        """
+        if self.coreachableset is None:
+            self.coreachableset = set()
+            search(self.coreachableset, self.automaton.finalstates, self.automaton.predecessors)
+        return self.coreachableset
+
+    def useful(self):
+        """
+        :return: The set of states which are both reachable and co-reachable. All the other states can be
+                removed without changing which inputs the automaton accepts. (See Automaton.trim)
+        """
+        return self.reachable() & self.coreachable()
+
+    def sccs(self):
+        """
+        :return: A list of the strongly connected components of the automaton, each of which is a list of states.
+                Every component comes after all the components it has transitions to.
+        """
+        if self.components is None:
+            self.components = list(stronglyconnected(self.automaton.states))
+        return self.components
+
+    def alphabet(self):
+        """
+        :return: The set of all inputs used by at least one transition, not including EPSILON
+        """
+        return {symbol for symbol, count in self.symbolcounts.items() if count > 0 and symbol != EPSILON}
+
+    def addstate(self, state, start, final):
+        """
+        Called by Automaton.addstate, after the state is added.
+        :param state: Name of the state
+        :param start: True if it is now the start state
+        :param final: True if it is now a final state
+        """
+        if state not in self.outdegree:
+            self.outdegree[state] = 0
+            if state not in self.indegree:
+                # A brand new state, which is a component all by itself
+                self.indegree[state] = 0
+                if self.components is not None:
+                    self.components.append([state])
+            else:
+                # It was already the destination of a transition, so it might already be in a component
+                self.components = None
+        if start and self.reachableset is not None:
+            search(self.reachableset, [state], self.automaton.states)
+        if final and self.coreachableset is not None:
+            search(self.coreachableset, [state], self.automaton.predecessors)
+
+    def removestate(self, state):
+        """
+        Called by Automaton.removestate, before the state is removed.
+        :param state: Name of the state
+        """
+        automaton = self.automaton
+        for otherstate, inputs in automaton.states.get(state, {}).items():
+            self.indegree[otherstate] -= 1
+            self.symbolcounts.subtract(inputs)
+        for otherstate in automaton.predecessors.get(state, ()):
+            if otherstate in automaton.states and otherstate != state:
+                self.outdegree[otherstate] -= 1
+                self.symbolcounts.subtract(automaton.states[otherstate][state])
+        self.outdegree.pop(state, None)
+        self.indegree.pop(state, None)
+        # Removing a state which was not reachable cannot make any other state unreachable, and the same goes for
+        # co-reachable. Otherwise, the search has to start over.
+        if self.reachableset is not None:
+            if state in self.reachableset:
+                self.reachableset = None
+        if self.coreachableset is not None:
+            if state in self.coreachableset:
+                self.coreachableset = None
+        self.components = None
+
+    def addtransition(self, fromstate, tostate, inputs):
+        """
+        Called by Automaton.addtransition, before the transition is added.
+        :param fromstate: Name of the state the transition comes from
+        :param tostate: Name of the state the transition goes to
+        :param inputs: A list of the inputs on the transition
+        """
+        existing = self.automaton.states[fromstate].get(tostate)
+        if existing is None:
+            self.outdegree[fromstate] = self.outdegree.get(fromstate, 0) + 1
+            self.indegree[tostate] = self.indegree.get(tostate, 0) + 1
+            existing = ()
+            self.components = None
+        self.symbolcounts.update(symbol for symbol in set(inputs) if symbol not in existing)
+        # Everything reachable from tostate becomes reachable too, but the rest of the search still holds
+        if self.reachableset is not None and fromstate in self.reachableset:
+            search(self.reachableset, [tostate], self.automaton.states)
+        if self.coreachableset is not None and tostate in self.coreachableset:
+            search(self.coreachableset, [fromstate], self.automaton.predecessors)
+
+    def deletetransition(self, fromstate, tostate, inputs):
+        """
+        Called by Automaton.deletetransition, before the inputs are removed from the transition.
+        :param fromstate: Name of the state the transition comes from
+        :param tostate: Name of the state the transition goes to
+        :param inputs: A list of the inputs to remove
+        """
+        existing = self.automaton.states.get(fromstate, {}).get(tostate)
+        if existing is None:
+            return
+        removed = existing.intersection(inputs)
+        self.symbolcounts.subtract(removed)
+        if len(removed) == len(existing):
+            # The whole transition is gone. (If only some of its inputs are removed, it can still be taken)
+            self.outdegree[fromstate] -= 1
+            self.indegree[tostate] -= 1
+            self.reachableset = None
+            self.coreachableset = None
+            self.components = None
+
+
+def search(found, starts, graph):
+    """
+    Adds everything which can be reached in a graph from some starting states to a set. The search does not
+    go through states which are already in the set, since everything reachable from them already is too.
+    :param found: The set to add to
+    :param starts: The states to start from
+    :param graph: A dictionary from a state to an iterable of the states it leads to
+    """
+    queue = [state for state in starts if state not in found]
+    found.update(queue)
+    for state in queue:
+        for otherstate in graph.get(state, ()):
+            if otherstate not in found:
+                found.add(otherstate)
+                queue.append(otherstate)
@@ -1,72 +1,378 @@
 import json
 import random
-import itertools
 import math
 import sys
 import os
+import re
+import concurrent.futures
+import contextlib
+import functools
+from engine import CompiledAutomaton, LazyDFA, LazyProduct, EdgeArrays, CompactStates, CompactPredecessors, \
+    EPSILON, Verdict, predecessorsof
+import engine
+import layoutengine
+import regexcompiler
+import parallel
+import binaryformat
+from analysis import AnalysisIndex
+from symbolclasses import isclass
+from profiling import Profiler
+
+# The characters which are escaped in the names of the states in a set (see subsetname)
+SUBSETESCAPE = re.compile(r"[\\,{}]")
 
 
 class Automaton:
 
-    def __init__(self, filepath):
+    # Automata are often kept around by the hundreds, so they do not carry a dictionary of attributes.
+    __slots__ = ("name", "description", "states", "finalstates", "startstate", "currentstate", "compiled",
+                 "positions", "changedstates", "mergedstates", "predecessors", "batchdepth",
+                 "index", "prune", "profiler")
+
+    def __init__(self, filepath="", data=None, validate=True, compact=False, prune=False):
         """
-        :param filepath: Path to the file containing the specification for this automaton
+        :param filepath: Path to the file containing the specification for this automaton. This is either a JSON
+                    file, an edge list (see readedgelist) if the name ends with ".edges", or a compiled binary file
+                    (see self.openbinary) if the name ends with ".automaton".
+        :param data: The specification itself, in the same format as the JSON file.
+                    If this is given, then filepath is ignored and no file is read. It is not changed, and the
+                    automaton does not share anything with it, so the same specification can be used again.
+        :param validate: If True, then check that every state which is used (as the start state, as a final state,
+                    or as the destination of a transition) is actually one of the states of the automaton,
+                    and raise a ValueError if not.
+        :param compact: If True, then store the transitions in a compact form which uses much less memory.
+                    (See self.freeze)
+        :param prune: If True, then states which can never lead to a final state are dropped from the current
+                    states as soon as they are reached, so that stepping only keeps track of states that matter.
+                    This does not change which inputs are accepted. (See engine.CompiledAutomaton.prune)
         """
-        if getattr(sys, "frozen", False):
-            # The application is frozen.
-            datadir = os.path.dirname(sys.executable)
-        else:
-            # The application is not frozen.
-            datadir = os.path.dirname(__file__)
-        if len(filepath) is not 0 :
-            if filepath[0] is not '/':
-                filepath = os.path.join(datadir, filepath)
-        else:
-            filepath = os.path.join(datadir, "Samples/default.json")
-        with open(filepath) as file:
-            data = json.load(file)
-        self.JSON = data
-        self.name = data["name"]
-        self.description = data["description"]
+        # The transitions of a specification read from a file belong to this automaton alone, so they can be
+        # cleaned up in place below. Those given by the caller have to be copied first.
+        owned = data is None
+        if data is None:
+            if getattr(sys, "frozen", False):
+                # The application is frozen.
+                datadir = os.path.dirname(sys.executable)
+            else:
+                # The application is not frozen.
+                datadir = os.path.dirname(__file__)
+            if len(filepath) is not 0 :
+                if filepath[0] is not '/':
+                    filepath = os.path.join(datadir, filepath)
+            else:
+                filepath = os.path.join(datadir, "Samples/default.json")
+            if getattr(sys, "frozen", False) and filepath.endswith(".json"):
+                # Samples bundled with the application can be compiled ahead of time (see binaryformat),
+                # which is much faster to open
+                compiledpath = os.path.splitext(filepath)[0] + binaryformat.EXTENSION
+                if os.path.exists(compiledpath):
+                    filepath = compiledpath
+            if filepath.endswith(binaryformat.EXTENSION):
+                self.openbinary(filepath, prune)
+                return
+            if filepath.endswith(".edges"):
+                data = readedgelist(filepath)
+            else:
+                with open(filepath) as file:
+                    data = json.load(file)
+        for key in ("transitions", "start", "finalstates"):
+            if key not in data:
+                raise ValueError("The automaton is missing \"{}\"".format(key))
+        self.name = data.get("name", "")
+        self.description = data.get("description", "")
+
+        finalstates = data["finalstates"]
+        try:
+            if isinstance(finalstates, str):
+                # A string is iterable, but here it is the name of a single state
+                raise TypeError
+            finalstates = {str(state) for state in finalstates}
+        except TypeError:
+            # If finalstates is not a list, make it a list
+            finalstates = {str(finalstates)}
+        self.finalstates = finalstates
+
+        # State names are always strings, since they are the keys of a JSON object
+        self.startstate = str(data["start"])
 
         states = data["transitions"]
-        # Clean up the states from the file.
+        if not owned:
+            # Only the dictionaries are copied, since the inputs in them are replaced by new sets below anyway
+            states = {state: dict(transitions) for state, transitions in states.items()}
+        # Clean up the states from the file, and build the compiled transition table at the same time.
+        # (This is all done in place, so that there is only ever one copy of the transitions)
+        # (A compact automaton builds its own table from the cleaned up states afterwards instead)
+        compiled = None if compact else CompiledAutomaton({}, None)
+        if compiled is not None:
+            for state in states:
+                compiled.internstate(state)
+        # predecessors[B] is the set of all the states which have a transition to state B
+        predecessors = {state: set() for state in states}
         for state in states:
-            for otherstate in states[state]:
-                try:
-                    # Just make sure everything is stored as a string, no numbers
-                    states[state][otherstate] = list(map(lambda x: str(x), states[state][otherstate]))
-                except TypeError:
-                    # If the connection was stored as a single value instead of an array, then change it to
-                    # be an array of length 1
-                    states[state][otherstate] = [str(states[state][otherstate])]
+            for otherstate, inputs in states[state].items():
+                if validate and otherstate not in states:
+                    raise ValueError("There is a transition from state {} to state {}, which does not exist"
+                                     .format(state, otherstate))
+                if inputs == EPSILON:
+                    # An empty string on its own is an epsilon transition, not an empty list of inputs
+                    inputs = [EPSILON]
+                elif isinstance(inputs, str) and isclass(inputs):
+                    # A character class like "[a-z]" is a single label (See symbolclasses)
+                    inputs = [inputs]
+                elif isinstance(inputs, str):
+                    # Same as below: A string like "ab" is the inputs "a" and "b"
+                    inputs = list(inputs)
+                else:
+                    try:
+                        # Just make sure everything is stored as a string, no numbers
+                        inputs = [str(x) for x in inputs]
+                    except TypeError:
+                        # If the connection was stored as a single value instead of an array, then change it to
+                        # be an array of length 1
+                        inputs = [str(inputs)]
+                states[state][otherstate] = set(inputs)
+                predecessors.setdefault(otherstate, set()).add(state)
+                if compiled is not None:
+                    compiled.addtransition(state, otherstate, inputs)
+        if validate:
+            # An empty start state means that the automaton does not have one (yet)
+            if len(self.startstate) != 0 and self.startstate not in states:
+                raise ValueError("The start state {} does not exist".format(self.startstate))
+            for state in finalstates:
+                if state not in states:
+                    raise ValueError("The final state {} does not exist".format(state))
+        if compiled is not None:
+            compiled.finish(self.startstate, finalstates)
+            if prune:
+                compiled.prune()
 
         # self.states contains the information about connections between states.
         # If you are currently in state A, and receive an input x, then to check if there is a transition
-        # to state B, check if x in self.states["A"]["B"]
+        # to state B, check if x in self.states["A"]["B"]. (self.states["A"]["B"] is a set)
+        # If EPSILON is in self.states["A"]["B"], then the automaton can go from A to B without any input.
+        # A label can also be a character class like "[a-z]", which stands for every character in it.
+        # (See symbolclasses)
         self.states = states
+        self.predecessors = predecessors
 
-        finalstates = data["finalstates"]
-        try:
-            iter(finalstates)
-        except TypeError:
-            # If finalstates is not a list, make it a list
-            finalstates = [finalstates]
-        self.finalstates = finalstates
+        # Compiled transition table used by getnextstate. It is thrown away whenever the automaton is changed,
+        # and then built again the next time it is needed. (See self.compile and self.invalidate)
+        self.compiled = compiled
+
+        # The most recent layout of this automaton (see self.updatelayout), or None if it has not been laid out yet.
+        # This can be saved in the file, in which case it does not have to be computed again.
+        self.positions = None
+        if data.get("layout") is not None:
+            self.positions = {state: tuple(coords) for state, coords in data["layout"].items()}
+        # States which have been added, removed, or had their transitions changed since that layout was made
+        self.changedstates = set()
+
+        # Number of states that were merged together to make this automaton. (See self.minimize)
+        self.mergedstates = 0
+
+        # How many self.batch blocks are currently open
+        self.batchdepth = 0
 
-        self.startstate = data["start"]
+        self.prune = prune
+        # Structural analysis of this automaton (see self.analyze), or None if it has not been needed yet
+        self.index = None
+        # What this automaton does is counted by this, if it is being profiled (see self.profile), otherwise None
+        self.profiler = None
 
-        self.currentstate = {self.startstate}
+        if compact:
+            self.freeze()
+
+        self.start()
+
+    @classmethod
+    def from_regex(cls, pattern, alphabet=None, determinize=False, minimize=False):
+        """
+        Builds an automaton which accepts exactly the inputs matched by a regular expression, using Thompson's
+        construction. (See regexcompiler for the syntax) The result of each pattern is cached, so building the
+        same pattern again is fast, especially when it is determinized or minimized.
+        :param pattern: The regular expression
+        :param alphabet: An iterable of all the inputs. This is needed if the pattern uses . or [^...]
+        :param determinize: If True, then the automaton is determinized. (See self.determinize)
+        :param minimize: If True, then the automaton is minimized. (See self.minimize)
+        :return: A new Automaton. Without determinize or minimize, it has epsilon transitions.
+        """
+        if alphabet is not None:
+            alphabet = tuple(alphabet)
+        cached = regexautomaton(pattern, alphabet, determinize, minimize)
+        # The cached automaton is never handed out itself, since it could be changed
+        return cls(data=cached.todict())
 
     def getJSON(self):
         """
         Returns the data as a JSON formatted string
         :return: A string that contains the JSON data
         """
-        return json.dumps(self.JSON, indent=4, sort_keys=True)
+        return json.dumps(self.todict(), indent=4, sort_keys=True)
+
+    def todict(self):
+        """
+        Returns the current specification of this automaton, in the same format as the JSON file.
+        (So that Automaton(data=automaton.todict()) makes a copy of the automaton)
+        :return: A dictionary with the keys "name", "description", "transitions", "start" and "finalstates",
+                and also "layout" if this automaton has been laid out. (See self.updatelayout)
+        """
+        data = {
+            "name": self.name,
+            "description": self.description,
+            "transitions": {state: {otherstate: sorted(inputs) for otherstate, inputs in self.states[state].items()}
+                            for state in self.states},
+            "start": self.startstate,
+            "finalstates": sorted(self.finalstates)
+        }
+        if self.positions is not None:
+            data["layout"] = {state: list(coords) for state, coords in self.positions.items() if state in self.states}
+        return data
+
+    def savebinary(self, filepath, layout=True):
+        """
+        Saves the compact form of this automaton (see self.freeze) to a binary file, which can be opened again much
+        faster than a JSON file, no matter how big the automaton is. (See self.openbinary and binaryformat)
+        Just like the compact form, the file keeps the transitions just as they were given, epsilon transitions
+        and all, besides the ones with the epsilon-closures folded in which are used to run inputs.
+        :param filepath: Path of the file, which should end with ".automaton"
+        :param layout: If True, then the most recent layout of this automaton is saved too, if it has one
+        """
+        binaryformat.writebinary(self, filepath, layout)
+
+    def openbinary(self, filepath, prune=False):
+        """
+        Replaces this automaton with one from a binary file written by self.savebinary. The file is memory mapped,
+        and this automaton is left in the compact form (see self.freeze), running inputs directly on the arrays in
+        the file, so this takes the same short time no matter how big the file is. Everything else (like the
+        names of states, or self.getJSON) only looks at the parts of the file it needs, when it needs them.
+        The automaton can still be changed; the first change reads the whole thing into the normal form.
+        :param filepath: Path of the file
+        :param prune: Same as for __init__
+        :raises ValueError: If the file is not a binary automaton, or is from a different version of the format
+        """
+        header, edges, finalstates, positions = binaryformat.readbinary(filepath)
+        self.name = header["name"]
+        self.description = header["description"]
+        self.startstate = header["start"]
+        self.finalstates = finalstates
+        self.compiled = edges
+        self.states = CompactStates(edges)
+        self.predecessors = CompactPredecessors(self.states)
+        self.positions = positions
+        self.changedstates = set()
+        self.mergedstates = 0
+        self.batchdepth = 0
+        self.prune = prune
+        self.index = None
+        self.profiler = None
+        if prune:
+            edges.prune()
+        self.start()
 
     def start(self):
-        self.currentstate = {self.startstate}
+        """
+        Puts this automaton back into its start state. (And every state reachable from it by epsilon transitions)
+        """
+        compiled = self.compile()
+        self.currentstate = compiled.names(compiled.startmask)
+        if self.profiler is not None:
+            self.profiler.visit(compiled, compiled.startmask)
+
+    def compile(self):
+        """
+        Returns the compiled transition table of this automaton, building it first if necessary.
+        :return: A CompiledAutomaton which is kept up to date with the states and transitions of this automaton.
+        """
+        if self.compiled is None:
+            self.compiled = CompiledAutomaton(self.states, self.startstate, self.finalstates)
+            if self.prune:
+                self.compiled.prune()
+        return self.compiled
+
+    def freeze(self):
+        """
+        Switches this automaton to a compact form which uses much less memory, for automata with many
+        transitions. States and inputs are replaced by small integers, and the transitions are kept in arrays
+        (see engine.EdgeArrays), which are also used directly to run inputs. self.states is then a read only view
+        of those arrays, which still looks like a dictionary of dictionaries of inputs.
+        The automaton can still be changed; the first change turns it back into the normal form (see self.thaw).
+        """
+        if not isinstance(self.states, CompactStates):
+            self.compiled = EdgeArrays(self.states, self.startstate, self.finalstates)
+            if self.prune:
+                self.compiled.prune()
+            self.states = CompactStates(self.compiled)
+            self.predecessors = CompactPredecessors(self.states)
+            # The index looks at self.states and self.predecessors, which were just replaced
+            self.index = None
+
+    def thaw(self):
+        """
+        Switches this automaton back from the compact form (see self.freeze) to the normal form, where self.states
+        is a dictionary of dictionaries of sets which can be changed.
+        """
+        if isinstance(self.states, CompactStates):
+            self.states = {state: {otherstate: set(inputs) for otherstate, inputs in self.states[state].items()}
+                           for state in self.states}
+            self.compiled = None
+            self.predecessors = predecessorsof(self.states)
+            self.index = None
+            # An automaton opened from a binary file has a read only view of the file for these too
+            if not isinstance(self.finalstates, set):
+                self.finalstates = set(self.finalstates)
+            if self.positions is not None and not isinstance(self.positions, dict):
+                self.positions = dict(self.positions)
+
+    def invalidate(self, *changedstates):
+        """
+        Throws away everything that was derived from the states and transitions of this automaton,
+        so that it gets rebuilt the next time it is needed. This is called by every function that
+        changes the automaton. Inside of a self.batch block, nothing is thrown away until the end of the block.
+        :param changedstates: The states which were changed. These are moved around by the next self.updatelayout
+        """
+        self.changedstates.update(changedstates)
+        if self.batchdepth == 0:
+            self.compiled = None
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Groups together a lot of changes to this automaton, so that everything derived from it (like the compiled
+        transition table) is only thrown away once, at the end, instead of after every change. For example:
+            with automaton.batch():
+                for i in range(1000):
+                    automaton.addstate(str(i), False, False)
+        Inside the block, the changes are not seen by getnextstate, step, accepts and so on until the block ends.
+        Blocks can be nested, in which case everything is thrown away at the end of the outermost one.
+        """
+        self.batchdepth += 1
+        try:
+            yield self
+        finally:
+            self.batchdepth -= 1
+            if self.batchdepth == 0:
+                self.invalidate()
+
+    def profile(self, callback=None):
+        """
+        Starts counting what this automaton does: how often each state is current and each transition is taken,
+        how many states are current at once, how many steps are run per second, and how many steps each layout
+        takes. Everything is counted until self.endprofile is called. Inputs are run much more slowly while
+        this automaton is being profiled, but not at all more slowly otherwise.
+        :param callback: A function which is told about every step as it happens. (See profiling.Profiler)
+        :return: The profiling.Profiler with the counts
+        """
+        self.profiler = Profiler(callback)
+        return self.profiler
+
+    def endprofile(self):
+        """
+        Stops profiling this automaton.
+        :return: The profiling.Profiler with the counts, or None if this automaton was not being profiled
+        """
+        profiler = self.profiler
+        self.profiler = None
+        return profiler
 
     def getnextstate(self, nextinput):
         """
@@ -76,14 +382,7 @@ class Automaton:
                 If this automaton is deterministic, then this set will always be of length 0 or 1.
                 For nondeterministic automata, this set can be of any length.
         """
-
-        nextstate = set()
-        for currentstate in self.currentstate:
-            currentstate = self.states[currentstate]
-            for potentialnextstate in currentstate:
-                if nextinput in currentstate[potentialnextstate]:
-                    nextstate.add(potentialnextstate)
-        return nextstate
+        return self.compile().getnextstate(self.currentstate, nextinput)
 
     def step(self, nextinput):
         """
@@ -92,99 +391,554 @@ class Automaton:
         :return: The next state(s) to which this automaton has advanced, as a set.
                 Possibly the empty set if there are no states to which this automaton can advance with this input.
         """
-        self.currentstate = self.getnextstate(nextinput)
+        if self.profiler is not None:
+            self.currentstate = self.profiler.step(self.compile(), self.currentstate, nextinput)
+        else:
+            self.currentstate = self.getnextstate(nextinput)
         return self.currentstate
 
+    def run(self, word):
+        """
+        Runs this automaton over an entire input, without changing the current state.
+        :param word: An iterable of inputs to this automaton. (For example, a string)
+        :return: The set of states in which this automaton ends up after the whole input.
+                Possibly the empty set.
+        """
+        compiled = self.compile()
+        if self.profiler is not None:
+            return compiled.names(self.profiler.run(compiled, word))
+        return compiled.names(compiled.runmask(word))
+
+    def accepts(self, word):
+        """
+        Checks whether this automaton accepts an input, without changing the current state.
+        :param word: An iterable of inputs to this automaton. (For example, a string)
+        :return: True if this automaton ends up in at least one final state, False otherwise.
+        """
+        if self.profiler is not None:
+            compiled = self.compile()
+            return self.profiler.run(compiled, word) & compiled.finalmask != 0
+        return self.compile().accepts(word)
+
+    def accepts_many(self, words):
+        """
+        Checks a batch of inputs against this automaton, reusing the same compiled table for all of them.
+        :param words: An iterable of inputs, each of which is an iterable of inputs to this automaton.
+        :return: A bytearray with one entry per input: 1 if that input is accepted, 0 if it is not.
+        """
+        if self.profiler is not None:
+            return bytearray(self.accepts(word) for word in words)
+        return self.compile().acceptsmany(words)
+
+    def accepts_parallel(self, words, processes=None, chunksize=10000):
+        """
+        Same as self.accepts_many, but the inputs are split into chunks which are checked by several processes
+        at once. (See parallel.accepts_parallel) This is only worth it for big batches, since the processes
+        take a while to start.
+        :param words: An iterable of inputs, each of which is an iterable of inputs to this automaton.
+        :param processes: Number of worker processes. If None, one for every CPU.
+        :param chunksize: Number of inputs sent to a worker process at a time
+        :return: A bytearray with one entry per input: 1 if that input is accepted, 0 if it is not.
+        """
+        return parallel.accepts_parallel(self, words, processes, chunksize)
+
+    def determinize(self, lazy=False, cachesize=1024):
+        """
+        Builds a deterministic automaton which accepts exactly the same inputs as this one,
+        using the subset construction. Only the subsets which can actually be reached from the start state are built.
+        States of the new automaton are named after the set of states they stand for, like "{A,B}".
+        (A subset with only one state just keeps the name of that state.)
+        :param lazy: If True, then instead of building the whole deterministic automaton up front,
+                    return a LazyDFA which only builds each subset the first time an input reaches it.
+        :param cachesize: For a lazy DFA, the maximum number of subsets to keep around at once.
+        :return: A new Automaton, or a LazyDFA if lazy is True.
+        """
+        compiled = self.compile()
+        if lazy:
+            return LazyDFA(compiled, cachesize)
+
+        transitions = {}
+        finalstates = []
+        for mask, row in compiled.subsets().items():
+            name = subsetname(compiled, mask)
+            transitions[name] = {}
+            for symbolid, nextmask in row.items():
+                transitions[name].setdefault(subsetname(compiled, nextmask), []).append(compiled.symbols[symbolid])
+            if mask & compiled.finalmask:
+                finalstates.append(name)
+        startstate = subsetname(compiled, compiled.startmask) if compiled.startmask else self.startstate
+        if len(startstate) != 0:
+            transitions.setdefault(startstate, {})
+        return Automaton(data={
+            "name": self.name,
+            "description": self.description,
+            "transitions": transitions,
+            "start": startstate,
+            "finalstates": finalstates
+        })
+
+    def minimize(self):
+        """
+        Builds the smallest deterministic automaton which accepts exactly the same inputs as this one.
+        This determinizes the automaton, and then merges together all the states which are equivalent,
+        using Hopcroft's algorithm. States which can never lead to a final state are removed.
+        Each group of merged states keeps the name of one of its states. (The start state keeps its name)
+        :return: A new Automaton. The number of states of the deterministic automaton which were merged away
+                is stored in its attribute mergedstates.
+        """
+        dfa = self.determinize()
+        compiled = dfa.compile()
+        blocks = compiled.partition()
+        # Maps each state id to the name of the state that it gets merged into
+        merged = {}
+        for block in blocks:
+            for stateid in block:
+                merged[stateid] = compiled.statenames[block[0]]
+
+        transitions = {}
+        finalstates = []
+        for block in blocks:
+            stateid = block[0]
+            transitions[compiled.statenames[stateid]] = {}
+            if compiled.finalmask >> stateid & 1:
+                finalstates.append(compiled.statenames[stateid])
+        # Only the transitions of the first state of each block are kept, since the others are the same
+        for symbolid, row in enumerate(compiled.table):
+            for stateid, targets in row.items():
+                name = compiled.statenames[stateid]
+                if name not in transitions or merged.get(stateid) != name:
+                    continue
+                # The automaton is deterministic, so there is at most one next state
+                for nextid in targets:
+                    if nextid in merged:
+                        transitions[name].setdefault(merged[nextid], []).append(compiled.symbols[symbolid])
+
+        # If the start state can never reach a final state, it is still needed (with no transitions)
+        if len(dfa.startstate) != 0:
+            transitions.setdefault(dfa.startstate, {})
+        result = Automaton(data={
+            "name": self.name,
+            "description": self.description,
+            "transitions": transitions,
+            "start": dfa.startstate,
+            "finalstates": finalstates
+        })
+        result.mergedstates = len(dfa.states) - len(transitions)
+        return result
+
+    def product(self, other, operation, lazy=False, alphabet=()):
+        """
+        Builds an automaton which runs this automaton and another one side by side, and accepts depending on which
+        of them accept. (See engine.LazyProduct) Only the pairs of states which can be reached from the pair of
+        start states are built, and pairs which can never be accepted are left out.
+        States of the new automaton are named after the pair of sets of states they stand for, like "(A,{B,C})",
+        where {} is the empty set.
+        :param other: The other Automaton. Ignored for "complement".
+        :param operation: "intersection", "union", "difference" or "complement"
+        :param lazy: If True, then instead of building the product up front, return a LazyProduct which only
+                    builds each pair the first time an input reaches it.
+        :param alphabet: Extra inputs for the product to use, besides those used by either automaton.
+        :return: A new deterministic Automaton, or a LazyProduct if lazy is True.
+        """
+        left = self.compile()
+        right = other.compile() if operation != "complement" else CompiledAutomaton({}, "")
+        product = LazyProduct(left, right, operation, alphabet)
+        if lazy:
+            return product
+
+        def pairname(pair):
+            if operation == "complement":
+                return subsetname(left, pair[0])
+            return "(" + subsetname(left, pair[0]) + "," + subsetname(right, pair[1]) + ")"
+
+        transitions = {}
+        finalstates = []
+        for pair, row in product.explore().items():
+            name = pairname(pair)
+            transitions[name] = {}
+            for symbol, nextpair in row.items():
+                transitions[name].setdefault(pairname(nextpair), []).append(symbol)
+            if product.isfinal(pair):
+                finalstates.append(name)
+        startstate = pairname(product.startpair)
+        transitions.setdefault(startstate, {})
+        if operation == "complement":
+            name = "Complement of {}".format(self.name)
+        else:
+            name = "{} {} {}".format(self.name, operation, other.name)
+        return Automaton(data={
+            "name": name,
+            "description": self.description,
+            "transitions": transitions,
+            "start": startstate,
+            "finalstates": finalstates
+        })
+
+    def intersect(self, other, lazy=False):
+        """
+        :param other: Another Automaton
+        :param lazy: If True, return a LazyProduct instead. (See self.product)
+        :return: An automaton which accepts exactly the inputs accepted by both this automaton and the other one.
+        """
+        return self.product(other, "intersection", lazy)
+
+    def union(self, other, lazy=False):
+        """
+        :param other: Another Automaton
+        :param lazy: If True, return a LazyProduct instead. (See self.product)
+        :return: An automaton which accepts exactly the inputs accepted by this automaton, the other one, or both.
+        """
+        return self.product(other, "union", lazy)
+
+    def difference(self, other, lazy=False):
+        """
+        :param other: Another Automaton
+        :param lazy: If True, return a LazyProduct instead. (See self.product)
+        :return: An automaton which accepts exactly the inputs accepted by this automaton but not by the other one.
+        """
+        return self.product(other, "difference", lazy)
+
+    def complement(self, alphabet=(), lazy=False):
+        """
+        Builds an automaton which accepts exactly the inputs which this automaton does not accept.
+        Only inputs made of the symbols used by this automaton, and those in alphabet, are considered.
+        :param alphabet: Extra inputs to allow, besides those used by this automaton.
+        :param lazy: If True, return a LazyProduct instead. (See self.product)
+        :return: A new deterministic Automaton, or a LazyProduct if lazy is True.
+        """
+        return self.product(None, "complement", lazy, alphabet)
+
+    def analyze(self):
+        """
+        Returns the structural analysis of this automaton: which states are reachable and co-reachable, the
+        strongly connected components, the alphabet, and the number of transitions in and out of every state.
+        It is worked out the first time it is needed, and then kept up to date by every function that changes
+        the automaton, so it is cheap to call this again and again.
+        :return: An analysis.AnalysisIndex
+        """
+        if self.index is None:
+            self.index = AnalysisIndex(self)
+        return self.index
+
+    def trim(self):
+        """
+        Removes all the states which are useless: those which cannot be reached from the start state, and those
+        from which no final state can be reached. This does not change which inputs are accepted.
+        The start state is always kept, even if this automaton does not accept anything.
+        :return: The set of names of the states which were removed
+        """
+        useful = self.analyze().useful()
+        useless = {state for state in self.states if state not in useful and state != self.startstate}
+        with self.batch():
+            for state in useless:
+                self.removestate(state)
+        return useless
+
+    def is_empty(self):
+        """
+        Checks whether this automaton does not accept any input at all.
+        :return: A Verdict. (True or False when used as a condition) If this automaton is not empty, its
+                counterexample is a shortest input that it accepts, as a list of input symbols.
+        """
+        word = engine.shortestaccepted(self.compile())
+        return Verdict(word is None, word)
+
+    def is_subset(self, other):
+        """
+        Checks whether every input accepted by this automaton is also accepted by another one.
+        This works directly on nondeterministic automata, without determinizing this one. (See engine.shortestdifference)
+        :param other: Another Automaton
+        :return: A Verdict. If the answer is no, its counterexample is a shortest input accepted by this automaton
+                but not by the other one.
+        """
+        word = engine.shortestdifference(self.compile(), other.compile())
+        return Verdict(word is None, word)
+
+    def is_equivalent(self, other):
+        """
+        Checks whether this automaton accepts exactly the same inputs as another one. (See engine.equivalent)
+        :param other: Another Automaton
+        :return: A Verdict. If the answer is no, its counterexample is a shortest input accepted by only one of them.
+        """
+        left = self.compile()
+        right = other.compile()
+        if engine.equivalent(left, right):
+            return Verdict(True)
+        words = [word for word in (engine.shortestdifference(left, right), engine.shortestdifference(right, left))
+                 if word is not None]
+        return Verdict(False, min(words, key=len))
+
     def addstate(self, statename,start,final):
+        self.thaw()
         if start and len(self.startstate) is 0:
             self.startstate = statename
         if final:
-            self.finalstates.append(statename)
+            self.finalstates.add(statename)
         if statename not in self.states:
             self.states[statename] = {}
+            self.predecessors.setdefault(statename, set())
+        if self.index is not None:
+            self.index.addstate(statename, statename == self.startstate, final)
+        self.invalidate(statename)
 
     def removestate(self, statename):
-        if statename in self.states:
-            del self.states[statename]
-        if statename in self.startstate:
+        self.thaw()
+        if self.index is not None:
+            self.index.removestate(statename)
+        # Only the states that this state is connected to need to be looked at, thanks to self.predecessors
+        successors = self.states.pop(statename, {})
+        predecessors = self.predecessors.pop(statename, set())
+        for otherstate in predecessors:
+            if otherstate in self.states:
+                del self.states[otherstate][statename]
+        for otherstate in successors:
+            self.predecessors.get(otherstate, set()).discard(statename)
+        if statename == self.startstate:
             self.startstate = ""
-        if statename in self.finalstates:
-            self.finalstates.remove(statename)
-        for otherstate in self.states.values():
-            if statename in otherstate:
-                del otherstate[statename]
+        self.finalstates.discard(statename)
+        # All the states that this state was connected to will have to be moved around a bit in the layout
+        self.invalidate(statename, *predecessors, *successors)
 
     def addtransition(self, fromstate, tostate, inputs):
+        self.thaw()
+        if inputs == EPSILON or isinstance(inputs, str) and isclass(inputs):
+            inputs = [inputs]
         try:
             inputs = list(inputs)
         except TypeError:
             inputs = [inputs]
 
         if fromstate in self.states:
+            if self.index is not None:
+                self.index.addtransition(fromstate, tostate, inputs)
             if tostate in self.states[fromstate]:
-                self.states[fromstate][tostate] += inputs
+                self.states[fromstate][tostate].update(inputs)
             else:
-                self.states[fromstate][tostate] = inputs
+                self.states[fromstate][tostate] = set(inputs)
+            self.predecessors.setdefault(tostate, set()).add(fromstate)
+        self.invalidate(fromstate, tostate)
 
     def deletetransition(self, fromstate, tostate, inputs):
+        self.thaw()
+        if inputs == EPSILON or isinstance(inputs, str) and isclass(inputs):
+            inputs = [inputs]
         try:
             inputs = list(inputs)
         except TypeError:
             inputs = [inputs]
 
         if fromstate in self.states and tostate in self.states[fromstate]:
-            for input in inputs:
-                self.states[fromstate][tostate].remove(input)
+            if self.index is not None:
+                self.index.deletetransition(fromstate, tostate, inputs)
+            self.states[fromstate][tostate].difference_update(inputs)
             if len(self.states[fromstate][tostate]) == 0:
                 del self.states[fromstate][tostate]
+                self.predecessors[tostate].discard(fromstate)
+        self.invalidate(fromstate, tostate)
 
-    def layout(self, alignment=1.0, separation=1.2, steps=500, maxspeed=0.2, speed=math.e) -> dict:
+    def layout(self, alignment=1.0, separation=1.2, steps=500, maxspeed=0.2, speed=math.e, seed=None,
+               engine=None, tolerance=1e-4, restarts=1, processes=None, positions=None, fixed=(),
+               progress=None) -> dict:
         """
         Lays out the states to try and minimize overlap between states and transitions.
         This is accomplished by treating each connection between states as a spring of a certain length,
         which pushes and pulls states.
         :param alignment: Length of springs between states with transitions between them.
         :param separation: Length of springs between states without any transition between them.
-        :param steps: Number of steps for which to run the simulation
+        :param steps: Maximum number of steps for which to run the simulation
         :param maxspeed: Maximum "speed" for states to be moved around during simulation.
         :param speed: A constant that just needs to be arbitrarily tweaked.
+        :param seed: Seed for the random starting positions. If None, the global random number generator is used.
+        :param engine: "numpy" to run the simulation with NumPy, or "python" to run it in pure Python.
+                    "grid" runs it in pure Python too, but only compares states which are close together,
+                    which is much faster for big automata. (See layoutengine.gridlayout)
+                    If None, then NumPy is used if it is installed.
+        :param tolerance: The simulation stops before running all the steps once it has settled down, which is
+                    when its energy changes by less than this fraction from one step to the next.
+                    (See layoutengine.springlayout) Set it to 0 to always run every step.
+        :param restarts: Number of simulations to run, each from different random starting positions.
+                    The one with the fewest overlaps (see layoutengine.overlaps) is returned.
+                    If this is more than 1, the simulations are run in parallel in separate processes.
+        :param processes: Maximum number of processes to use for the restarts. If None, one for every CPU.
+        :param positions: Starting coordinates to use for the simulation, in the same format as the return value,
+                    instead of random ones. States which are not in here still start at a random point.
+        :param fixed: States which are not moved by the simulation.
+        :param progress: A function which is called after every step of the simulation with the number of the step,
+                    the layout so far and its energy, or None. (See layoutengine.springlayout)
+                    Only used if restarts is 1.
         :return: A dictionary where each state in this automaton is a key, the value for which is a 2-tuple
                     representing the coordinates of the state after the layout is complete.
         """
-        # TODO: Run multiple simulations, and determine which one has the least overlap.
-
-        # Calculates the distance between two 2-tuples
-        def dist(p1, p2):
-            return ((p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2) ** 0.5
+        rng = random if seed is None else random.Random(seed)
+        if self.profiler is not None:
+            progress = self.profiler.watchlayout(progress)
+        if engine is None:
+            engine = "python" if layoutengine.numpy is None else "numpy"
+        if engine not in layoutengine.ENGINES:
+            raise ValueError("Unknown layout engine: {}".format(engine))
+        parameters = {"alignment": alignment, "separation": separation, "steps": steps, "maxspeed": maxspeed,
+                      "speed": speed, "tolerance": tolerance, "fixed": fixed}
+        if positions is None:
+            positions = {}
 
         # Initialize the location of every state to a random point in the range (-1, 1)
-        result = {state: ((random.random() - 0.5) * 2, (random.random() - 0.5) * 2) for state in self.states}
-        for i in range(steps):
-            # Stores up the cumulative displacement on each state. Starts out at zero.
-            displacements = {state: [0, 0] for state in result}
-            # The following loop iterates over every pair of states that are are not the same
-            for state, otherstate in filter(lambda x: x[0] != x[1], itertools.product(result.keys(), result.keys())):
-                distance = dist(result[state], result[otherstate])
-                if otherstate in self.states[state]:  # If these states are connected:
-                    force = distance - alignment
-                else:  # If they are not connected:
-                    # The "min(..., 0)" ensure that if the states are already far enough apart, then
-                    # no more force is exerted.
-                    force = min(distance - separation, 0)
-                alpha = -speed ** (-abs(force) + math.log(maxspeed, speed)) + maxspeed
-                if force < 0:
-                    alpha = -alpha
-                # Do not yet move the state, just add the displacement to what's already there. This way,
-                # for states that have multiple connections, they move based on the total net displacement
-                # after all forces are calculated.
-                displacements[otherstate][0] += (alpha / distance) * (result[state][0] - result[otherstate][0])
-                displacements[otherstate][1] += (alpha / distance) * (result[state][1] - result[otherstate][1])
-            # Here is where the forces are actually exerted.
-            nextresult = {state: (result[state][0] + displacements[state][0],
-                                  result[state][1] + displacements[state][1]) for state in result}
-            # (This has to be two steps because you can't modify a data structure while iterating over it)
-            result = nextresult
-        return result
+        spread = 1
+        if engine == "grid":
+            # Spread the states out in proportion to how many there are, otherwise they would all
+            # start out in the same few squares of the grid.
+            spread = max(1, separation * math.sqrt(len(self.states)) / 2)
+        starts = [{state: positions[state] if state in positions else
+                   ((rng.random() - 0.5) * 2 * spread, (rng.random() - 0.5) * 2 * spread)
+                   for state in self.states} for _ in range(max(restarts, 1))]
+
+        if len(starts) == 1:
+            return layoutengine.simulate(engine, starts[0], self.states, progress=progress, **parameters)
+        # Only which states are connected matters for the layout. Sending just that to the other processes is
+        # smaller, and works for the compact form too, whose arrays can be in a memory mapped file. (See openbinary)
+        connections = {state: set(self.states[state]) for state in self.states}
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            futures = [executor.submit(layoutengine.simulate, engine, start, connections, **parameters)
+                       for start in starts]
+            results = [future.result() for future in futures]
+        return min(results, key=lambda result: layoutengine.overlaps(result, self.states))
+
+    def updatelayout(self, steps=50, cache=None, **parameters) -> dict:
+        """
+        Brings the most recent layout of this automaton (self.positions) up to date with any changes made to it
+        since then, and returns it. Instead of laying out the whole automaton again from scratch, only the
+        states which were changed and the states next to them are moved, starting from where they were before.
+        New states start out next to the states they are connected to. So after a small edit,
+        only a small part of the layout changes, and it takes only a few steps of the simulation.
+        If there is no previous layout, then this is the same as self.layout(), except that the
+        layout is looked up in the cache first.
+        :param steps: Number of steps for which to run the simulation when updating an existing layout.
+        :param cache: A layoutengine.LayoutCache in which to look up (and store) a layout of the whole automaton,
+                    if there is no previous layout.
+        :param parameters: Any other parameters for self.layout
+        :return: The layout, in the same format as self.layout()
+        """
+        if self.positions is None:
+            positions = None
+            if cache is not None:
+                # Watching the progress does not change the layout
+                key = layoutengine.structurekey(self.states, self.startstate, self.finalstates,
+                                                {name: value for name, value in parameters.items()
+                                                 if name != "progress"})
+                positions = cache.get(key)
+                if positions is not None and set(positions) != set(self.states):
+                    positions = None
+            if positions is None:
+                positions = self.layout(**parameters)
+                if cache is not None:
+                    cache.put(key, positions)
+            self.positions = positions
+            self.changedstates.clear()
+            return self.positions
+
+        positions = {state: self.positions[state] for state in self.states if state in self.positions}
+        changed = {state for state in self.changedstates if state in self.states}
+        changed.update(state for state in self.states if state not in positions)
+        if changed:
+            # Every state which is connected to a changed state gets to move too
+            movable = set(changed)
+            for state in changed:
+                movable.update(self.states[state])
+                movable.update(self.predecessors.get(state, ()))
+            alignment = parameters.get("alignment", 1.0)
+            for state in changed:
+                if state not in positions:
+                    # Put new states near the states they are connected to, or near the middle if there are none.
+                    near = [positions[otherstate] for otherstate in self.states[state] if otherstate in positions]
+                    near += [positions[otherstate] for otherstate in self.predecessors.get(state, ())
+                             if otherstate in positions]
+                    if not near:
+                        near = list(positions.values()) or [(0, 0)]
+                    x = sum(p[0] for p in near) / len(near)
+                    y = sum(p[1] for p in near) / len(near)
+                    positions[state] = (x + (random.random() - 0.5) * alignment,
+                                        y + (random.random() - 0.5) * alignment)
+            parameters["steps"] = steps
+            positions = self.layout(positions=positions, fixed=[state for state in self.states
+                                                                 if state not in movable], **parameters)
+        self.positions = positions
+        self.changedstates.clear()
+        return positions
+
+
+def subsetname(compiled, mask):
+    """
+    Names a set of states, like "{A,B}". A set of only one state just keeps the name of that state.
+    Any \\ , { or } in the names of the states is escaped with a \\, so that different sets never get the same
+    name, and if the name is already the name of one of the states (like a state called "{A,B}"), then ' is
+    added to the end of it until it is not.
+    :param compiled: The CompiledAutomaton which the states belong to
+    :param mask: Bitmask of the set of states
+    :return: The name
+    """
+    names = sorted(compiled.names(mask), key=str)
+    if len(names) == 1:
+        return names[0]
+    name = "{" + ",".join(SUBSETESCAPE.sub(r"\\\g<0>", name) for name in names) + "}"
+    while name in compiled.stateids:
+        name += "'"
+    return name
+
+
+@functools.lru_cache(maxsize=1024)
+def regexautomaton(pattern, alphabet, determinize, minimize):
+    """
+    The cache behind Automaton.from_regex, which keeps the 1024 most recently used patterns.
+    Takes the same parameters as Automaton.from_regex, except that alphabet must be a tuple or None.
+    """
+    automaton = Automaton(data=regexcompiler.compileregex(pattern, alphabet))
+    if minimize:
+        automaton = automaton.minimize()
+    elif determinize:
+        automaton = automaton.determinize()
+    return automaton
+
+
+def readedgelist(filepath):
+    """
+    Reads an automaton from an edge list file. This is a plain text format which can be read one line at a time,
+    so it works well for very big automata, and is easy to generate. Each line is a list of fields separated by tabs,
+    where the first field says what the line is:
+        name<TAB>Name of the automaton
+        description<TAB>Description of the automaton
+        start<TAB>A
+        final<TAB>B<TAB>C                   (Any number of final states. There can be more than one of these lines)
+        state<TAB>D                         (Only needed for states which have no transitions out of them)
+        edge<TAB>A<TAB>B<TAB>0<TAB>1        (A transition from A to B on the inputs 0 and 1)
+    Empty lines and lines starting with # are ignored.
+    :param filepath: Path to the file
+    :return: The specification of the automaton, in the same format as the JSON file.
+    """
+    transitions = {}
+    data = {"name": "", "description": "", "transitions": transitions, "start": "", "finalstates": []}
+    with open(filepath) as file:
+        for number, line in enumerate(file, 1):
+            line = line.rstrip("\r\n")
+            if len(line) == 0 or line[0] == "#":
+                continue
+            fields = line.split("\t")
+            kind = fields[0]
+            if kind == "edge" and len(fields) >= 3:
+                state = transitions.get(fields[1])
+                if state is None:
+                    state = transitions[fields[1]] = {}
+                if fields[2] in state:
+                    state[fields[2]] += fields[3:]
+                else:
+                    state[fields[2]] = fields[3:]
+            elif kind == "state" and len(fields) == 2:
+                transitions.setdefault(fields[1], {})
+            elif kind == "final":
+                data["finalstates"] += fields[1:]
+            elif kind in ("name", "description", "start") and len(fields) == 2:
+                data[kind] = fields[1]
+            else:
+                raise ValueError("Line {} of {} is not valid: {}".format(number, filepath, line))
+    return data
 
 
 if __name__ == "__main__":
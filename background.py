@@ -0,0 +1,81 @@
+"""
+Runs slow work (like laying out a big automaton) in a worker thread, so that the thread running the GUI never waits
+for it.
+
+Tk can only be used from the thread that created it, so the worker never touches the GUI. Instead, it reports its
+progress to a BackgroundTask, which the GUI thread polls every so often (for example with frame.after) to pick up
+the latest progress and, in the end, the result.
+"""
+import threading
+
+
+class Cancelled(Exception):
+    """
+    Raised by BackgroundTask.report once the task has been cancelled, to stop the work right there.
+    """
+
+
+class BackgroundTask:
+    """
+    A function running in a worker thread. The function is called with this task as its first parameter, so that it
+    can call self.report with its progress so far. Every call to report is also where the function stops if the
+    task has been cancelled, so the function should call it regularly.
+    """
+
+    def __init__(self, function, *args, **kwargs):
+        """
+        Starts running function(task, *args, **kwargs) in a new thread.
+        :param function: The function to run
+        :param args: Any other parameters for the function
+        :param kwargs: Any other keyword parameters for the function
+        """
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        # The return value of the function, or the exception it raised, once it has finished
+        self.result = None
+        self.error = None
+        # Only the most recent progress is kept, since anything older is out of date by the time it is looked at
+        self.lock = threading.Lock()
+        self.progress = None
+        self.reported = False
+        # A daemon thread does not keep the program running after the window is closed
+        self.thread = threading.Thread(target=self.run, args=(function, args, kwargs), daemon=True)
+        self.thread.start()
+
+    def run(self, function, args, kwargs):
+        try:
+            self.result = function(self, *args, **kwargs)
+        except Cancelled:
+            pass
+        except Exception as error:
+            self.error = error
+        finally:
+            self.finished.set()
+
+    def report(self, progress):
+        """
+        Called by the function in the worker thread with its progress so far.
+        :param progress: Anything describing the progress, such as a partial result
+        :raises Cancelled: If the task has been cancelled, so that the function stops
+        """
+        if self.cancelled.is_set():
+            raise Cancelled()
+        with self.lock:
+            self.progress = progress
+            self.reported = True
+
+    def cancel(self):
+        """
+        Asks the function to stop, the next time it calls self.report. Its result is thrown away.
+        """
+        self.cancelled.set()
+
+    def poll(self):
+        """
+        Called by the thread which started the task, to check on it.
+        :return: A tuple of whether there is any progress which has not been picked up yet, and that progress.
+        """
+        with self.lock:
+            reported = self.reported
+            self.reported = False
+            return reported, self.progress
@@ -0,0 +1,458 @@
+"""
+Benchmarks for loading, stepping, laying out and drawing automata, from a few states up to hundreds of thousands.
+
+Run it from the command line, for example:
+    python benchmark.py --output before.json
+    (make some changes)
+    python benchmark.py --output after.json --compare before.json
+Every result is written to a JSON file, so that runs on different commits can be compared. (See compare)
+Drawing is timed without opening a window, by drawing on a canvas which only counts what would be drawn.
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import layoutengine
+from automata import Automaton
+from engine import EPSILON
+
+try:
+    import gui
+except ImportError:
+    # Without tkinter, everything but drawing can still be timed
+    gui = None
+
+
+def randomautomaton(states, symbols, degree=4, deterministic=True, seed=None):
+    """
+    Generates a random automaton, in the same format as the JSON file. Every state is reachable from the start
+    state, since state i always has a transition from a state before it.
+    :param states: Number of states
+    :param symbols: Number of inputs in the alphabet. The inputs are the characters with codes 0 to symbols - 1,
+                    shifted up past the control characters when there are few enough of them.
+    :param degree: Number of transitions out of each state (at most symbols, for a deterministic automaton)
+    :param deterministic: If True, then every state has at most one transition on each input.
+                    If False, then each transition is on a random input, so some states have several on one input.
+    :param seed: Seed for the random number generator, so that the same automaton can be generated again
+    :return: The specification of the automaton
+    """
+    rng = random.Random(seed)
+    offset = 48 if symbols <= 64 else 0
+    alphabet = [chr(offset + i) for i in range(symbols)]
+    degree = min(degree, symbols) if deterministic else degree
+    transitions = {str(i): {} for i in range(states)}
+    for i in range(states):
+        state = transitions[str(i)]
+        inputs = rng.sample(alphabet, degree) if deterministic else [rng.choice(alphabet) for _ in range(degree)]
+        for number, symbol in enumerate(inputs):
+            # The first transition of state i goes to state i + 1, which keeps everything reachable
+            otherstate = str(i + 1) if number == 0 and i + 1 < states else str(rng.randrange(states))
+            state.setdefault(otherstate, []).append(symbol)
+    finalstates = [str(i) for i in rng.sample(range(states), max(1, states // 10))]
+    return {
+        "name": "Random {} with {} states".format("DFA" if deterministic else "NFA", states),
+        "description": "",
+        "transitions": transitions,
+        "start": "0",
+        "finalstates": finalstates
+    }
+
+
+def randomwalk(automaton, length, wordlength=1000, seed=None):
+    """
+    Generates inputs for an automaton by following random transitions from the start state, so that the inputs
+    do not just run into a missing transition after a few steps. Whenever the walk reaches a state with no
+    transitions out of it, or the input is wordlength long, that input ends, and the next one starts over from
+    the start state.
+    :param automaton: The Automaton
+    :param length: Total length of all the inputs together
+    :param wordlength: Maximum length of each input
+    :param seed: Seed for the random number generator
+    :return: A list of inputs, each of which is a list of input symbols
+    """
+    rng = random.Random(seed)
+    # A flat list of (input, next state) for every state, so that picking one is quick
+    choices = {state: [(symbol, otherstate) for otherstate, inputs in automaton.states[state].items()
+                       for symbol in inputs if symbol != EPSILON]
+               for state in automaton.states}
+    if not choices.get(automaton.startstate):
+        return []
+    words = []
+    total = 0
+    while total < length:
+        word = []
+        state = automaton.startstate
+        while total < length and len(word) < wordlength and choices.get(state):
+            symbol, state = rng.choice(choices[state])
+            word.append(symbol)
+            total += 1
+        words.append(word)
+    return words
+
+
+def timeit(function, repeat=3):
+    """
+    :param function: A function with no parameters
+    :param repeat: Number of times to call it
+    :return: The shortest time taken by one call, in seconds. (The shortest is the one which was slowed down
+                the least by everything else running on the computer)
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def throughput(function, words, budget):
+    """
+    Runs a function on one input after another, until they run out or the time is up.
+    :param function: A function which takes an input
+    :param words: A list of inputs
+    :param budget: Number of seconds after which no more inputs are started
+    :return: A tuple of the total length of the inputs which were run, and the time it took, in seconds
+    """
+    symbols = 0
+    started = time.perf_counter()
+    deadline = started + budget
+    for word in words:
+        function(word)
+        symbols += len(word)
+        if time.perf_counter() > deadline:
+            break
+    return symbols, time.perf_counter() - started
+
+
+class CountingCanvas:
+    """
+    Stands in for a tkinter Canvas, so that Gui.drawautomaton can be timed without a window. It only counts
+    the items which would be drawn, and hands out item ids just like a real canvas.
+    """
+
+    def __init__(self):
+        self.items = 0
+        self.configured = 0
+
+    def create(self, *args, **kwargs):
+        self.items += 1
+        return self.items
+
+    create_oval = create_rectangle = create_text = create_arc = create_polygon = create_line = create
+
+    def itemconfig(self, *args, **kwargs):
+        self.configured += 1
+
+    def coords(self, *args, **kwargs):
+        self.configured += 1
+
+    def delete(self, *args):
+        pass
+
+    def tag_raise(self, *args):
+        pass
+
+
+def headlessgui(canvaswidth=700, canvasheight=400):
+    """
+    :return: A gui.Gui which draws on a CountingCanvas, without any window or widgets
+    """
+    window = gui.Gui.__new__(gui.Gui)
+    window.canvaswidth = canvaswidth
+    window.canvasheight = canvasheight
+    window.layoutcache = None
+    window.heatfills = {}
+    window.canvas = CountingCanvas()
+    window.clearcanvas()
+    return window
+
+
+# Without NumPy, the default layout engine takes time in proportion to the square of the number of states, which
+# is already several seconds a layout at a hundred states, and hours for the whole run. Automata with more states
+# than this are laid out with the grid engine instead then. (See layoutengine.gridlayout)
+GRIDTHRESHOLD = 50
+
+
+def benchmarkautomaton(name, data, parameters, inputlength=100000, layoutlimit=1000, layoutsteps=20, repeat=3,
+                       budget=2.0):
+    """
+    Times everything for one automaton.
+    :param name: Name of the benchmark, used to tell results apart
+    :param data: The specification of the automaton, in the same format as the JSON file
+    :param parameters: A dictionary describing the automaton (like the number of states), added to every result
+    :param inputlength: Length of the input to step through
+    :param layoutlimit: Layout and drawing are skipped for automata with more states than this,
+                    since the layout takes time proportional to the square of the number of states.
+                    (Or close to the number of states, for the grid engine. See GRIDTHRESHOLD)
+    :param layoutsteps: Number of steps of the layout simulation to time
+    :param repeat: Number of times to run each measurement (the fastest one is kept)
+    :param budget: Stepping stops after about this many seconds, even if the input is not done yet,
+                    since big nondeterministic automata can take a very long time per input.
+    :return: A list of results, each of which is a dictionary
+    """
+    results = []
+
+    def record(benchmark, seconds, **extra):
+        result = {"automaton": name, "benchmark": benchmark, "seconds": seconds}
+        result.update(parameters)
+        result.update(extra)
+        results.append(result)
+
+    record("load", timeit(lambda: Automaton(data=data), repeat))
+    automaton = Automaton(data=data)
+
+    words = randomwalk(automaton, inputlength, seed=0)
+    if words:
+        def stepword(word):
+            automaton.start()
+            for symbol in word:
+                automaton.step(symbol)
+        for benchmark, function in (("step", stepword), ("accepts", automaton.accepts)):
+            symbols, seconds = throughput(function, words, budget)
+            record(benchmark, seconds, symbols=symbols, symbolspersecond=symbols / seconds if seconds else None)
+
+    if len(automaton.states) <= layoutlimit:
+        engine = "numpy" if layoutengine.numpy is not None else "python"
+        if engine == "python" and len(automaton.states) > GRIDTHRESHOLD:
+            engine = "grid"
+        seconds = timeit(lambda: automaton.layout(steps=layoutsteps, tolerance=0, seed=0, engine=engine), repeat)
+        record("layoutstep", seconds / layoutsteps, steps=layoutsteps, engine=engine)
+        seconds = timeit(lambda: automaton.layout(seed=0, engine=engine), 1)
+        record("layout", seconds, engine=engine)
+        if gui is not None:
+            layouts = [automaton.layout(steps=layoutsteps, seed=seed, engine=engine) for seed in (0, 1)]
+            windows = [headlessgui() for _ in range(repeat)]
+            seconds = timeit(lambda: windows.pop().drawautomaton(automaton, layout=layouts[0]), repeat)
+            window = headlessgui()
+            window.drawautomaton(automaton, layout=layouts[0])
+            record("draw", seconds, items=window.canvas.items)
+            # Redrawing with the other layout moves everything, which is the most a redraw ever has to do
+            moves = itertools.cycle(layouts[::-1])
+            seconds = timeit(lambda: window.drawautomaton(automaton, layout=next(moves)), repeat)
+            record("redraw", seconds)
+            if words:
+                # Highlighting the active states while stepping through an input, like the Play button does
+                word = words[0][:1000]
+
+                def playback():
+                    automaton.start()
+                    window.setactivestate(automaton.currentstate)
+                    for symbol in word:
+                        window.setactivestate(automaton.step(symbol))
+                seconds = timeit(playback, repeat)
+                record("playback", seconds, symbols=len(word),
+                       symbolspersecond=len(word) / seconds if seconds else None)
+    return results
+
+
+def checkautomaton(name, data):
+    """
+    Checks that the compact form of an automaton (see Automaton.freeze) accepts exactly the same inputs as the
+    normal form, and still does after it is thawed again or copied with todict, and that its transitions are still
+    the same ones. The same goes for the automaton after it is saved to a binary file and opened again.
+    (See Automaton.savebinary)
+    :param name: Name of the automaton, used in the descriptions of what went wrong
+    :param data: The specification of the automaton, in the same format as the JSON file
+    :return: A list of descriptions of everything which went wrong, which is empty if nothing did
+    """
+    problems = []
+    original = Automaton(data=data)
+
+    def compare(description, automaton):
+        verdict = original.is_equivalent(automaton)
+        if not verdict:
+            problems.append("{}: {} accepts different inputs, for example {!r}"
+                            .format(name, description, "".join(verdict.counterexample)))
+        transitions = {state: {otherstate: set(inputs) for otherstate, inputs in automaton.states[state].items()}
+                       for state in automaton.states}
+        if transitions != original.states:
+            problems.append("{}: {} has different transitions".format(name, description))
+
+    frozen = Automaton(data=data, compact=True)
+    compare("the compact form", frozen)
+    compare("a copy of the compact form", Automaton(data=frozen.todict()))
+    frozen.thaw()
+    compare("the compact form after thawing", frozen)
+
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, "check.automaton")
+        original.savebinary(filepath)
+        opened = Automaton(filepath)
+        compare("the binary file", opened)
+        compare("a copy of the binary file", Automaton(data=opened.todict()))
+        opened.thaw()
+        compare("the binary file after thawing", opened)
+        # The file stays memory mapped for as long as the automaton is around
+        del opened
+    return problems
+
+
+CHECKREGEXES = ["(a|b)*abb", "a*", "(ab|c)*d?", "((a|b)(c|d))*|e", "x(y|z)*x"]
+
+
+def checkall(sizes=(10, 100), alphabets=(2, 16), degree=4, samples=True):
+    """
+    Runs checkautomaton on the sample automata, on automata made from regular expressions (which have epsilon
+    transitions), and on random DFAs and NFAs.
+    :return: A list of descriptions of everything which went wrong
+    """
+    automata = []
+    if samples:
+        for filepath in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "Samples",
+                                                      "*.json"))):
+            with open(filepath) as file:
+                automata.append(("sample " + os.path.basename(filepath), json.load(file)))
+    for pattern in CHECKREGEXES:
+        automata.append(("regex " + pattern, Automaton.from_regex(pattern).todict()))
+    for states in sizes:
+        for symbols in alphabets:
+            for deterministic in (True, False):
+                automata.append(("{} {}x{}".format("dfa" if deterministic else "nfa", states, symbols),
+                                 randomautomaton(states, symbols, degree, deterministic, seed=states * 1000 + symbols)))
+    problems = []
+    for name, data in automata:
+        problems += checkautomaton(name, data)
+    return problems
+
+
+def runall(sizes, alphabets, degree=4, inputlength=100000, layoutlimit=1000, repeat=3, budget=2.0, samples=True,
+           log=None):
+    """
+    Runs every benchmark on random DFAs and NFAs of every size and alphabet, and on the sample automata.
+    :param sizes: Numbers of states of the random automata
+    :param alphabets: Numbers of inputs of the random automata
+    :param degree: Number of transitions out of each state of the random automata
+    :param inputlength: Length of the input to step through
+    :param layoutlimit: Layout and drawing are skipped for automata with more states than this
+    :param repeat: Number of times to run each measurement
+    :param budget: Maximum number of seconds to spend stepping through the input of each automaton
+    :param samples: If True, also run the benchmarks on Samples/*.json
+    :param log: A function which is called with a line of text describing every result as it comes in, or None
+    :return: A list of results, each of which is a dictionary
+    """
+    results = []
+    automata = []
+    if samples:
+        for filepath in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "Samples",
+                                                      "*.json"))):
+            with open(filepath) as file:
+                data = json.load(file)
+            automata.append(("sample " + os.path.basename(filepath), data, {"kind": "sample"}))
+    for states in sizes:
+        for symbols in alphabets:
+            for deterministic in (True, False):
+                kind = "dfa" if deterministic else "nfa"
+                data = randomautomaton(states, symbols, degree, deterministic, seed=states * 1000 + symbols)
+                automata.append(("{} {}x{}".format(kind, states, symbols), data,
+                                 {"kind": kind, "states": states, "symbols": symbols, "degree": degree}))
+    for name, data, parameters in automata:
+        for result in benchmarkautomaton(name, data, parameters, inputlength, layoutlimit, repeat=repeat,
+                                         budget=budget):
+            results.append(result)
+            if log is not None:
+                log(describe(result))
+    return results
+
+
+def describe(result):
+    text = "{:<24} {:<12} {:>12.6f}s".format(result["automaton"], result["benchmark"], result["seconds"])
+    if result.get("symbolspersecond"):
+        text += " {:>14,.0f} symbols/s".format(result["symbolspersecond"])
+    if result.get("items"):
+        text += " {:>8} items".format(result["items"])
+    if result.get("engine"):
+        text += " ({} engine)".format(result["engine"])
+    return text
+
+
+def environment():
+    """
+    :return: A dictionary describing where the benchmarks were run
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+
+def compare(old, new, threshold=0.1):
+    """
+    Compares two runs of the benchmarks.
+    :param old: The earlier run, as loaded from its JSON file
+    :param new: The later run
+    :param threshold: Changes smaller than this fraction are not reported
+    :return: A list of lines of text, one for every result which got faster or slower by more than threshold
+    """
+    before = {(result["automaton"], result["benchmark"]): result["seconds"] for result in old["results"]}
+    lines = []
+    for result in new["results"]:
+        key = (result["automaton"], result["benchmark"])
+        if key not in before or before[key] <= 0:
+            continue
+        ratio = result["seconds"] / before[key]
+        if abs(ratio - 1) > threshold:
+            lines.append("{:<24} {:<12} {:>8.2f}x {}".format(key[0], key[1], ratio,
+                                                              "slower" if ratio > 1 else "faster"))
+    return lines
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for loading, stepping, laying out and drawing automata.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000],
+                        help="Numbers of states of the random automata")
+    parser.add_argument("--alphabets", type=int, nargs="+", default=[2, 16, 256],
+                        help="Numbers of inputs of the random automata")
+    parser.add_argument("--degree", type=int, default=4, help="Number of transitions out of each state")
+    parser.add_argument("--input-length", type=int, default=100000, help="Length of the input to step through")
+    parser.add_argument("--layout-limit", type=int, default=1000,
+                        help="Skip layout and drawing for automata with more states than this")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of times to run each measurement")
+    parser.add_argument("--budget", type=float, default=2.0,
+                        help="Maximum number of seconds to spend stepping through the input of each automaton")
+    parser.add_argument("--no-samples", action="store_true", help="Do not run the benchmarks on Samples/*.json")
+    parser.add_argument("--check", action="store_true",
+                        help="Check that every form of the automata accepts the same inputs, instead of timing")
+    parser.add_argument("--output", help="File to write the results to, as JSON")
+    parser.add_argument("--compare", help="Results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Only report changes bigger than this fraction when comparing")
+    options = parser.parse_args(arguments)
+
+    if options.check:
+        problems = checkall(samples=not options.no_samples)
+        print("\n".join(problems) if problems else "Everything accepts the same inputs")
+        return problems
+
+    run = {"environment": environment()}
+    run["results"] = runall(options.sizes, options.alphabets, options.degree, options.input_length,
+                            options.layout_limit, options.repeat, options.budget, not options.no_samples,
+                            log=lambda line: print(line, flush=True))
+    if options.output:
+        with open(options.output, "w") as file:
+            json.dump(run, file, indent=4)
+    if options.compare:
+        with open(options.compare) as file:
+            old = json.load(file)
+        lines = compare(old, run, options.threshold)
+        print("\n".join(lines) if lines else "No changes bigger than {:.0%}".format(options.threshold))
+    return run
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,361 @@
+"""
+A binary file format for compiled automata, which loads in a constant amount of time no matter how big the automaton is.
+
+Loading a JSON file means parsing all of it and cleaning up every transition (see Automaton.__init__), which is most
+of the time it takes to start up with a lot of big automata. A binary file instead holds the compact form of an
+automaton (see Automaton.freeze and engine.EdgeArrays) exactly as it is laid out in memory, so it is opened with mmap
+and its arrays are used right where they are in the file, without reading or copying them. Only the pages of the
+file that are actually used are ever read from the disk.
+
+Run this from the command line to compile JSON files, for example to bundle compiled samples with a frozen build:
+    python binaryformat.py Samples/*.json
+This writes Samples/default.automaton and so on, next to each of the JSON files.
+
+The file starts with the 8 bytes MAGIC, the version of the format and the length of a JSON header, as unsigned
+32 bit integers. The header holds the name, description and start state, the input symbols and character classes,
+and the offset and length in the file of every section:
+    edgekeys, edgetargets   Same as engine.EdgeArrays.edgekeys and edgetargets
+    rawkeys, rawtargets     Same as engine.EdgeArrays.rawkeys and rawtargets. These sections are left out if the
+                            automaton has no epsilon transitions, since they are then the same as the ones above.
+    nameoffsets, names      The names of all the states, in order of their ids, encoded as UTF-8 one after another.
+                            The name of the state with id i is names[nameoffsets[i]:nameoffsets[i + 1]].
+    nameorder               The ids of all the states, sorted by name, to find the id of a name with a binary search
+    epsilonsources,         The epsilon transitions (see engine.EdgeArrays.epsilon), as the ids of the states they go
+    epsilontargets          from and to, sorted by where they go from. These are already folded into edgekeys and
+                            edgetargets, so they are not needed to run inputs, but without them the automaton
+                            could not be turned back into the normal form.
+    startmask, finalmask    Bitmasks of the start states (with their epsilon-closure) and final states, as
+                            little endian integers
+    layout                  The x and y coordinates of every state (see Automaton.positions), or NaN for states
+                            which have not been laid out. This section is left out if there is no layout.
+Every section starts at a multiple of 8 bytes. The arrays are stored in the byte order of the computer which wrote
+the file, so a file cannot be opened on a computer with a different byte order.
+"""
+import argparse
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping, Sequence, Set
+
+from bisect import bisect_left, bisect_right
+
+from engine import EdgeArrays, CompactStates, bits
+from symbolclasses import CharClasses
+
+# The first bytes of every file, followed by the version of the format and the length of the JSON header
+MAGIC = b"AUTOMATA"
+HEADER = struct.Struct("<8sII")
+VERSION = 3
+
+EXTENSION = ".automaton"
+
+
+def writebinary(automaton, filepath, layout=True):
+    """
+    Writes an automaton to a binary file. (See Automaton.savebinary)
+    :param automaton: The Automaton to write
+    :param filepath: Path of the file
+    :param layout: If True, then the most recent layout of the automaton (if there is one) is written too
+    """
+    if isinstance(automaton.states, CompactStates):
+        edges = automaton.compile()
+    else:
+        edges = EdgeArrays(automaton.states, automaton.startstate, automaton.finalstates)
+    statenames = edges.statenames
+    encoded = [name.encode("utf-8") for name in statenames]
+    nameoffsets = array("q", [0])
+    for name in encoded:
+        nameoffsets.append(nameoffsets[-1] + len(name))
+    # UTF-8 sorts in the same order as the strings it encodes
+    nameorder = array("i", sorted(range(len(encoded)), key=encoded.__getitem__))
+    # This is not edges.startmask, since that leaves out the dead states of a pruned automaton
+    startmask = edges.closure(edges.mask([automaton.startstate]))
+    finalmask = edges.mask(automaton.finalstates)
+    epsilonsources = array("i")
+    epsilontargets = array("i")
+    for stateid in sorted(edges.epsilon):
+        for otherid in edges.epsilon[stateid]:
+            epsilonsources.append(stateid)
+            epsilontargets.append(otherid)
+
+    sections = {
+        "edgekeys": memoryview(edges.edgekeys).cast("B"),
+        "edgetargets": memoryview(edges.edgetargets).cast("B"),
+        "rawkeys": memoryview(edges.rawkeys).cast("B"),
+        "rawtargets": memoryview(edges.rawtargets).cast("B"),
+        "nameoffsets": nameoffsets.tobytes(),
+        "names": b"".join(encoded),
+        "nameorder": nameorder.tobytes(),
+        "epsilonsources": epsilonsources.tobytes(),
+        "epsilontargets": epsilontargets.tobytes(),
+        "startmask": startmask.to_bytes((startmask.bit_length() + 7) // 8, "little"),
+        "finalmask": finalmask.to_bytes((finalmask.bit_length() + 7) // 8, "little")
+    }
+    if edges.rawkeys is edges.edgekeys:
+        del sections["rawkeys"], sections["rawtargets"]
+    if layout and automaton.positions is not None:
+        coordinates = array("d")
+        for state in statenames[:edges.declared]:
+            coordinates.extend(automaton.positions.get(state, (math.nan, math.nan)))
+        sections["layout"] = coordinates.tobytes()
+
+    header = {
+        "name": automaton.name,
+        "description": automaton.description,
+        "start": automaton.startstate,
+        "byteorder": sys.byteorder,
+        "declared": edges.declared,
+        "symbols": list(edges.symbols),
+        "classes": None if edges.classes is None else [[symbolid, ranges]
+                                                       for symbolid, ranges in edges.classes.ranges.items()],
+        "sections": {}
+    }
+    # The offsets of the sections depend on the length of the header, which depends on the offsets, so the header
+    # is made again with the new offsets until it stops changing length. (That only ever takes a couple of tries)
+    encodedheader = b""
+    while True:
+        offset = aligned(HEADER.size + len(encodedheader))
+        for name, data in sections.items():
+            header["sections"][name] = [offset, len(data)]
+            offset = aligned(offset + len(data))
+        newheader = json.dumps(header).encode("utf-8")
+        done = len(newheader) == len(encodedheader)
+        encodedheader = newheader
+        if done:
+            break
+
+    with open(filepath, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(encodedheader)))
+        file.write(encodedheader)
+        for name, data in sections.items():
+            file.write(bytes(header["sections"][name][0] - file.tell()))
+            file.write(data)
+
+
+def aligned(offset):
+    return (offset + 7) // 8 * 8
+
+
+def readbinary(filepath):
+    """
+    Opens a binary file written by writebinary, without reading the arrays in it.
+    :param filepath: Path of the file
+    :return: A tuple of the JSON header, the EdgeArrays of the automaton (whose arrays are in the file), the set of
+            final states (a MaskSet) and the layout (a CompactLayout, or None if the file has no layout)
+    :raises ValueError: If the file is not a binary automaton, or cannot be read by this version of the program
+    """
+    with open(filepath, "rb") as file:
+        # The mapping stays open after the file is closed, for as long as anything is still using it
+        view = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+    if len(view) < HEADER.size:
+        raise ValueError("{} is not a compiled automaton".format(filepath))
+    magic, version, length = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError("{} is not a compiled automaton".format(filepath))
+    if version != VERSION:
+        raise ValueError("{} is in version {} of the format, but only version {} can be read"
+                         .format(filepath, version, VERSION))
+    header = json.loads(str(view[HEADER.size:HEADER.size + length], "utf-8"))
+    if header["byteorder"] != sys.byteorder:
+        raise ValueError("{} was written on a {} endian computer, and cannot be read on this one"
+                         .format(filepath, header["byteorder"]))
+
+    def section(name, form="B"):
+        offset, size = header["sections"][name]
+        return view[offset:offset + size].cast(form)
+
+    statenames = NameTable(section("nameoffsets", "q"), section("names"))
+    stateids = NameIndex(statenames, section("nameorder", "i"))
+    classes = None
+    if header["classes"] is not None:
+        classes = CharClasses((tuple(tuple(piece) for piece in ranges), symbolid)
+                              for symbolid, ranges in header["classes"])
+    startmask = int.from_bytes(section("startmask"), "little")
+    finalmask = int.from_bytes(section("finalmask"), "little")
+    rawkeys = rawtargets = None
+    if "rawkeys" in header["sections"]:
+        rawkeys = section("rawkeys", "q")
+        rawtargets = section("rawtargets", "i")
+    edges = EdgeArrays.frombuffers(section("edgekeys", "q"), section("edgetargets", "i"), header["symbols"],
+                                   startmask, finalmask, classes, statenames, stateids, header["declared"],
+                                   rawkeys, rawtargets)
+    edges.epsilon = EpsilonTable(section("epsilonsources", "i"), section("epsilontargets", "i"))
+    # The epsilon-closures are already folded into the arrays, except for the one of the start state, which is
+    # needed again to write the automaton back out (see writebinary)
+    startid = stateids.get(header["start"])
+    if startid is not None:
+        edges.closures = {startid: startmask}
+
+    positions = None
+    if "layout" in header["sections"]:
+        positions = CompactLayout(edges, section("layout", "d"))
+    return header, edges, MaskSet(edges, finalmask), positions
+
+
+class NameTable(Sequence):
+    """
+    The names of the states in a binary file, which are only decoded when they are looked at.
+    """
+
+    def __init__(self, offsets, names):
+        """
+        :param offsets: The nameoffsets section of the file
+        :param names: The names section of the file
+        """
+        self.offsets = offsets
+        self.names = names
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return str(self.encoded(index), "utf-8")
+
+    def encoded(self, index):
+        """
+        :param index: Id of a state
+        :return: The name of that state, encoded as UTF-8
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return bytes(self.names[self.offsets[index]:self.offsets[index + 1]])
+
+
+class NameIndex(Mapping):
+    """
+    Finds the id of a state from its name, with a binary search over the names in a binary file.
+    (The same as EdgeArrays.stateids)
+    """
+
+    def __init__(self, statenames, order):
+        """
+        :param statenames: The NameTable of the file
+        :param order: The nameorder section of the file
+        """
+        self.statenames = statenames
+        self.order = order
+
+    def __getitem__(self, state):
+        if not isinstance(state, str):
+            raise KeyError(state)
+        order = self.order
+        encoded = state.encode("utf-8")
+        lo, hi = 0, len(order)
+        while lo < hi:
+            middle = (lo + hi) // 2
+            if self.statenames.encoded(order[middle]) < encoded:
+                lo = middle + 1
+            else:
+                hi = middle
+        if lo == len(order) or self.statenames.encoded(order[lo]) != encoded:
+            raise KeyError(state)
+        return order[lo]
+
+    def __iter__(self):
+        return iter(self.statenames)
+
+    def __len__(self):
+        return len(self.order)
+
+
+class EpsilonTable(Mapping):
+    """
+    The epsilon transitions in a binary file, in the same format as EdgeArrays.epsilon. (A dictionary from the id
+    of a state to a tuple of the ids of the states it has epsilon transitions to)
+    """
+
+    def __init__(self, sources, targets):
+        """
+        :param sources: The epsilonsources section of the file
+        :param targets: The epsilontargets section of the file
+        """
+        self.sources = sources
+        self.targets = targets
+
+    def __getitem__(self, stateid):
+        lo = bisect_left(self.sources, stateid)
+        hi = bisect_right(self.sources, stateid, lo)
+        if lo == hi:
+            raise KeyError(stateid)
+        return tuple(self.targets[lo:hi])
+
+    def __iter__(self):
+        return iter(dict.fromkeys(self.sources))
+
+    def __len__(self):
+        return len(set(self.sources))
+
+
+class MaskSet(Set):
+    """
+    A read only set of states, which is stored as a bitmask of EdgeArrays. (Used for Automaton.finalstates)
+    """
+
+    def __init__(self, edges, mask):
+        self.edges = edges
+        self.mask = mask
+
+    def __contains__(self, state):
+        stateid = self.edges.stateids.get(state)
+        return stateid is not None and self.mask >> stateid & 1 == 1
+
+    def __iter__(self):
+        return (self.edges.statenames[stateid] for stateid in bits(self.mask))
+
+    def __len__(self):
+        return bin(self.mask).count("1")
+
+
+class CompactLayout(Mapping):
+    """
+    A read only view of the layout in a binary file, in the same format as Automaton.positions. (A dictionary from
+    the name of a state to its coordinates)
+    """
+
+    def __init__(self, edges, coordinates):
+        """
+        :param edges: The EdgeArrays of the file
+        :param coordinates: The layout section of the file
+        """
+        self.edges = edges
+        self.coordinates = coordinates
+
+    def __getitem__(self, state):
+        stateid = self.edges.stateids.get(state)
+        if stateid is None or stateid >= self.edges.declared or math.isnan(self.coordinates[2 * stateid]):
+            raise KeyError(state)
+        return self.coordinates[2 * stateid], self.coordinates[2 * stateid + 1]
+
+    def __iter__(self):
+        return (self.edges.statenames[stateid] for stateid in range(self.edges.declared)
+                if not math.isnan(self.coordinates[2 * stateid]))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def main():
+    # Imported here, since automata imports this module
+    from automata import Automaton
+
+    parser = argparse.ArgumentParser(description="Compiles automata into binary files, which load much faster.")
+    parser.add_argument("files", nargs="+", help="JSON or edge list files of automata")
+    parser.add_argument("--nolayout", action="store_true", help="Do not save the layouts in the files")
+    arguments = parser.parse_args()
+    for filepath in arguments.files:
+        automaton = Automaton(filepath)
+        outputpath = os.path.splitext(filepath)[0] + EXTENSION
+        automaton.savebinary(outputpath, layout=not arguments.nolayout)
+        print("{} -> {}".format(filepath, outputpath))
+
+
+if __name__ == "__main__":
+    main()
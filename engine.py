@@ -0,0 +1,1276 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from symbolclasses import CharClasses, isclass, parseclass, merge, partition, pieces, formatclass
+
+# The input symbol used for epsilon transitions, which can be taken without reading any input.
+EPSILON = ""
+
+
+class CompiledAutomaton:
+    """
+    A compiled, table-driven form of an Automaton.
+
+    Every state and every input symbol is interned to a small integer id. A set of states is
+    represented as a bitmask (an int), where bit i is set if the state with id i is in the set.
+    For each input symbol, the table stores a sparse mapping from state id to a tuple of the ids of the
+    states reachable on that symbol, so that a step is just a few table lookups instead of a scan
+    over every outgoing transition of every active state. (The table does not store bitmasks itself,
+    since for an automaton with n states, each of those would take up n / 8 bytes.)
+
+    Character classes (see symbolclasses) are not kept in the table as they are either. If there are any, then the
+    characters are split into the fewest classes which every transition takes either all of or none of, and each of
+    those classes gets a single symbol id, which single character inputs are mapped to. (See splitclasses)
+
+    Epsilon transitions are not kept in the table. Instead, the epsilon-closure of every state (all the states
+    it can reach through epsilon transitions alone) is computed once, and folded into the table: every entry
+    of the table already includes the closures of the states it goes to, and the start state is replaced by its
+    closure. So the sets of states being stepped are always closed, and stepping never has to look at epsilon
+    transitions at all.
+    """
+
+    def __init__(self, states, startstate, finalstates=()):
+        """
+        :param states: Transitions of the automaton, in the same format as Automaton.states
+        :param startstate: Name of the start state
+        :param finalstates: An iterable of the names of the final states
+        """
+        # statenames[i] is the name of the state with id i, and stateids is the reverse of that.
+        self.statenames = []
+        self.stateids = {}
+        # Same thing, but for the input symbols
+        self.symbols = []
+        self.symbolids = {}
+        # table[symbolid] is a dictionary which maps a state id to a tuple of the ids of the next states.
+        # States with no transition on that symbol are simply left out.
+        self.table = []
+        # epsilon[stateid] is a tuple of the ids of the states reached by a single epsilon transition,
+        # and closures[stateid] is the bitmask of the epsilon-closure of that state. States without any
+        # epsilon transitions are left out of both. (See self.finish)
+        self.epsilon = {}
+        self.closures = {}
+        # Transitions on character classes, as (state id, next state id, ranges), until they are split up by finish.
+        # Afterwards, classes is the CharClasses which finds the symbol id of each character, or None if there
+        # were no character classes.
+        self.classedges = []
+        self.classes = None
+
+        for state in states:
+            self.internstate(state)
+        for state in states:
+            for otherstate, inputs in states[state].items():
+                self.addtransition(state, otherstate, inputs)
+        self.finish(startstate, finalstates)
+
+    def finish(self, startstate, finalstates):
+        """
+        Sets the start and final states, once all of the transitions have been added. This also computes the
+        epsilon-closures, and folds them into the table.
+        :param startstate: Name of the start state
+        :param finalstates: An iterable of the names of the final states
+        """
+        if self.classedges:
+            self.splitclasses()
+        self.closures = epsilonclosures(self.epsilon)
+        if self.closures:
+            for row in self.table:
+                for stateid, targets in row.items():
+                    mask = 0
+                    for otherid in targets:
+                        mask |= 1 << otherid
+                    closed = self.closure(mask)
+                    if closed != mask:
+                        row[stateid] = tuple(bits(closed))
+        self.startmask = self.closure(self.mask([startstate]))
+        self.finalmask = self.mask(finalstates)
+
+    def closure(self, mask):
+        """
+        :param mask: A bitmask of states
+        :return: The bitmask of the epsilon-closure of those states
+        """
+        closures = self.closures
+        if not closures:
+            return mask
+        result = mask
+        while mask:
+            low = mask & -mask
+            result |= closures.get(low.bit_length() - 1, 0)
+            mask ^= low
+        return result
+
+    def addtransition(self, state, otherstate, inputs):
+        """
+        Adds a transition to the table.
+        :param state: Name of the state the transition comes from
+        :param otherstate: Name of the state the transition goes to
+        :param inputs: An iterable of the input symbols on this transition
+        """
+        stateid = self.internstate(state)
+        otherid = self.internstate(otherstate)
+        for symbol in inputs:
+            if symbol == EPSILON:
+                targets = self.epsilon.get(stateid, ())
+                if otherid not in targets:
+                    self.epsilon[stateid] = targets + (otherid,)
+                continue
+            if isclass(symbol):
+                self.classedges.append((stateid, otherid, parseclass(symbol)))
+                continue
+            row = self.table[self.internsymbol(symbol)]
+            targets = row.get(stateid, ())
+            if otherid not in targets:
+                row[stateid] = targets + (otherid,)
+
+    def splitclasses(self):
+        """
+        Replaces the character classes, and the inputs which are single characters, with the classes that the
+        characters are split into. (See splitclasses)
+        """
+        symbols, edges, self.classes = splitclasses(self.symbols, self.transitions(), self.classedges)
+        self.classedges = []
+        self.symbols = []
+        self.symbolids = {}
+        self.table = []
+        for symbol in symbols:
+            self.internsymbol(symbol)
+        for stateid, symbolid, otherid in edges:
+            row = self.table[symbolid]
+            targets = row.get(stateid, ())
+            if otherid not in targets:
+                row[stateid] = targets + (otherid,)
+
+    def symbolid(self, symbol):
+        """
+        :param symbol: An input symbol
+        :return: The id of the symbol, or None if it is not in the alphabet. A character is looked for in the
+                character classes too, and so is a character class which is all inside of one of them.
+        """
+        symbolid = self.symbolids.get(symbol)
+        if symbolid is None:
+            symbolid = self.classify(symbol)
+        return symbolid
+
+    def classify(self, symbol):
+        """
+        Finds the character class of an input which is not one of the symbols. The class of a character is
+        remembered in self.symbolids, so this is only done once for every character.
+        :param symbol: An input symbol
+        :return: The id of the class, or None if there are no character classes or the input is not in one
+        """
+        if self.classes is None:
+            return None
+        symbolid = self.classes.classify(symbol)
+        if symbolid is not None and len(symbol) == 1:
+            self.symbolids[symbol] = symbolid
+        return symbolid
+
+    def example(self, symbolid):
+        """
+        :param symbolid: Id of a symbol
+        :return: An input with that id. For a character class, this is one of the characters in it.
+        """
+        if self.classes is not None and symbolid in self.classes.ranges:
+            return self.classes.example(symbolid)
+        return self.symbols[symbolid]
+
+    def transitions(self):
+        """
+        :return: A generator of every transition in the table, as tuples of (state id, symbol id, next state id)
+        """
+        for symbolid, row in enumerate(self.table):
+            for stateid, targets in row.items():
+                for otherid in targets:
+                    yield stateid, symbolid, otherid
+
+    def livemask(self):
+        """
+        Finds the states which are "live", meaning that some input leads from them to a final state, by searching
+        backwards from the final states.
+        :return: The bitmask of the live states
+        """
+        predecessors = {}
+        for stateid, _, otherid in self.transitions():
+            predecessors.setdefault(otherid, []).append(stateid)
+        queue = list(bits(self.finalmask))
+        live = self.finalmask
+        for stateid in queue:
+            for otherid in predecessors.get(stateid, ()):
+                if not live >> otherid & 1:
+                    live |= 1 << otherid
+                    queue.append(otherid)
+        return live
+
+    def prune(self):
+        """
+        Takes the dead states (the ones which are not live, see self.livemask) out of the table, so that they are
+        dropped from the current states as soon as they are reached. This does not change which inputs are
+        accepted, but the sets of states get smaller, and runs stop as soon as no live states are left.
+        """
+        live = self.livemask()
+        for row in self.table:
+            for stateid in list(row):
+                targets = row[stateid]
+                if live >> stateid & 1:
+                    targets = tuple(otherid for otherid in targets if live >> otherid & 1)
+                else:
+                    # Dead states are never current, so their transitions are never used
+                    targets = ()
+                if not targets:
+                    del row[stateid]
+                elif len(targets) != len(row[stateid]):
+                    row[stateid] = targets
+        self.startmask &= live
+
+    def internstate(self, state):
+        """
+        Returns the id of a state, assigning it a new one if it has not been seen before.
+        :param state: Name of the state
+        :return: Integer id of the state
+        """
+        stateid = self.stateids.get(state)
+        if stateid is None:
+            stateid = len(self.statenames)
+            self.stateids[state] = stateid
+            self.statenames.append(state)
+        return stateid
+
+    def internsymbol(self, symbol):
+        """
+        Returns the id of an input symbol, assigning it a new one (with an empty table row)
+        if it has not been seen before.
+        :param symbol: The input symbol, as a string
+        :return: Integer id of the symbol
+        """
+        symbolid = self.symbolids.get(symbol)
+        if symbolid is None:
+            symbolid = len(self.symbols)
+            self.symbolids[symbol] = symbolid
+            self.symbols.append(symbol)
+            self.table.append({})
+        return symbolid
+
+    def mask(self, states):
+        """
+        Converts an iterable of state names into a bitmask. Unknown states are ignored.
+        :param states: An iterable of state names
+        :return: The bitmask representing those states
+        """
+        result = 0
+        for state in states:
+            stateid = self.stateids.get(state)
+            if stateid is not None:
+                result |= 1 << stateid
+        return result
+
+    def names(self, mask):
+        """
+        Converts a bitmask back into a set of state names.
+        :param mask: A bitmask of states
+        :return: A set of state names
+        """
+        return {self.statenames[i] for i in bits(mask)}
+
+    def nextmask(self, mask, symbolid):
+        """
+        Advances a set of states by one input symbol.
+        :param mask: Bitmask of the current states
+        :param symbolid: Id of the input symbol, or None if the symbol is not in the alphabet
+        :return: Bitmask of the next states
+        """
+        if symbolid is None:
+            return 0
+        row = self.table[symbolid]
+        result = 0
+        while mask:
+            low = mask & -mask
+            for otherid in row.get(low.bit_length() - 1, ()):
+                result |= 1 << otherid
+            mask ^= low
+        return result
+
+    def getnextstate(self, currentstate, nextinput):
+        """
+        Same as Automaton.getnextstate, but for an explicitly given set of current states.
+        :param currentstate: An iterable of state names
+        :param nextinput: The next input, as a string
+        :return: The set of names of the next states
+        """
+        return self.names(self.nextmask(self.mask(currentstate), self.symbolid(nextinput)))
+
+    def runmask(self, word, mask=None):
+        """
+        Runs the automaton over an entire input sequence at once.
+        :param word: An iterable of input symbols (For example, a string)
+        :param mask: Bitmask of the states to start from. If None, then the start state is used.
+        :return: Bitmask of the states the automaton is in after the whole input.
+                Stops early (and returns 0) as soon as there are no active states left.
+        """
+        symbolids = self.symbolids
+        table = self.table
+        if mask is None:
+            mask = self.startmask
+        if not mask:
+            return 0
+        # As long as there is only a single active state, which is always the case for deterministic automata,
+        # just keep track of its id instead of a bitmask. Otherwise, state is None.
+        state = mask.bit_length() - 1 if mask & (mask - 1) == 0 else None
+        for symbol in word:
+            symbolid = symbolids.get(symbol)
+            if symbolid is None:
+                symbolid = self.classify(symbol)
+                if symbolid is None:
+                    return 0
+            row = table[symbolid]
+            if state is not None:
+                targets = row.get(state)
+                if targets is None:
+                    return 0
+                if len(targets) == 1:
+                    state = targets[0]
+                    continue
+                mask = 0
+                for otherid in targets:
+                    mask |= 1 << otherid
+                state = None
+            else:
+                nextmask = 0
+                while mask:
+                    low = mask & -mask
+                    for otherid in row.get(low.bit_length() - 1, ()):
+                        nextmask |= 1 << otherid
+                    mask ^= low
+                if not nextmask:
+                    return 0
+                mask = nextmask
+        return mask if state is None else 1 << state
+
+    def accepts(self, word):
+        """
+        :param word: An iterable of input symbols
+        :return: True if the automaton ends up in a final state after the whole input, False otherwise
+        """
+        return self.runmask(word) & self.finalmask != 0
+
+    def acceptsmany(self, words):
+        """
+        Checks a whole batch of inputs.
+        :param words: An iterable of inputs, each of which is an iterable of input symbols
+        :return: A bytearray with one entry per input, which is 1 if that input is accepted and 0 otherwise
+        """
+        runmask = self.runmask
+        finalmask = self.finalmask
+        return bytearray(runmask(word) & finalmask != 0 for word in words)
+
+    def subsets(self):
+        """
+        The subset construction: finds every set of states which can be reached from the start state.
+        :return: A dictionary which maps the bitmask of every reachable set of states to its row of transitions,
+                which is a dictionary from symbol id to the bitmask of the next set of states.
+                The empty set is left out, and the dictionary is in breadth-first order starting with the start state.
+        """
+        result = {}
+        if not self.startmask:
+            return result
+        # outgoing[stateid] is a list of (symbol id, bitmask of the next states) for every symbol that the state has
+        # transitions on, so that each set of states only looks at the symbols its states actually use
+        outgoing = {}
+        for symbolid, row in enumerate(self.table):
+            for stateid, targets in row.items():
+                nextmask = 0
+                for otherid in targets:
+                    nextmask |= 1 << otherid
+                if nextmask:
+                    outgoing.setdefault(stateid, []).append((symbolid, nextmask))
+        queue = [self.startmask]
+        result[self.startmask] = None
+        for mask in queue:
+            row = {}
+            for stateid in bits(mask):
+                for symbolid, nextmask in outgoing.get(stateid, ()):
+                    row[symbolid] = row.get(symbolid, 0) | nextmask
+            # In order of symbol id, so that the sets of states are always found in the same order
+            row = {symbolid: row[symbolid] for symbolid in sorted(row)}
+            for nextmask in row.values():
+                if nextmask not in result:
+                    result[nextmask] = None
+                    queue.append(nextmask)
+            result[mask] = row
+        return result
+
+    def partition(self):
+        """
+        Hopcroft's partition refinement: groups together the states which are equivalent, meaning
+        that exactly the same inputs are accepted starting from either one.
+        This only works if the automaton is deterministic. (For example, one made by Automaton.determinize)
+        Missing transitions are treated as going to an extra "dead" state which never accepts anything.
+        :return: A list of groups of equivalent states, where each group is a sorted list of state ids.
+                States which are equivalent to the dead state (because they can never reach a final state)
+                are left out entirely.
+        """
+        # The states which are equivalent to the dead state are exactly the ones which are not live, so they are
+        # left out from the start, along with every transition to them. The dead state itself is never needed
+        # then: two live states which differ in whether they have a transition on some symbol at all are told
+        # apart because one of them goes into some block on that symbol and the other one does not.
+        live = self.livemask()
+        # incoming[stateid] is a list of (symbol id, source) for every transition from a live state to the live
+        # state stateid. This takes space in proportion to the number of transitions, however many states and
+        # symbols there are, and a splitter only ever has to look at the transitions which go into it.
+        incoming = {}
+        for symbolid, row in enumerate(self.table):
+            for stateid, targets in row.items():
+                if len(targets) > 1:
+                    raise ValueError("Cannot partition a nondeterministic automaton. Determinize it first.")
+                if targets and live >> stateid & 1 and live >> targets[0] & 1:
+                    incoming.setdefault(targets[0], []).append((symbolid, stateid))
+
+        final = set(bits(self.finalmask & live))
+        blocks = [block for block in (final, set(bits(live)) - final) if block]
+        blockof = {}
+        for index, block in enumerate(blocks):
+            for stateid in block:
+                blockof[stateid] = index
+        # Blocks which still need to be used to split other blocks. Without the dead state, going into the
+        # non-final states is not the same as not going into the final states, so both of them start out here.
+        waiting = set(range(len(blocks)))
+
+        while waiting:
+            # The states which go into the splitter, for every symbol that any of them do
+            sources = {}
+            for target in blocks[waiting.pop()]:
+                for symbolid, source in incoming.get(target, ()):
+                    sources.setdefault(symbolid, []).append(source)
+            for symbolsources in sources.values():
+                # Group the states which go into the splitter on this symbol by the block they are in
+                touched = {}
+                for source in symbolsources:
+                    touched.setdefault(blockof[source], set()).add(source)
+                for index, inside in touched.items():
+                    block = blocks[index]
+                    if len(inside) == len(block):
+                        continue
+                    outside = block - inside
+                    # The bigger half keeps the old index, so fewer states need to be relabeled
+                    if len(inside) > len(outside):
+                        inside, outside = outside, inside
+                    blocks[index] = outside
+                    blocks.append(inside)
+                    newindex = len(blocks) - 1
+                    for stateid in inside:
+                        blockof[stateid] = newindex
+                    # If the old block was still waiting, both halves must be used. Otherwise,
+                    # using just the smaller half is enough. (This is what makes it O(n log n))
+                    waiting.add(newindex)
+
+        return sorted(sorted(block) for block in blocks)
+
+
+class LazyDFA:
+    """
+    A deterministic version of a CompiledAutomaton, which is built only as far as the inputs actually go.
+
+    Each state of the DFA is a set of states of the original automaton (as a bitmask). The transitions
+    out of a set of states are only computed the first time that set is reached with a given input,
+    and are then remembered. At most cachesize sets are remembered at once; when there are more than that,
+    the one which was used the longest time ago is forgotten (and simply computed again if it is needed again).
+    This has the same interface as CompiledAutomaton for running inputs.
+    """
+
+    def __init__(self, compiled, cachesize=1024):
+        """
+        :param compiled: The CompiledAutomaton to determinize
+        :param cachesize: Maximum number of sets of states to keep in the cache
+        """
+        self.compiled = compiled
+        self.cachesize = cachesize
+        self.symbolids = compiled.symbolids
+        self.symbolid = compiled.symbolid
+        self.classify = compiled.classify
+        self.startmask = compiled.startmask
+        self.finalmask = compiled.finalmask
+        self.mask = compiled.mask
+        self.names = compiled.names
+        # Maps a bitmask to a dictionary from symbol id to next bitmask, in order from least to most recently used.
+        self.rows = OrderedDict()
+
+    def nextmask(self, mask, symbolid):
+        """
+        Same as CompiledAutomaton.nextmask, but looks in the cache first.
+        """
+        if symbolid is None:
+            return 0
+        rows = self.rows
+        row = rows.get(mask)
+        if row is None:
+            row = rows[mask] = {}
+            if len(rows) > self.cachesize:
+                rows.popitem(last=False)
+        else:
+            rows.move_to_end(mask)
+        nextmask = row.get(symbolid)
+        if nextmask is None:
+            nextmask = row[symbolid] = self.compiled.nextmask(mask, symbolid)
+        return nextmask
+
+    def getnextstate(self, currentstate, nextinput):
+        """
+        Same as CompiledAutomaton.getnextstate
+        """
+        return self.names(self.nextmask(self.mask(currentstate), self.symbolid(nextinput)))
+
+    def runmask(self, word, mask=None):
+        """
+        Same as CompiledAutomaton.runmask
+        """
+        symbolids = self.symbolids
+        nextmask = self.nextmask
+        if mask is None:
+            mask = self.startmask
+        for symbol in word:
+            symbolid = symbolids.get(symbol)
+            if symbolid is None:
+                symbolid = self.classify(symbol)
+            mask = nextmask(mask, symbolid)
+            if not mask:
+                return 0
+        return mask
+
+    def accepts(self, word):
+        """
+        Same as CompiledAutomaton.accepts
+        """
+        return self.runmask(word) & self.finalmask != 0
+
+    def acceptsmany(self, words):
+        """
+        Same as CompiledAutomaton.acceptsmany
+        """
+        runmask = self.runmask
+        finalmask = self.finalmask
+        return bytearray(runmask(word) & finalmask != 0 for word in words)
+
+
+# Whether a product automaton (see LazyProduct) accepts, given whether each of the two automata accepts
+OPERATIONS = {
+    "intersection": lambda left, right: left and right,
+    "union": lambda left, right: left or right,
+    "difference": lambda left, right: left and not right,
+    "complement": lambda left, right: not left
+}
+
+
+class LazyProduct:
+    """
+    The product of two automata, which runs both of them side by side on the same inputs, and accepts depending on
+    which of them accept. (See OPERATIONS) This is what the intersection, union, difference and complement of
+    automata are made of.
+
+    Each state of the product is a pair of bitmasks, one for each automaton. Both automata are determinized lazily
+    (see LazyDFA), so the product is deterministic, and a missing transition just means that one side is empty.
+    Nothing is built up front: transitions are computed as inputs reach them. A pair is "dead" if it can never be
+    accepted no matter what comes next, because a side that the operation needs is empty. (For example, either
+    side for an intersection) Dead pairs are never explored.
+    """
+
+    def __init__(self, left, right, operation, alphabet=(), cachesize=1024):
+        """
+        :param left: The first CompiledAutomaton
+        :param right: The second CompiledAutomaton
+        :param operation: One of the keys of OPERATIONS
+        :param alphabet: Inputs to add to the alphabet of the product, besides those used by either automaton.
+                    This only makes a difference for operations which accept when a side is empty, like complement.
+        :param cachesize: Maximum number of sets of states to keep in the cache of each side
+        """
+        if operation not in OPERATIONS:
+            raise ValueError("Unknown operation {}. It should be one of {}".format(operation, ", ".join(OPERATIONS)))
+        self.left = LazyDFA(left, cachesize)
+        self.right = LazyDFA(right, cachesize)
+        self.operation = operation
+        self.accepting = OPERATIONS[operation]
+        # Each input of the product, with its symbol id in each automaton. (See jointalphabet)
+        self.alphabet = jointalphabet((left, right), alphabet)
+        self.symbols = [symbol for symbol, _, _ in self.alphabet]
+        self.startpair = (left.startmask, right.startmask)
+        # dead[leftnotempty, rightnotempty] says whether pairs with those sides empty can never be accepted
+        accepting = self.accepting
+        self.dead = {}
+        for leftnotempty in (False, True):
+            for rightnotempty in (False, True):
+                self.dead[leftnotempty, rightnotempty] = not any(
+                    accepting(leftfinal, rightfinal)
+                    for leftfinal in (False, True)[:leftnotempty + 1]
+                    for rightfinal in (False, True)[:rightnotempty + 1])
+
+    def isfinal(self, pair):
+        """
+        :param pair: A state of the product
+        :return: True if the product accepts in that state
+        """
+        return bool(self.accepting(pair[0] & self.left.finalmask != 0, pair[1] & self.right.finalmask != 0))
+
+    def isdead(self, pair):
+        """
+        :param pair: A state of the product
+        :return: True if no input starting from that state can be accepted
+        """
+        return self.dead[pair[0] != 0, pair[1] != 0]
+
+    def nextpair(self, pair, symbol):
+        """
+        :param pair: A state of the product
+        :param symbol: The next input
+        :return: The next state of the product
+        """
+        return (self.left.nextmask(pair[0], self.left.symbolid(symbol)),
+                self.right.nextmask(pair[1], self.right.symbolid(symbol)))
+
+    def runpair(self, word, pair=None):
+        """
+        Runs the product over an entire input.
+        :param word: An iterable of input symbols
+        :param pair: The state to start from. If None, then the start state is used.
+        :return: The state the product is in after the whole input. Stops early as soon as it is dead.
+        """
+        if pair is None:
+            pair = self.startpair
+        leftmask, rightmask = pair
+        leftnext, rightnext = self.left.nextmask, self.right.nextmask
+        leftid, rightid = self.left.symbolid, self.right.symbolid
+        dead = self.dead
+        for symbol in word:
+            if dead[leftmask != 0, rightmask != 0]:
+                break
+            leftmask = leftnext(leftmask, leftid(symbol)) if leftmask else 0
+            rightmask = rightnext(rightmask, rightid(symbol)) if rightmask else 0
+        return leftmask, rightmask
+
+    def accepts(self, word):
+        """
+        Same as CompiledAutomaton.accepts
+        """
+        return self.isfinal(self.runpair(word))
+
+    def acceptsmany(self, words):
+        """
+        Same as CompiledAutomaton.acceptsmany
+        """
+        runpair = self.runpair
+        isfinal = self.isfinal
+        return bytearray(isfinal(runpair(word)) for word in words)
+
+    def explore(self):
+        """
+        Builds the whole product, but only the pairs which can actually be reached from the start, using a
+        breadth-first search. This is usually far fewer than all of the possible pairs.
+        :return: A dictionary which maps every reachable pair which is not dead to its row of transitions, which is a
+                dictionary from input symbol to the next pair. Transitions to dead pairs are left out.
+                The dictionary is in breadth-first order, starting with the start pair.
+        """
+        result = {}
+        if self.isdead(self.startpair):
+            return result
+        queue = [self.startpair]
+        result[self.startpair] = None
+        for pair in queue:
+            row = {}
+            for symbol, _, (leftid, rightid) in self.alphabet:
+                nextpair = (self.left.nextmask(pair[0], leftid), self.right.nextmask(pair[1], rightid))
+                if self.isdead(nextpair):
+                    continue
+                row[symbol] = nextpair
+                if nextpair not in result:
+                    result[nextpair] = None
+                    queue.append(nextpair)
+            result[pair] = row
+        return result
+
+
+class EdgeArrays(CompiledAutomaton):
+    """
+    A compact form of CompiledAutomaton, which uses much less memory for automata with many transitions.
+
+    Instead of a dictionary for each input symbol, every transition (for a single input symbol) is stored as one
+    entry in two arrays of plain integers: edgekeys holds source state id * number of symbols + symbol id,
+    and edgetargets holds the id of the state it goes to. The arrays are sorted by edgekeys, so the transitions
+    out of a state on a symbol are found with a binary search. This takes about 12 bytes per transition.
+    It has the same interface as CompiledAutomaton for running inputs, but cannot be changed once it is built.
+    The epsilon-closures are folded into edgekeys and edgetargets, the same as into the table of CompiledAutomaton.
+    rawkeys and rawtargets are the same kind of arrays, but of the transitions just as they were given, which is
+    what CompactStates shows. If there are no epsilon transitions, these are the same arrays.
+    """
+
+    def __init__(self, states, startstate, finalstates=()):
+        """
+        :param states: Transitions of the automaton, in the same format as Automaton.states
+        :param startstate: Name of the start state
+        :param finalstates: An iterable of the names of the final states
+        """
+        self.statenames = []
+        self.stateids = {}
+        self.symbols = []
+        self.symbolids = {}
+        self.table = None
+        self.epsilon = {}
+        self.classes = None
+
+        for state in states:
+            self.internstate(state)
+        # Only these states were declared. Any others are only the destination of some transition.
+        self.declared = len(self.statenames)
+        edges = set()
+        classedges = []
+        for state in states:
+            stateid = self.stateids[state]
+            for otherstate, inputs in states[state].items():
+                otherid = self.internstate(otherstate)
+                for symbol in inputs:
+                    if symbol == EPSILON:
+                        self.epsilon[stateid] = self.epsilon.get(stateid, ()) + (otherid,)
+                    elif isclass(symbol):
+                        classedges.append((stateid, otherid, parseclass(symbol)))
+                    else:
+                        edges.add((stateid, self.internsymbol(symbol), otherid))
+        if classedges:
+            # Just like CompiledAutomaton, the characters are split into classes
+            self.symbols, edges, self.classes = splitclasses(self.symbols, edges, classedges)
+            self.symbolids = {symbol: symbolid for symbolid, symbol in enumerate(self.symbols)}
+            edges = set(edges)
+        n = len(self.symbols)
+        raw = sorted(edges)
+        self.rawkeys = array("q", (stateid * n + symbolid for stateid, symbolid, _ in raw))
+        self.rawtargets = array("i", (otherid for _, _, otherid in raw))
+        # Just like CompiledAutomaton, the epsilon-closures are folded into the transitions that are run
+        self.closures = epsilonclosures(self.epsilon)
+        if self.closures:
+            edges = sorted({(stateid, symbolid, closedid) for stateid, symbolid, otherid in raw
+                            for closedid in bits(self.closures.get(otherid, 1 << otherid))})
+            self.edgekeys = array("q", (stateid * n + symbolid for stateid, symbolid, _ in edges))
+            self.edgetargets = array("i", (otherid for _, _, otherid in edges))
+        else:
+            self.edgekeys = self.rawkeys
+            self.edgetargets = self.rawtargets
+
+        self.startmask = self.closure(self.mask([startstate]))
+        self.finalmask = self.mask(finalstates)
+        # Bitmask of the states which are not pruned (see self.prune). -1 has every bit set.
+        self.live = -1
+
+    @classmethod
+    def frombuffers(cls, edgekeys, edgetargets, symbols, startmask, finalmask, classes=None, statenames=None,
+                    stateids=None, declared=0, rawkeys=None, rawtargets=None):
+        """
+        Makes EdgeArrays directly from arrays that were already built, without copying them. The arrays can be
+        anything that can be indexed like an array, such as memoryviews of shared memory or of a memory mapped file.
+        Without statenames and stateids, this is only meant for running inputs: the states have no names, so
+        self.names does not work.
+        :param edgekeys: Same as self.edgekeys
+        :param edgetargets: Same as self.edgetargets
+        :param symbols: Same as self.symbols
+        :param startmask: Same as self.startmask
+        :param finalmask: Same as self.finalmask
+        :param classes: Same as self.classes
+        :param statenames: Same as self.statenames. (Anything that can be indexed like a list of names)
+        :param stateids: Same as self.stateids. (Anything that can be looked up in like a dictionary)
+        :param declared: Same as self.declared
+        :param rawkeys: Same as self.rawkeys, or None if it is the same as edgekeys
+        :param rawtargets: Same as self.rawtargets, or None if it is the same as edgetargets
+        :return: The new EdgeArrays
+        """
+        edges = cls.__new__(cls)
+        edges.statenames = statenames if statenames is not None else []
+        edges.stateids = stateids if stateids is not None else {}
+        edges.symbols = list(symbols)
+        edges.symbolids = {symbol: symbolid for symbolid, symbol in enumerate(edges.symbols)}
+        edges.table = None
+        edges.epsilon = {}
+        edges.closures = {}
+        edges.classes = classes
+        edges.declared = declared
+        edges.edgekeys = edgekeys
+        edges.edgetargets = edgetargets
+        edges.rawkeys = rawkeys if rawkeys is not None else edgekeys
+        edges.rawtargets = rawtargets if rawtargets is not None else edgetargets
+        edges.startmask = startmask
+        edges.finalmask = finalmask
+        edges.live = -1
+        return edges
+
+    def internsymbol(self, symbol):
+        symbolid = self.symbolids.get(symbol)
+        if symbolid is None:
+            symbolid = len(self.symbols)
+            self.symbolids[symbol] = symbolid
+            self.symbols.append(symbol)
+        return symbolid
+
+    def addtransition(self, state, otherstate, inputs):
+        raise TypeError("EdgeArrays cannot be changed. Thaw the automaton first.")
+
+    def transitions(self):
+        n = len(self.symbols)
+        for key, otherid in zip(self.edgekeys, self.edgetargets):
+            yield key // n, key % n, otherid
+
+    def prune(self):
+        # The arrays are also what self.states is looking at (see CompactStates), so they are left alone,
+        # and dead states are masked out after every step instead.
+        self.live = self.livemask()
+        self.startmask &= self.live
+
+    def outgoing(self, stateid, keys=None):
+        """
+        :param stateid: Id of a state
+        :param keys: The array to look in, or None for edgekeys
+        :return: The range of indices in that array (and the matching array of targets) of all the transitions out
+                of that state
+        """
+        if keys is None:
+            keys = self.edgekeys
+        n = len(self.symbols)
+        lo = bisect_left(keys, stateid * n)
+        return range(lo, bisect_left(keys, (stateid + 1) * n, lo))
+
+    def nextmask(self, mask, symbolid):
+        if symbolid is None:
+            return 0
+        keys = self.edgekeys
+        targets = self.edgetargets
+        n = len(self.symbols)
+        result = 0
+        while mask:
+            low = mask & -mask
+            key = (low.bit_length() - 1) * n + symbolid
+            lo = bisect_left(keys, key)
+            for i in range(lo, bisect_right(keys, key, lo)):
+                result |= 1 << targets[i]
+            mask ^= low
+        return result & self.live
+
+    def runmask(self, word, mask=None):
+        symbolids = self.symbolids
+        nextmask = self.nextmask
+        if mask is None:
+            mask = self.startmask
+        for symbol in word:
+            symbolid = symbolids.get(symbol)
+            if symbolid is None:
+                symbolid = self.classify(symbol)
+                if symbolid is None:
+                    return 0
+            mask = nextmask(mask, symbolid)
+            if not mask:
+                return 0
+        return mask
+
+
+class CompactStates(Mapping):
+    """
+    A read only view of EdgeArrays which looks just like Automaton.states (a dictionary of dictionaries of lists
+    of inputs), so that the rest of the program can use an automaton without caring how it is stored.
+    The inner dictionaries and lists are made on demand, from the arrays.
+    """
+
+    def __init__(self, edges):
+        """
+        :param edges: The EdgeArrays to look at
+        """
+        self.edges = edges
+
+    def __getitem__(self, state):
+        stateid = self.edges.stateids.get(state)
+        if stateid is None or stateid >= self.edges.declared:
+            raise KeyError(state)
+        return CompactRow(self.edges, stateid)
+
+    def __iter__(self):
+        return iter(self.edges.statenames[:self.edges.declared])
+
+    def __len__(self):
+        return self.edges.declared
+
+
+class CompactRow(Mapping):
+    """
+    A read only view of the transitions out of a single state of EdgeArrays, in the same format as
+    Automaton.states[state]. (A dictionary from the next state to a list of inputs)
+    This looks at EdgeArrays.rawkeys and rawtargets, which do not have the epsilon-closures folded into them, and
+    at the epsilon transitions in EdgeArrays.epsilon, so that it shows the transitions just as they were given.
+    """
+
+    def __init__(self, edges, stateid):
+        self.edges = edges
+        self.indices = edges.outgoing(stateid, edges.rawkeys)
+        self.epsilon = edges.epsilon.get(stateid, ())
+
+    def __getitem__(self, otherstate):
+        edges = self.edges
+        otherid = edges.stateids.get(otherstate)
+        n = len(edges.symbols)
+        inputs = [edges.symbols[edges.rawkeys[i] % n] for i in self.indices if edges.rawtargets[i] == otherid]
+        if otherid is not None and otherid in self.epsilon:
+            inputs.append(EPSILON)
+        if not inputs:
+            raise KeyError(otherstate)
+        return inputs
+
+    def targets(self):
+        """
+        :return: A dictionary whose keys are the ids of the states which this state has transitions to, in order
+        """
+        targets = dict.fromkeys(self.edges.rawtargets[i] for i in self.indices)
+        targets.update(dict.fromkeys(self.epsilon))
+        return targets
+
+    def __iter__(self):
+        return (self.edges.statenames[otherid] for otherid in self.targets())
+
+    def __len__(self):
+        return len(self.targets())
+
+    def __contains__(self, otherstate):
+        otherid = self.edges.stateids.get(otherstate)
+        return otherid is not None and (otherid in self.epsilon or
+                                        any(self.edges.rawtargets[i] == otherid for i in self.indices))
+
+
+class CompactPredecessors(Mapping):
+    """
+    The same as Automaton.predecessors, for an automaton in the compact form, worked out from CompactStates so that
+    the two always agree. It is only worked out the first time it is needed, since that means looking at every
+    transition.
+    """
+
+    def __init__(self, states):
+        """
+        :param states: The CompactStates of the automaton
+        """
+        self.states = states
+        self.table = None
+
+    def build(self):
+        if self.table is None:
+            self.table = predecessorsof(self.states)
+        return self.table
+
+    def __getitem__(self, state):
+        return self.build()[state]
+
+    def __iter__(self):
+        return iter(self.build())
+
+    def __len__(self):
+        return len(self.build())
+
+
+def predecessorsof(states):
+    """
+    :param states: Transitions of an automaton, in the same format as Automaton.states
+    :return: A dictionary which maps every state to the set of states which have a transition to it.
+            (The same as Automaton.predecessors)
+    """
+    predecessors = {state: set() for state in states}
+    for state in states:
+        for otherstate in states[state]:
+            predecessors.setdefault(otherstate, set()).add(state)
+    return predecessors
+
+
+def splitclasses(symbols, edges, classedges):
+    """
+    Splits the characters used by the transitions of an automaton into the fewest classes such that every pair of
+    states either has a transition on all of the characters in a class, or on none of them. (See
+    symbolclasses.partition) An edge labelled "any byte" and the 256 edges labelled with one byte each then end up
+    as a single transition on a single class. Inputs which are not single characters are left alone.
+    :param symbols: The input symbols of the automaton, by id
+    :param edges: An iterable of transitions on those symbols, as (state id, symbol id, next state id)
+    :param classedges: A list of transitions on character classes, as (state id, next state id, ranges)
+    :return: A tuple of the new list of symbols (the ones which are not single characters, followed by the classes,
+            as labels made by symbolclasses.formatclass), the transitions on the new symbol ids, in the same format
+            as edges, and the CharClasses which finds the class of a character.
+    """
+    newsymbols = []
+    # New id of each symbol which is not a single character
+    kept = {}
+    for symbolid, symbol in enumerate(symbols):
+        if len(symbol) != 1:
+            kept[symbolid] = len(newsymbols)
+            newsymbols.append(symbol)
+    newedges = []
+    # All the characters that each pair of states has a transition on
+    characters = {}
+    for stateid, symbolid, otherid in edges:
+        if symbolid in kept:
+            newedges.append((stateid, kept[symbolid], otherid))
+        else:
+            code = ord(symbols[symbolid])
+            characters.setdefault((stateid, otherid), []).append((code, code))
+    for stateid, otherid, ranges in classedges:
+        characters.setdefault((stateid, otherid), []).extend(ranges)
+    pairs = list(characters)
+    classes = []
+    for ranges, members in partition([merge(characters[pair]) for pair in pairs]):
+        symbolid = len(newsymbols)
+        newsymbols.append(formatclass(ranges))
+        classes.append((ranges, symbolid))
+        for member in members:
+            newedges.append((pairs[member][0], symbolid, pairs[member][1]))
+    return newsymbols, newedges, CharClasses(classes)
+
+
+def jointalphabet(automata, extra=()):
+    """
+    Lines up the inputs of several automata, for algorithms which run them side by side. Inputs are matched up by
+    name, except for characters when any of the automata has character classes: then the characters are split
+    into pieces which are in a single class (or are a single input) of every automaton.
+    :param automata: A list of CompiledAutomata
+    :param extra: Inputs to add, besides those used by the automata. These can be character classes too.
+    :return: A list of (symbol, example, ids) for every input, where symbol is its name (or a character class, for
+            a piece of the characters), example is one input that it stands for, and ids is a tuple of its symbol id
+            in each automaton (None where it is not in the alphabet).
+    """
+    extra = [str(symbol) for symbol in extra]
+    symbols = dict.fromkeys(symbol for symbol in (*(symbol for automaton in automata for symbol in automaton.symbols),
+                                                  *extra) if symbol != EPSILON)
+    if all(automaton.classes is None for automaton in automata) and not any(isclass(symbol) for symbol in extra):
+        return [(symbol, symbol, tuple(automaton.symbolids.get(symbol) for automaton in automata))
+                for symbol in symbols]
+
+    result = [(symbol, symbol, tuple(automaton.symbolids.get(symbol) for automaton in automata))
+              for symbol in symbols if len(symbol) != 1 and not isclass(symbol)]
+    # The classes of each automaton are among its symbols, as labels which are parsed back into the same ranges
+    rangesets = []
+    for symbol in symbols:
+        if len(symbol) == 1:
+            rangesets.append(((ord(symbol), ord(symbol)),))
+        elif isclass(symbol):
+            rangesets.append(parseclass(symbol))
+    pieceids = {}
+    for first, last, _ in pieces(rangesets):
+        ids = tuple(automaton.symbolid(chr(first)) for automaton in automata)
+        pieceids.setdefault(ids, []).append((first, last))
+    for ids, ranges in pieceids.items():
+        ranges = merge(ranges)
+        result.append((formatclass(ranges), chr(ranges[0][0]), ids))
+    return result
+
+
+def bits(mask):
+    """
+    Iterates over the indices of the set bits of a bitmask, lowest first.
+    :param mask: A nonnegative integer
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def stronglyconnected(graph):
+    """
+    Groups the nodes of a graph into strongly connected components, using Tarjan's algorithm.
+    Each component is found only after every component it can reach, so they come out in reverse topological order.
+    :param graph: A dictionary which maps a node to an iterable of the nodes it has edges to. Nodes which only
+                appear as the destination of an edge do not have to be keys.
+    :return: A generator of the components, each of which is a list of nodes
+    """
+    index = {}
+    lowlink = {}
+    stack = []
+    onstack = set()
+    for root in graph:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        onstack.add(root)
+        # This is the recursive version of the algorithm, but with an explicit stack of iterators instead
+        # of recursion, so that long chains of edges do not hit the recursion limit.
+        work = [(root, iter(graph.get(root, ())))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = len(index)
+                    stack.append(child)
+                    onstack.add(child)
+                    work.append((child, iter(graph.get(child, ()))))
+                    break
+                elif child in onstack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    # node is the root of a component, which is everything above it on the stack
+                    members = []
+                    while True:
+                        member = stack.pop()
+                        onstack.discard(member)
+                        members.append(member)
+                        if member == node:
+                            break
+                    yield members
+
+
+def epsilonclosures(epsilon):
+    """
+    Computes the epsilon-closure of every state which has epsilon transitions, in time proportional to the
+    number of epsilon transitions. The states are first grouped into strongly connected components,
+    since all the states in a cycle of epsilon transitions have the same closure. Each component comes after
+    every component it can reach (see stronglyconnected), so the closure of a component is just its own
+    states plus the closures of the components it has transitions to.
+    :param epsilon: A dictionary which maps a state id to a tuple of the ids of the states reached by a single
+                epsilon transition from it
+    :return: A dictionary which maps the id of every state which is part of an epsilon transition to the bitmask
+                of its epsilon-closure
+    """
+    closures = {}
+    for members in stronglyconnected(epsilon):
+        mask = 0
+        for member in members:
+            mask |= 1 << member
+        for member in members:
+            for child in epsilon.get(member, ()):
+                if child in closures:
+                    mask |= closures[child]
+        for member in members:
+            closures[member] = mask
+    return closures
+
+
+class Verdict:
+    """
+    The answer to a yes or no question about automata (like Automaton.is_equivalent), which is True or False
+    when used as a condition. When the answer is no, counterexample is a shortest input that shows why,
+    as a list of input symbols. When the answer is yes, counterexample is None.
+    """
+
+    __slots__ = ("answer", "counterexample")
+
+    def __init__(self, answer, counterexample=None):
+        self.answer = answer
+        self.counterexample = counterexample
+
+    def __bool__(self):
+        return self.answer
+
+    def __repr__(self):
+        return "Verdict({!r}, {!r})".format(self.answer, self.counterexample)
+
+
+def spellout(parents, index):
+    """
+    Follows the parent links of a breadth-first search back to the start, to find the input that led somewhere.
+    :param parents: parents[i] is a tuple of the index of the node that node i was reached from, and the input
+                    that it was reached with, or None for the nodes that the search started from.
+    :param index: Index of the node to start from
+    :return: The list of inputs
+    """
+    word = []
+    while parents[index] is not None:
+        index, symbol = parents[index]
+        word.append(symbol)
+    word.reverse()
+    return word
+
+
+def shortestaccepted(compiled):
+    """
+    Finds a shortest input accepted by an automaton, with a breadth-first search over its states.
+    :param compiled: A CompiledAutomaton
+    :return: The input, as a list of input symbols, or None if the automaton does not accept anything.
+    """
+    nodes = list(bits(compiled.startmask))
+    parents = [None] * len(nodes)
+    seen = compiled.startmask
+    for index, stateid in enumerate(nodes):
+        if compiled.finalmask >> stateid & 1:
+            return spellout(parents, index)
+        for symbolid in range(len(compiled.symbols)):
+            for otherid in bits(compiled.nextmask(1 << stateid, symbolid) & ~seen):
+                seen |= 1 << otherid
+                nodes.append(otherid)
+                parents.append((index, compiled.example(symbolid)))
+    return None
+
+
+def shortestdifference(left, right):
+    """
+    Finds a shortest input which is accepted by one automaton but not by another, using the antichain algorithm.
+
+    The search runs the first automaton one state at a time, and the second one determinized (as a set of states),
+    looking for a final state of the first while the second has no final states. A pair is skipped when an earlier
+    pair had the same state and a subset of its set, since anything accepted from the second pair but not by the
+    second automaton would be from the first too. So only the smallest sets (an antichain) have to be kept.
+    :param left: The CompiledAutomaton which should accept the input
+    :param right: The CompiledAutomaton which should not accept it
+    :return: The input, as a list of input symbols, or None if everything accepted by left is accepted by right.
+    """
+    alphabet = [(example, leftid, rightid) for _, example, (leftid, rightid) in jointalphabet((left, right))
+                if leftid is not None]
+    right = LazyDFA(right)
+    nodes = [(stateid, right.startmask) for stateid in bits(left.startmask)]
+    parents = [None] * len(nodes)
+    # antichain[stateid] is a list of the sets (bitmasks) already searched along with that state
+    antichain = {stateid: [right.startmask] for stateid, _ in nodes}
+    for index, (stateid, mask) in enumerate(nodes):
+        if left.finalmask >> stateid & 1 and not mask & right.finalmask:
+            return spellout(parents, index)
+        for symbol, symbolid, rightid in alphabet:
+            nextmask = right.nextmask(mask, rightid) if mask else 0
+            for otherid in bits(left.nextmask(1 << stateid, symbolid)):
+                searched = antichain.setdefault(otherid, [])
+                if any(not othermask & ~nextmask for othermask in searched):
+                    continue
+                # Sets which are bigger than the new one are not needed anymore
+                searched[:] = [othermask for othermask in searched if nextmask & ~othermask]
+                searched.append(nextmask)
+                nodes.append((otherid, nextmask))
+                parents.append((index, symbol))
+    return None
+
+
+def equivalent(left, right):
+    """
+    Checks whether two automata accept exactly the same inputs, using Hopcroft and Karp's algorithm.
+
+    Both automata are determinized lazily, and their start states are assumed to be equivalent. Whenever two
+    states are assumed to be equivalent, the states they go to on each input must be too. Those assumptions are
+    kept in a union-find structure, so a pair which already follows from earlier ones is never looked at again,
+    which makes this almost linear in the size of the deterministic automata. If the assumptions ever lead to
+    a final state being equivalent to a state which is not final, the automata are not equivalent.
+    :param left: A CompiledAutomaton
+    :param right: Another CompiledAutomaton
+    :return: True if they are equivalent, False otherwise
+    """
+    ids = [ids for _, _, ids in jointalphabet((left, right))]
+    left = LazyDFA(left)
+    right = LazyDFA(right)
+    # States of both automata are kept apart by tagging them with 0 (left) or 1 (right)
+    parent = {}
+
+    def find(node):
+        while parent.get(node, node) != node:
+            # Path halving: skip every other node on the way up, to keep the trees flat
+            parent[node] = parent.get(parent[node], parent[node])
+            node = parent[node]
+        return node
+
+    parent[0, left.startmask] = 1, right.startmask
+    queue = [(left.startmask, right.startmask)]
+    for leftmask, rightmask in queue:
+        if (leftmask & left.finalmask != 0) != (rightmask & right.finalmask != 0):
+            return False
+        for leftid, rightid in ids:
+            nextleft = left.nextmask(leftmask, leftid) if leftmask else 0
+            nextright = right.nextmask(rightmask, rightid) if rightmask else 0
+            leftroot = find((0, nextleft))
+            rightroot = find((1, nextright))
+            if leftroot != rightroot:
+                parent[leftroot] = rightroot
+                queue.append((nextleft, nextright))
+    return True
@@ -2,7 +2,14 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog
 from automata import Automaton
+from background import BackgroundTask
+from engine import EPSILON
+import layoutengine
+from layoutengine import LayoutCache
+import functools
 import math
+import os
+import random
 import re
 
 
@@ -12,11 +19,13 @@ class Gui:
     testing, and will be removed or changed eventually. (This includes the initializer)
     """
 
-    def __init__(self, canvaswidth=700, canvasheight=400, automaton=None):
+    def __init__(self, canvaswidth=700, canvasheight=400, automaton=None, layoutcache=None):
 
         self.canvaswidth = canvaswidth
         self.canvasheight = canvasheight
         self.automaton = automaton
+        # Layouts of automata that have been opened before, so that they do not need to be computed again
+        self.layoutcache = layoutcache if layoutcache is not None else LayoutCache()
 
         self.frame = tk.Frame(tk.Tk())
         self.frame.grid(row=0, column=0)
@@ -31,13 +40,22 @@ class Gui:
         # To change the configuration for a state (E.g., to turn red to be active), do this:
         # self.canvas.itemconfig(self.stateshapes[statename], fill='red')
         self.stateshapes = {}
+        # The colour of each state which is shaded by how often it has been active, when self.showheat is on.
+        # (See self.updateheat) States which are not in here are white.
+        self.heatfills = {}
 
         self.canvas = tk.Canvas(master=self.frame, bg="white", borderwidth=0,
                                 height=self.canvasheight, width=self.canvaswidth)
         self.canvas.grid(row=0, column=0)
+        self.clearcanvas()
+
+        # Layout and checking files of inputs run in the background, so that the window does not freeze.
+        # (See self.runinbackground) Each of these is the BackgroundTask currently running, or None.
+        self.layouttask = None
+        self.checktask = None
 
         if self.automaton is not None:
-            self.drawautomaton(self.automaton)
+            self.redrawcallback()
 
         self.tabs = ttk.Notebook(self.frame)
         self.tabs.grid(row=1, column=0)
@@ -73,7 +91,7 @@ class Gui:
                   command=self.removetransitioncallback).grid(row=2, column=3, rowspan=3, sticky=tk.EW)
         ttk.Separator(self.edittab, orient=tk.HORIZONTAL).grid(row=5, columnspan=5, sticky=tk.EW, pady=10)
         tk.Button(self.edittab, text="Redraw",
-                  command=self.redrawcallback).grid(row=6, column=0)
+                  command=self.relayoutcallback).grid(row=6, column=0)
 
         self.quit_button = tk.Button(self.edittab, text="Quit", command=self.quit)
         self.load_button = tk.Button(self.edittab, text="Load", command=self.load)
@@ -90,6 +108,8 @@ class Gui:
         self.testEntry = tk.Entry(self.playtab)
         self.testEntry.grid(row=0, column=1)
         self.testEntry.bind("<Key>", self.inputkeycallback)
+        tk.Button(self.playtab, text="Check File", command=self.checkfilecallback).grid(row=0, column=2,
+                                                                                    sticky=tk.W)
         tk.Button(self.playtab, text="Play", command=self.runcallback).grid(row=1, column=0, sticky=tk.E)
         tk.Button(self.playtab, text="Pause", command=self.pausecallback).grid(row=1, column=1, sticky=tk.W)
         tk.Button(self.playtab, text="One Step", command=self.stepcallback).grid(row=1, column=1, sticky=tk.E)
@@ -99,6 +119,9 @@ class Gui:
         self.s = tk.Scale(self.playtab, orient=tk.HORIZONTAL)
         tk.Label(self.playtab, text="Speed:").grid(row=2, column=0, sticky=tk.S)
         self.s.grid(row=2, column=1, sticky=tk.W)
+        self.showheat = tk.IntVar()
+        tk.Checkbutton(self.playtab, text="Show Heat", var=self.showheat,
+                       command=self.heatcallback).grid(row=2, column=2, sticky=tk.W)
 
         tk.Label(self.playtab, text="Current:").grid(row=3, column=0, sticky=tk.W)
         self.currentChar = tk.Label(self.playtab, text="0")
@@ -126,6 +149,7 @@ class Gui:
 
     def new(self):
         self.automaton = Automaton("")
+        self.heatcallback()
         self.redrawcallback()
 
     def quit(self):
@@ -133,13 +157,21 @@ class Gui:
         self.frame.quit()
 
     def save(self):
-        f = filedialog.asksaveasfile('w',filetypes=(("JSON file", "*.json"),("All files", "*.*")))
-        f.write(self.automaton.getJSON())
-        f.close()
+        fname = filedialog.asksaveasfilename(filetypes=(("JSON file", "*.json"), ("Compiled automaton", "*.automaton"),
+                                                        ("All files", "*.*")))
+        if not fname:
+            return
+        if fname.endswith(".automaton"):
+            self.automaton.savebinary(fname)
+        else:
+            with open(fname, "w") as f:
+                f.write(self.automaton.getJSON())
 
     def load(self):
-        fname = filedialog.askopenfilename(filetypes=(("JSON file", "*.json"),("All files", "*.*")))
+        fname = filedialog.askopenfilename(filetypes=(("JSON file", "*.json"),("Edge list", "*.edges"),
+                                                      ("Compiled automaton", "*.automaton"), ("All files", "*.*")))
         self.automaton = Automaton(str(fname))
+        self.heatcallback()
         self.redrawcallback()
 
     def addstatecallback(self):
@@ -162,20 +194,130 @@ class Gui:
     def addtransitioncallback(self):
         fromstate = self.fromEntry.get()
         tostate = self.toEntry.get()
-        inputs = re.split("\s*,\s*", self.inputsEntry.get())
+        inputs = splitinputs(self.inputsEntry.get())
         self.automaton.addtransition(fromstate, tostate, inputs)
         self.redrawcallback()
 
     def removetransitioncallback(self):
         fromstate = self.fromEntry.get()
         tostate = self.toEntry.get()
-        inputs = re.split("\s*,\s*", self.inputsEntry.get())
+        inputs = splitinputs(self.inputsEntry.get())
         self.automaton.deletetransition(fromstate, tostate, inputs)
         self.redrawcallback()
 
-    def redrawcallback(self):
-        self.canvas.delete(tk.ALL)
-        self.drawautomaton(self.automaton)
+    def redrawcallback(self, relayout=False):
+        """
+        Draws the automaton again after it was changed. If it has to be laid out again, that happens in the
+        background, and the diagram is redrawn every so often while the layout settles down.
+        Any layout that was still running for an earlier version of the automaton is cancelled.
+        :param relayout: If True, the whole automaton is laid out again from a new random start, instead of
+                    reusing its current layout or the one in the layout cache. The new layout replaces the cached one.
+        """
+        if self.layouttask is not None:
+            self.layouttask.cancel()
+            self.layouttask = None
+        automaton = self.automaton
+        if not relayout and automaton.positions is not None and not automaton.changedstates:
+            # Everything that is already on the canvas is kept, and only changed where the automaton changed
+            self.drawautomaton(automaton, layout=automaton.positions)
+            return
+        # The layout works on a copy, since the automaton can be edited while it runs
+        copy = Automaton(data=automaton.todict())
+        copy.changedstates = set(automaton.changedstates)
+        seed = random.randrange(1 << 32)
+
+        def layout(task):
+            report = lambda step, positions, energy: task.report(positions)
+            if not relayout:
+                return copy.updatelayout(cache=self.layoutcache, progress=report)
+            positions = copy.layout(seed=seed, progress=report)
+            # Stored under the same key that updatelayout looks up, so the next time this automaton is opened,
+            # it gets the new layout instead of the one that was thrown away
+            self.layoutcache.put(layoutengine.structurekey(copy.states, copy.startstate, copy.finalstates, {}),
+                                 positions)
+            return positions
+
+        def progress(positions):
+            self.drawautomaton(automaton, layout=positions)
+
+        def done(positions):
+            automaton.positions = positions
+            automaton.changedstates.clear()
+            self.drawautomaton(automaton, layout=positions)
+
+        self.layouttask = self.runinbackground(layout, progress, done)
+
+    def runinbackground(self, function, progress, done, interval=50):
+        """
+        Runs a function in a worker thread, and checks on it from the Tk main loop every so often.
+        :param function: The function to run. It is called with the BackgroundTask, to report its progress to.
+        :param progress: A function which is called in the main loop with the latest progress of the task
+        :param done: A function which is called in the main loop with the result of the task, once it is done
+        :param interval: Number of milliseconds between checks
+        :return: The BackgroundTask. If it is cancelled, then progress and done are not called anymore.
+        """
+        task = BackgroundTask(function)
+
+        def check():
+            if task.cancelled.is_set():
+                return
+            finished = task.finished.is_set()
+            reported, latest = task.poll()
+            if finished:
+                if task.error is not None:
+                    raise task.error
+                done(task.result)
+            else:
+                if reported:
+                    progress(latest)
+                self.frame.after(interval, check)
+
+        self.frame.after(interval, check)
+        return task
+
+    def checkfilecallback(self):
+        """
+        Checks every line of a text file as an input to the automaton, in the background, and shows how many of
+        them are accepted.
+        """
+        fname = filedialog.askopenfilename(filetypes=(("Text file", "*.txt"), ("All files", "*.*")))
+        if not fname:
+            return
+        if self.checktask is not None:
+            self.checktask.cancel()
+        # The compiled table is never changed, only replaced, so editing the automaton does not affect this check
+        compiled = self.automaton.compile()
+
+        def check(task, chunksize=1 << 20):
+            # The file is read a chunk of whole lines at a time in here too, since reading a big file all at once
+            # would take a while by itself
+            size = os.path.getsize(fname)
+            accepted = checked = 0
+            with open(fname, "rb") as file:
+                while True:
+                    lines = file.readlines(chunksize)
+                    if not lines:
+                        break
+                    words = b"".join(lines).decode().splitlines()
+                    accepted += sum(compiled.acceptsmany(words))
+                    checked += len(words)
+                    task.report((accepted, checked, file.tell() / size))
+            return accepted, checked
+
+        def progress(counts):
+            self.validity.config(text="{} of {} accepted so far ({:.0%} of the file)".format(*counts))
+
+        def done(counts):
+            self.validity.config(text="{} of {} accepted".format(*counts))
+
+        self.checktask = self.runinbackground(check, progress, done)
+
+    def relayoutcallback(self):
+        """
+        Throws away the current layout and lays out the whole automaton again from scratch.
+        """
+        self.automaton.positions = None
+        self.redrawcallback(relayout=True)
 
     def runcallback(self):
         """
@@ -206,6 +348,47 @@ class Gui:
         self.inputiter = None
         self.setactivestate([])
 
+    def heatcallback(self):
+        """
+        Starts or stops profiling the automaton (see Automaton.profile), depending on whether "Show Heat" is on,
+        and shades the states by how often they have been active since then.
+        """
+        if self.showheat.get() == 1:
+            if self.automaton is not None and self.automaton.profiler is None:
+                self.automaton.profile()
+        elif self.automaton is not None:
+            self.automaton.endprofile()
+        self.updateheat()
+
+    def updateheat(self, levels=8):
+        """
+        Shades every state from white (never active) to orange (active the most often), going by the profile of
+        the automaton. Only the states whose shade changed are changed on the canvas.
+        :param levels: Number of different shades. Fewer shades mean fewer states change at every step.
+        """
+        heat = {}
+        if self.automaton is not None and self.automaton.profiler is not None:
+            heat = self.automaton.profiler.heat()
+        fills = {}
+        for state, amount in heat.items():
+            level = round(amount * levels) / levels
+            if level > 0:
+                fills[state] = "#ff{:02x}{:02x}".format(round(255 - 90 * level), round(255 - 255 * level))
+        changed = {state for state in set(fills) | set(self.heatfills) if fills.get(state) != self.heatfills.get(state)}
+        self.heatfills = fills
+        for state in changed:
+            if state in self.stateshapes and state not in self.activestates:
+                self.canvas.itemconfig(self.stateshapes[state], fill=self.fillof(state))
+
+    def fillof(self, state):
+        """
+        :param state: Name of a state
+        :return: The colour which that state should be filled with on the canvas
+        """
+        if state in self.activestates:
+            return "red"
+        return self.heatfills.get(state, "white")
+
     def step(self, continuous=False):
         """
         Steps the automaton based on the input.
@@ -221,6 +404,8 @@ class Gui:
                 self.currentChar.config(text=nextInput)
                 self.automaton.step(nextInput)
                 self.setactivestate(self.automaton.currentstate)
+                if self.showheat.get() == 1:
+                    self.updateheat()
                 valid = False
                 for i in self.automaton.currentstate:
                     if i in self.automaton.finalstates:
@@ -240,60 +425,126 @@ class Gui:
     def setactivestate(self, states):
         """
         Visually changes the specified states to be activated.
+        Only the states which were not already active, or are no longer active, are changed on the canvas.
         :param states: An iterable of state names. (E.g., {'A', 'B'} )
         :return: None
         """
-        print("Setting active state: {}".format(states))
-        # First, deactivate all the states...
-        for shape in self.stateshapes.values():
-            self.canvas.itemconfig(shape, fill="white")
-        # Then activate the new ones
-        for state in states:
-            self.canvas.itemconfig(self.stateshapes[state], fill="red")
+        states = {state for state in states if state in self.stateshapes}
+        changed = self.activestates ^ states
+        self.activestates = states
+        for state in changed:
+            self.canvas.itemconfig(self.stateshapes[state], fill=self.fillof(state))
+
+    def clearcanvas(self):
+        """
+        Deletes everything from the canvas, and forgets which items were drawn for which states and transitions,
+        so that the next call to drawautomaton draws everything from scratch.
+        """
+        self.canvas.delete(tk.ALL)
+        self.stateshapes = {}
+        # For each state, a tuple of (canvas item ids, kind of state, where it was drawn). (See drawautomaton)
+        self.stateitems = {}
+        # For each transition (state A, state B), a tuple of (canvas item ids, where it was drawn, label)
+        self.edgeitems = {}
+        # States which are currently drawn as active (See setactivestate)
+        self.activestates = set()
 
     def drawautomaton(self, automaton: Automaton, border=50, arcangle=0.7, stateradius=30, layout=None):
         """
         Draws the provided automaton on the canvas.
+        Whatever was drawn by the previous call is kept: states and transitions which are still there are only
+        moved if they moved, and relabeled if their label changed. Only new ones are drawn, and only those which
+        are gone are deleted. (To draw everything from scratch, call self.clearcanvas first)
         :param automaton: Automaton to be drawn
         :param border: Amount of empty space to be left around the edges of the canvas
         :param arcangle: Angle of arcs between states, in radians. (Bigger angle = more curve)
         :param stateradius: Radius of circles representing states, in pixels.
-        :param layout: Layout to use. If None, then automaton.layout() is used.
+        :param layout: Layout to use. If None, then automaton.updatelayout() is used, which only moves
+            the states that changed since the last time the automaton was drawn.
         :return: None
         """
         border += stateradius
         if layout is None:
-            layout = automaton.layout()
+            layout = automaton.updatelayout(cache=self.layoutcache)
         minx = min(i[0] for i in layout.values())
         miny = min(i[1] for i in layout.values())
         maxx = max(i[0] for i in layout.values())
         maxy = max(i[1] for i in layout.values())
+        # An automaton with only one state (or all of them in a line) has no width or no height
+        width = (maxx - minx) or 1
+        height = (maxy - miny) or 1
 
         def scale(coords):
-            x = (coords[0] - minx) * (self.canvaswidth - (2 * border)) / (maxx - minx) + border
-            y = (coords[1] - miny) * (self.canvasheight - (2 * border)) / (maxy - miny) + border
+            x = (coords[0] - minx) * (self.canvaswidth - (2 * border)) / width + border
+            y = (coords[1] - miny) * (self.canvasheight - (2 * border)) / height + border
             return x, y
 
+        points = {state: scale(coords) for state, coords in layout.items()}
+        # Set to True when anything new is drawn, which then has to be put underneath the states
+        created = False
+
+        labels = {}
         for state_a in automaton.states:
-            for state_b in automaton.states[state_a]:
-                transition = automaton.states[state_a][state_b]
-                label = ", ".join(transition)
+            for state_b, transition in automaton.states[state_a].items():
+                # Epsilon transitions are stored as the empty string, which would not show up
+                labels[state_a, state_b] = ", ".join(sorted("\u03b5" if symbol == EPSILON else symbol
+                                                            for symbol in transition))
+        for edge in [edge for edge in self.edgeitems if edge not in labels]:
+            self.canvas.delete(*self.edgeitems.pop(edge)[0])
+        for (state_a, state_b), label in labels.items():
+            where = (points[state_a], points[state_b], arcangle, stateradius)
+            drawn = self.edgeitems.get((state_a, state_b))
+            if drawn is None:
                 if state_a == state_b:
-                    x, y = scale(layout[state_a])
-                    self.canvas.create_oval([x - 1.5 * stateradius, y - 0.5 * stateradius, x, y + 0.5 * stateradius],
-                                            width=3, outline="red")
-                    self.canvas.create_text([x - 2 * stateradius, y], text=label, fill="black")
-                    print("Arcing to self: {}".format(state_a))
+                    items = self.drawloop(points[state_a], label, stateradius=stateradius)
                 else:
-                    self.drawarc(scale(layout[state_a]), scale(layout[state_b]), label=label,
-                                 theta=arcangle)
-
-        for state in layout:
-            coords = scale(layout[state])
-            if state is automaton.startstate:
-                self.drawrect(coords, state)
+                    items = self.drawarc(points[state_a], points[state_b], label=label, theta=arcangle,
+                                         stateradius=stateradius)
+                created = True
+            else:
+                items = drawn[0]
+                if drawn[1] != where:
+                    if state_a == state_b:
+                        self.moveloop(items, points[state_a], stateradius=stateradius)
+                    else:
+                        self.movearc(items, points[state_a], points[state_b], theta=arcangle,
+                                     stateradius=stateradius)
+                if drawn[2] != label:
+                    self.canvas.itemconfig(items[-1], text=label)
+            self.edgeitems[state_a, state_b] = (items, where, label)
+
+        for state in [state for state in self.stateitems if state not in points]:
+            self.canvas.delete(*self.stateitems.pop(state)[0])
+            del self.stateshapes[state]
+        for state, coords in points.items():
+            if state == automaton.startstate:
+                kind = "start"
             else:
-                self.drawstate(coords, state, final=state in automaton.finalstates)
+                kind = "final" if state in automaton.finalstates else "state"
+            where = (coords, stateradius)
+            drawn = self.stateitems.get(state)
+            if drawn is not None and drawn[1] != kind:
+                # A state which became the start state or a final state looks completely different
+                self.canvas.delete(*drawn[0])
+                drawn = None
+            if drawn is None:
+                if kind == "start":
+                    items = self.drawrect(coords, state, radius=stateradius)
+                else:
+                    items = self.drawstate(coords, state, radius=stateradius, final=kind == "final")
+                if state in self.activestates or state in self.heatfills:
+                    self.canvas.itemconfig(self.stateshapes[state], fill=self.fillof(state))
+                created = True
+            else:
+                items = drawn[0]
+                if drawn[2] != where:
+                    self.movestate(items, coords, radius=stateradius)
+            self.stateitems[state] = (items, kind, where)
+        self.activestates &= set(self.stateshapes)
+
+        if created:
+            # Transitions which were just drawn would otherwise be on top of the states
+            self.canvas.tag_raise("state")
 
     def drawstate(self, coords, label, radius=30, final=False):
         """
@@ -302,16 +553,17 @@ class Gui:
         :param label: Label or name of the state.
         :param radius: Radius in pixels of the circle representing the state
         :param final: If True, this state will be rendered as a final state (with double outline)
-        :return: None
+        :return: A tuple of the ids of the items drawn on the canvas, the last of which is the label
         """
         self.stateshapes[label] = self.canvas.create_oval([coords[0] - radius, coords[1] - radius,
                                                            coords[0] + radius, coords[1] + radius],
-                                                          fill="white", outline="black", width=5)
+                                                          fill="white", outline="black", width=5, tags="state")
+        items = (self.stateshapes[label],)
         if final:
-            self.canvas.create_oval([coords[0] - radius + 10, coords[1] - radius + 10,
-                                     coords[0] + radius - 10, coords[1] + radius - 10],
-                                    fill="white", outline="black", width=5)
-        self.canvas.create_text(coords, text=label, fill="black")
+            items += (self.canvas.create_oval([coords[0] - radius + 10, coords[1] - radius + 10,
+                                               coords[0] + radius - 10, coords[1] + radius - 10],
+                                              fill="white", outline="black", width=5, tags="state"),)
+        return items + (self.canvas.create_text(coords, text=label, fill="black", tags="state"),)
 
     def drawrect(self, coords, label, radius=30):
         """
@@ -319,12 +571,47 @@ class Gui:
         :param coords: Coordinates on the canvas at which to draw the state.
         :param label: Label or name of the state.
         :param radius: Radius in pixels of the circle representing the state
-        :return: None
+        :return: A tuple of the ids of the items drawn on the canvas, the last of which is the label
         """
         self.stateshapes[label] = self.canvas.create_rectangle([coords[0] - radius, coords[1] - radius,
-                                                           coords[0] + radius, coords[1] + radius],
-                                                          fill="white", outline="black", width=5)
-        self.canvas.create_text(coords, text=label, fill="black")
+                                                                coords[0] + radius, coords[1] + radius],
+                                                               fill="white", outline="black", width=5, tags="state")
+        return self.stateshapes[label], self.canvas.create_text(coords, text=label, fill="black", tags="state")
+
+    def movestate(self, items, coords, radius=30):
+        """
+        Moves a state which was drawn by drawstate or drawrect.
+        :param items: The ids of the items of the state
+        :param coords: New coordinates of the state on the canvas
+        :param radius: Radius in pixels of the state
+        :return: None
+        """
+        self.canvas.coords(items[0], coords[0] - radius, coords[1] - radius, coords[0] + radius, coords[1] + radius)
+        if len(items) == 3:
+            self.canvas.coords(items[1], coords[0] - radius + 10, coords[1] - radius + 10,
+                               coords[0] + radius - 10, coords[1] + radius - 10)
+        self.canvas.coords(items[-1], *coords)
+
+    def drawloop(self, coords, label, stateradius=30):
+        """
+        Draws a transition from a state to itself, as a small circle on its left.
+        :param coords: Coordinates on the canvas of the state
+        :param label: Label of this transition
+        :param stateradius: Radius of the state, in pixels
+        :return: A tuple of the ids of the items drawn on the canvas, the last of which is the label
+        """
+        x, y = coords
+        return (self.canvas.create_oval([x - 1.5 * stateradius, y - 0.5 * stateradius, x, y + 0.5 * stateradius],
+                                        width=3, outline="red"),
+                self.canvas.create_text([x - 2 * stateradius, y], text=label, fill="black"))
+
+    def moveloop(self, items, coords, stateradius=30):
+        """
+        Moves a transition which was drawn by drawloop.
+        """
+        x, y = coords
+        self.canvas.coords(items[0], x - 1.5 * stateradius, y - 0.5 * stateradius, x, y + 0.5 * stateradius)
+        self.canvas.coords(items[1], x - 2 * stateradius, y)
 
     def drawarc(self, a, b, label, theta=0.5, labeloffset=-10, stateradius=30, arrowangle=0.4, arrowlength=25):
         """
@@ -337,65 +624,81 @@ class Gui:
         :param stateradius: Radius of the states, in pixels, in order to properly draw arrow
         :param arrowangle: Angle of the arrow in radians. (Bigger angle = fatter arrow)
         :param arrowlength: Length of arrow, in pixels
-        :return: None
+        :return: A tuple of the ids of the arc, the arrow, and the label on the canvas
         """
-        # TODO: Deal with arcs that start and end at same state
-        d = ((b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2) ** 0.5            # Distance between A and B
-        r = d / (2 * math.sin(theta / 2))
-        try:
-            tanphi = (a[1] - b[1]) / (a[0] - b[0])
-        except ZeroDivisionError:
-            tanphi = 1 / 0.000000001
-        theta_a = (math.pi / 2) - (theta / 2) - math.atan(tanphi)       # Angle between vector CA and x-axis
-        if b[0] > a[0]:
-            theta_a -= math.pi
-        cx = a[0] - (r * math.cos(theta_a))
-        cy = a[1] + (r * math.sin(theta_a))
+        box, start, extent, arrow, labelcoords = arcgeometry(tuple(a), tuple(b), theta, labeloffset, stateradius,
+                                                             arrowangle, arrowlength)
+        return (self.canvas.create_arc(box, start=start, extent=extent, outline="red", style=tk.ARC, width=3),
+                self.canvas.create_polygon(arrow, fill="red"),
+                self.canvas.create_text(labelcoords, text=label, fill="black"))
+
+    def movearc(self, items, a, b, theta=0.5, labeloffset=-10, stateradius=30, arrowangle=0.4, arrowlength=25):
+        """
+        Moves an arc which was drawn by drawarc. Takes the same parameters as drawarc, except for the label.
+        :param items: The ids of the items of the arc
+        """
+        box, start, extent, arrow, labelcoords = arcgeometry(tuple(a), tuple(b), theta, labeloffset, stateradius,
+                                                             arrowangle, arrowlength)
+        self.canvas.coords(items[0], *box)
+        self.canvas.itemconfig(items[0], start=start, extent=extent)
+        self.canvas.coords(items[1], *arrow)
+        self.canvas.coords(items[2], *labelcoords)
+
+
+def splitinputs(text):
+    """
+    Splits the inputs typed in for a transition, which are separated by commas.
+    Commas inside of a character class (like "[,;]") do not separate inputs.
+    :param text: The inputs, like "a, b, [0-9]"
+    :return: A list of the inputs
+    """
+    return re.split(r"\s*,\s*(?![^\[]*\])", text)
+
+
+@functools.lru_cache(maxsize=4096)
+def arcgeometry(a, b, theta, labeloffset, stateradius, arrowangle, arrowlength):
+    """
+    Works out where everything goes for an arc between two points. (See Gui.drawarc for the parameters)
+    The result for each pair of points is cached, since most arcs stay where they are from one redraw to the next.
+    :return: A tuple of the bounding box of the circle of the arc, the angles (in degrees) at which the arc starts
+            and how far it extends, the corners of the arrow, and the coordinates of the label.
+    """
+    # TODO: Deal with arcs that start and end at same state
+    d = ((b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2) ** 0.5            # Distance between A and B
+    r = d / (2 * math.sin(theta / 2))
+    try:
+        tanphi = (a[1] - b[1]) / (a[0] - b[0])
+    except ZeroDivisionError:
+        tanphi = 1 / 0.000000001
+    theta_a = (math.pi / 2) - (theta / 2) - math.atan(tanphi)       # Angle between vector CA and x-axis
+    if b[0] > a[0]:
+        theta_a -= math.pi
+    cx = a[0] - (r * math.cos(theta_a))
+    cy = a[1] + (r * math.sin(theta_a))
 
-        theta_a_degrees = theta_a * (180 / math.pi)
-        theta_degrees = theta * (180 / math.pi)
+    theta_a_degrees = theta_a * (180 / math.pi)
+    theta_degrees = theta * (180 / math.pi)
 
-        label_dx = (r + labeloffset) * math.cos(theta_a + theta * 0.55)  # Offset from center to place label
-        label_dy = (r + labeloffset) * math.sin(theta_a + theta * 0.55)
+    label_dx = (r + labeloffset) * math.cos(theta_a + theta * 0.55)  # Offset from center to place label
+    label_dy = (r + labeloffset) * math.sin(theta_a + theta * 0.55)
 
-        phi = 2 * math.asin(stateradius / (2 * r))
-        arrowpoint_x = cx + (r * math.cos(theta_a + theta - phi))
-        arrowpoint_y = cy - (r * math.sin(theta_a + theta - phi))
+    # States which are drawn on top of each other are closer together than the radius of a state
+    phi = 2 * math.asin(min(1.0, stateradius / (2 * r))) if r > 0 else math.pi
+    arrowpoint_x = cx + (r * math.cos(theta_a + theta - phi))
+    arrowpoint_y = cy - (r * math.sin(theta_a + theta - phi))
 
-        arrow_x1 = arrowpoint_x + (arrowlength * math.cos(theta_a + theta - (math.pi / 2) - arrowangle))
-        arrow_y1 = arrowpoint_y - (arrowlength * math.sin(theta_a + theta - (math.pi / 2) - arrowangle))
+    arrow_x1 = arrowpoint_x + (arrowlength * math.cos(theta_a + theta - (math.pi / 2) - arrowangle))
+    arrow_y1 = arrowpoint_y - (arrowlength * math.sin(theta_a + theta - (math.pi / 2) - arrowangle))
 
-        arrow_x2 = arrowpoint_x + (arrowlength * math.cos(theta_a + theta - (math.pi / 2) + arrowangle))
-        arrow_y2 = arrowpoint_y - (arrowlength * math.sin(theta_a + theta - (math.pi / 2) + arrowangle))
+    arrow_x2 = arrowpoint_x + (arrowlength * math.cos(theta_a + theta - (math.pi / 2) + arrowangle))
+    arrow_y2 = arrowpoint_y - (arrowlength * math.sin(theta_a + theta - (math.pi / 2) + arrowangle))
 
-        self.canvas.create_arc([cx - r, cy - r, cx + r, cy + r], start=theta_a_degrees, extent=theta_degrees,
-                               outline="red", style=tk.ARC, width=3)
-        self.canvas.create_polygon([arrowpoint_x, arrowpoint_y, arrow_x1, arrow_y1, arrow_x2, arrow_y2], fill="red")
-        self.canvas.create_text([cx + label_dx, cy - label_dy], text=label, fill="black")
+    return ((cx - r, cy - r, cx + r, cy + r), theta_a_degrees, theta_degrees,
+            (arrowpoint_x, arrowpoint_y, arrow_x1, arrow_y1, arrow_x2, arrow_y2), (cx + label_dx, cy - label_dy))
 
 
 if __name__ == "__main__":
 
     testautomaton = Automaton("Samples/sample2.json")
     testgui = Gui(automaton=testautomaton)
-    # This code will no longer run, but hopefully it is at least a good reference.
-    # testgui.drawautomaton(testautomaton, arcangle=0.5)
-    # layout = testautomaton.layout(alignment=1.0, separation=1.2, steps=500, maxspeed=0.01, speed=5.0, generate=True)
-    #
-    # def test():
-    #     global testgui
-    #     global testautomaton
-    #     global layout
-    #     try:
-    #         newlayout = layout.__next__()
-    #         testgui.canvas.delete(tk.ALL)
-    #         testgui.drawautomaton(testautomaton, layout=newlayout)
-    #         # After 20 milliseconds, run the function test.
-    #         # Any TK GUI element has this "after" function, and it doesn't seem important which object you use.
-    #         # So I just use the frame, which encloses the entire window.
-    #         testgui.frame.after(20, test)
-    #     except StopIteration:
-    #         pass
-    #
-    # test()
     testgui.mainloop()
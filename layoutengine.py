@@ -0,0 +1,382 @@
+"""
+The spring simulations behind Automaton.layout.
+
+Every function here takes the starting position of every state, and the transitions of the automaton
+(in the same format as Automaton.states), and returns the new positions after the simulation.
+"""
+import hashlib
+import itertools
+import json
+import math
+import os
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional. Without it, only the pure Python simulation is available.
+    numpy = None
+
+
+def springlayout(positions, states, alignment=1.0, separation=1.2, steps=500, maxspeed=0.2, speed=math.e,
+                 tolerance=0.0, fixed=(), progress=None):
+    """
+    Runs the spring simulation in pure Python. This is slow for big automata, since every step looks at every
+    pair of states, but it does not need anything besides the standard library.
+    :param positions: A dictionary where each state is a key, the value for which is a 2-tuple of its coordinates
+    :param states: The transitions of the automaton, in the same format as Automaton.states
+    :param alignment: Length of springs between states with transitions between them.
+    :param separation: Length of springs between states without any transition between them.
+    :param steps: Number of steps for which to run the simulation
+    :param maxspeed: Maximum "speed" for states to be moved around during simulation.
+    :param speed: A constant that just needs to be arbitrarily tweaked.
+    :param tolerance: The simulation stops early once the energy of the springs (the sum of the squares of all the
+                    forces) changes by less than this fraction of itself from one step to the next.
+                    Energy is used rather than how far the states move, because the forces are not symmetric,
+                    so a layout that has settled down can keep drifting or spinning around as a whole.
+    :param fixed: States which are not moved. They still push and pull the other states.
+    :param progress: A function which is called after every step with the number of the step, the coordinates
+                    of each state so far (in the same format as positions), and the energy of that step, or None.
+                    It can stop the simulation by raising an exception, which is passed on to the caller.
+    :return: A dictionary of the new coordinates of each state, in the same format as positions.
+    """
+    # Calculates the distance between two 2-tuples
+    def dist(p1, p2):
+        return ((p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2) ** 0.5
+
+    result = positions
+    fixed = set(fixed)
+    movable = [state for state in result if state not in fixed]
+    previousenergy = None
+    for i in range(steps):
+        energy = 0
+        # Stores up the cumulative displacement on each state. Starts out at zero.
+        displacements = {state: [0, 0] for state in result}
+        if fixed:
+            # Only the states that can move need to have the forces on them calculated
+            pairs = ((state, otherstate) for otherstate in movable for state in result)
+        else:
+            pairs = itertools.product(result.keys(), result.keys())
+        # The following loop iterates over every pair of states that are are not the same
+        for state, otherstate in filter(lambda x: x[0] != x[1], pairs):
+            distance = dist(result[state], result[otherstate])
+            if otherstate in states[state]:  # If these states are connected:
+                force = distance - alignment
+            else:  # If they are not connected:
+                # The "min(..., 0)" ensure that if the states are already far enough apart, then
+                # no more force is exerted.
+                force = min(distance - separation, 0)
+            energy += force * force
+            alpha = -speed ** (-abs(force) + math.log(maxspeed, speed)) + maxspeed
+            if force < 0:
+                alpha = -alpha
+            # Do not yet move the state, just add the displacement to what's already there. This way,
+            # for states that have multiple connections, they move based on the total net displacement
+            # after all forces are calculated.
+            displacements[otherstate][0] += (alpha / distance) * (result[state][0] - result[otherstate][0])
+            displacements[otherstate][1] += (alpha / distance) * (result[state][1] - result[otherstate][1])
+        # Here is where the forces are actually exerted.
+        nextresult = {state: (result[state][0] + displacements[state][0],
+                              result[state][1] + displacements[state][1]) for state in result}
+        # (This has to be two steps because you can't modify a data structure while iterating over it)
+        result = nextresult
+        if progress is not None:
+            progress(i, result, energy)
+        # If the energy is not changing anymore, the simulation has settled down and there is no point in going on
+        if converged(previousenergy, energy, tolerance):
+            break
+        previousenergy = energy
+    return result
+
+
+def springlayoutnumpy(positions, states, alignment=1.0, separation=1.2, steps=500, maxspeed=0.2, speed=math.e,
+                      tolerance=0.0, fixed=(), progress=None):
+    """
+    Runs exactly the same simulation as springlayout, but with NumPy. The positions are kept in an (n, 2) array,
+    and the forces between every pair of states are calculated all at once for each step.
+    Takes the same parameters and returns the same thing as springlayout.
+    """
+    names = list(positions)
+    index = {state: i for i, state in enumerate(names)}
+    n = len(names)
+    result = numpy.array([positions[state] for state in names], dtype=float).reshape(n, 2)
+    # connected[i, j] is True if there is a transition from state i to state j
+    connected = numpy.zeros((n, n), dtype=bool)
+    for state in names:
+        for otherstate in states[state]:
+            if otherstate in index:
+                connected[index[state], index[otherstate]] = True
+    # Only the forces on the states that can move are calculated, so every array below has
+    # one column for each of those states.
+    fixed = set(fixed)
+    movable = numpy.array([i for i, state in enumerate(names) if state not in fixed], dtype=int)
+    connected = connected[:, movable]
+    offdiagonal = numpy.arange(n)[:, None] != movable[None, :]
+    logmaxspeed = math.log(maxspeed, speed)
+
+    previousenergy = None
+    for i in range(steps):
+        # difference[i, j] is the vector from the j-th movable state to state i
+        difference = result[:, None, :] - result[None, movable, :]
+        distance = numpy.sqrt((difference ** 2).sum(axis=2))
+        force = numpy.where(connected, distance - alignment, numpy.minimum(distance - separation, 0))
+        energy = float((force[offdiagonal] ** 2).sum())
+        alpha = -speed ** (-numpy.abs(force) + logmaxspeed) + maxspeed
+        alpha = numpy.where(force < 0, -alpha, alpha)
+        # A state does not push or pull itself. (This also avoids dividing by its zero distance to itself)
+        distance[~offdiagonal] = 1
+        alpha = numpy.where(offdiagonal, alpha / distance, 0)
+        # State i pushes or pulls state j along the vector from j to i
+        result[movable] += numpy.einsum("ij,ijk->jk", alpha, difference)
+        if progress is not None:
+            progress(i, {state: (float(result[j, 0]), float(result[j, 1])) for j, state in enumerate(names)},
+                     energy)
+        if converged(previousenergy, energy, tolerance):
+            break
+        previousenergy = energy
+    return {state: (float(result[i, 0]), float(result[i, 1])) for i, state in enumerate(names)}
+
+
+def gridlayout(positions, states, alignment=1.0, separation=1.2, steps=500, maxspeed=0.2, speed=math.e,
+               tolerance=0.0, fixed=(), progress=None):
+    """
+    Runs the same simulation as springlayout, but without looking at every pair of states.
+    States which are not connected only push each other apart when they are closer than separation,
+    so every step the states are put into a grid of squares of that size, and only states in neighbouring
+    squares are compared. Springs are only evaluated along the actual transitions. This makes each step
+    take time roughly proportional to the number of states plus the number of transitions, instead of
+    the number of states squared. Takes the same parameters and returns the same thing as springlayout.
+    """
+    names = list(positions)
+    index = {state: i for i, state in enumerate(names)}
+    n = len(names)
+    xs = [positions[state][0] for state in names]
+    ys = [positions[state][1] for state in names]
+    # Every transition between two different states, as (from, to) pairs of indices
+    edges = [(index[state], index[otherstate]) for state in names for otherstate in states[state]
+             if otherstate in index and otherstate != state]
+    edgeset = set(edges)
+    fixed = {index[state] for state in fixed if state in index}
+    logmaxspeed = math.log(maxspeed, speed)
+    neighbours = [(ox, oy) for ox in (-1, 0, 1) for oy in (-1, 0, 1)]
+
+    previousenergy = None
+    for step in range(steps):
+        dx = [0.0] * n
+        dy = [0.0] * n
+        energy = 0
+
+        if separation > 0:
+            grid = {}
+            for i in range(n):
+                grid.setdefault((math.floor(xs[i] / separation), math.floor(ys[i] / separation)), []).append(i)
+            for (cx, cy), members in grid.items():
+                nearby = [i for ox, oy in neighbours for i in grid.get((cx + ox, cy + oy), ())]
+                # State i pushes state j away, unless there is a transition from i to j (that's a spring instead)
+                for j in members:
+                    if j in fixed:
+                        continue
+                    xj = xs[j]
+                    yj = ys[j]
+                    for i in nearby:
+                        if i == j or (i, j) in edgeset:
+                            continue
+                        ddx = xs[i] - xj
+                        ddy = ys[i] - yj
+                        distance = (ddx * ddx + ddy * ddy) ** 0.5
+                        if distance >= separation:
+                            continue
+                        energy += (separation - distance) ** 2
+                        alpha = -(maxspeed - speed ** (logmaxspeed - (separation - distance))) / distance
+                        dx[j] += alpha * ddx
+                        dy[j] += alpha * ddy
+
+        for i, j in edges:
+            if j in fixed:
+                continue
+            ddx = xs[i] - xs[j]
+            ddy = ys[i] - ys[j]
+            distance = (ddx * ddx + ddy * ddy) ** 0.5
+            force = distance - alignment
+            energy += force * force
+            alpha = maxspeed - speed ** (logmaxspeed - abs(force))
+            if force < 0:
+                alpha = -alpha
+            dx[j] += (alpha / distance) * ddx
+            dy[j] += (alpha / distance) * ddy
+
+        for i in range(n):
+            xs[i] += dx[i]
+            ys[i] += dy[i]
+        if progress is not None:
+            progress(step, {state: (xs[i], ys[i]) for i, state in enumerate(names)}, energy)
+        if converged(previousenergy, energy, tolerance):
+            break
+        previousenergy = energy
+    return {state: (xs[i], ys[i]) for i, state in enumerate(names)}
+
+
+def converged(previousenergy, energy, tolerance):
+    """
+    :return: True if the energy changed by at most tolerance times itself since the previous step.
+    """
+    return previousenergy is not None and abs(previousenergy - energy) <= tolerance * previousenergy
+
+
+# All of the simulations, by the name used for them in Automaton.layout
+ENGINES = {
+    "python": springlayout,
+    "numpy": springlayoutnumpy,
+    "grid": gridlayout,
+}
+
+
+def simulate(engine, positions, states, **parameters):
+    """
+    Runs one of the simulations in ENGINES. This is a plain function so that it can be sent to another process.
+    :param engine: Name of the simulation to run
+    :param positions: Starting coordinates of each state
+    :param states: The transitions of the automaton, in the same format as Automaton.states
+    :param parameters: Any other parameters of the simulation, such as alignment or steps
+    :return: A dictionary of the new coordinates of each state
+    """
+    return ENGINES[engine](positions, states, **parameters)
+
+
+def overlaps(positions, states, radius=0.05):
+    """
+    Measures how messy a layout is, by counting how many things overlap each other once the layout is
+    scaled to fit in a unit square (the same way Gui.drawautomaton scales it to fit on the canvas).
+    Three kinds of overlaps are counted:
+        - Two states that are closer together than two times radius
+        - A transition that passes within radius of a state that it does not start or end at
+        - Two transitions that cross each other
+    Transitions are treated as straight lines for this. Lower is better.
+    :param positions: A dictionary where each state is a key, the value for which is a 2-tuple of its coordinates
+    :param states: The transitions of the automaton, in the same format as Automaton.states
+    :param radius: Radius of a state, as a fraction of the size of the layout
+    :return: The number of overlaps
+    """
+    if not positions:
+        return 0
+    minx = min(p[0] for p in positions.values())
+    miny = min(p[1] for p in positions.values())
+    width = (max(p[0] for p in positions.values()) - minx) or 1
+    height = (max(p[1] for p in positions.values()) - miny) or 1
+    points = {state: ((p[0] - minx) / width, (p[1] - miny) / height) for state, p in positions.items()}
+    names = list(points)
+    edges = {(state, otherstate) for state in names for otherstate in states[state]
+             if otherstate in points and otherstate != state}
+    # Transitions in both directions between the same states are only drawn over each other once
+    segments = list({tuple(sorted(edge, key=names.index)) for edge in edges})
+
+    def dist(p1, p2):
+        return ((p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2) ** 0.5
+
+    def segmentdist(p, a, b):
+        # Distance from point p to the line segment from a to b
+        length = (b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2
+        if length == 0:
+            return dist(p, a)
+        t = max(0, min(1, ((p[0] - a[0]) * (b[0] - a[0]) + (p[1] - a[1]) * (b[1] - a[1])) / length))
+        return dist(p, (a[0] + t * (b[0] - a[0]), a[1] + t * (b[1] - a[1])))
+
+    def orientation(a, b, c):
+        return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+    count = 0
+    for i, state in enumerate(names):
+        for otherstate in names[i + 1:]:
+            if dist(points[state], points[otherstate]) < 2 * radius:
+                count += 1
+    for a, b in segments:
+        for state in names:
+            if state != a and state != b and segmentdist(points[state], points[a], points[b]) < radius:
+                count += 1
+    for i, (a, b) in enumerate(segments):
+        for c, d in segments[i + 1:]:
+            if len({a, b, c, d}) < 4:
+                # Transitions which share a state always touch there, which does not count
+                continue
+            pa, pb, pc, pd = points[a], points[b], points[c], points[d]
+            if (orientation(pa, pb, pc) > 0) != (orientation(pa, pb, pd) > 0) and \
+                    (orientation(pc, pd, pa) > 0) != (orientation(pc, pd, pb) > 0):
+                count += 1
+    return count
+
+
+def structurekey(states, startstate, finalstates, parameters):
+    """
+    Makes a key which identifies the layout of an automaton. Two automata get the same key if they have the same
+    states, start state, final states, and transitions between states, no matter which order they are in or which
+    inputs are on the transitions (since those do not change the layout).
+    :param states: The transitions of the automaton, in the same format as Automaton.states
+    :param startstate: Name of the start state
+    :param finalstates: An iterable of the names of the final states
+    :param parameters: A dictionary of the parameters used for the layout
+    :return: The key, as a string of hexadecimal digits
+    """
+    structure = {
+        "transitions": {state: sorted(states[state]) for state in states},
+        "start": startstate,
+        "finalstates": sorted(finalstates),
+        "parameters": parameters
+    }
+    return hashlib.sha256(json.dumps(structure, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class LayoutCache:
+    """
+    Keeps layouts on disk so that they do not need to be computed again, with one JSON file per layout.
+    When there are more than maxentries layouts, the ones which were used the longest time ago are deleted.
+    (The modification time of each file is updated every time it is used, to keep track of this.)
+    """
+
+    def __init__(self, directory=None, maxentries=256):
+        """
+        :param directory: Directory in which to keep the layouts. If None, then ~/.automata/layouts is used.
+        :param maxentries: Maximum number of layouts to keep.
+        """
+        if directory is None:
+            directory = os.path.join(os.path.expanduser("~"), ".automata", "layouts")
+        self.directory = directory
+        self.maxentries = maxentries
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        """
+        :param key: Key of the layout, from structurekey
+        :return: The layout, in the same format as Automaton.layout(), or None if it is not in the cache.
+        """
+        try:
+            with open(self.path(key)) as file:
+                positions = json.load(file)
+            os.utime(self.path(key))
+        except (OSError, ValueError):
+            return None
+        return {state: tuple(coords) for state, coords in positions.items()}
+
+    def put(self, key, positions):
+        """
+        Adds a layout to the cache, and deletes the oldest layouts if there are too many now.
+        Problems writing to the disk are ignored, since the cache is only there to save time.
+        :param key: Key of the layout, from structurekey
+        :param positions: The layout, in the same format as Automaton.layout()
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write to a temporary file first, so that another process never sees half of a file
+            temporary = self.path(key) + ".tmp"
+            with open(temporary, "w") as file:
+                json.dump(positions, file)
+            os.replace(temporary, self.path(key))
+
+            entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                       if name.endswith(".json")]
+            if len(entries) > self.maxentries:
+                entries.sort(key=os.path.getmtime)
+                for entry in entries[:len(entries) - self.maxentries]:
+                    os.remove(entry)
+        except OSError:
+            pass
@@ -0,0 +1,160 @@
+import codecs
+import mmap
+
+
+class StreamMatcher:
+    """
+    Runs an automaton over a stream of input which is given a piece at a time, such as a big file or a socket,
+    without ever holding the whole input in memory.
+
+    There are two ways of looking at the input:
+        - As records separated by a delimiter (for example, lines). For every record, the matcher reports
+          whether the automaton accepts it.
+        - As one long input in which to search for matches. The matcher reports the position right after
+          every place where an input accepted by the automaton ends. (Like searching for a regular expression)
+    The automaton is determinized lazily (see engine.LazyDFA), so long inputs mostly just look up transitions
+    which were already computed. Changes made to the automaton after the matcher is made are not seen by it.
+    """
+
+    def __init__(self, automaton, delimiter="\n", matches=False, encoding="utf-8", cachesize=4096):
+        """
+        :param automaton: The Automaton to run
+        :param delimiter: The string which separates records. Only used when matches is False.
+        :param matches: If False, report whether each record is accepted. If True, report the positions of matches.
+        :param encoding: Encoding used to turn bytes into inputs. (Each character is one input)
+                    "latin-1" turns every byte into exactly one input.
+        :param cachesize: Number of sets of states to keep in the cache of the lazy DFA
+        """
+        if not matches and len(delimiter) == 0:
+            raise ValueError("The delimiter cannot be empty")
+        self.dfa = automaton.determinize(lazy=True, cachesize=cachesize)
+        self.delimiter = delimiter
+        self.matches = matches
+        self.encoding = encoding
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets everything that has been fed so far, to start over with a new stream.
+        """
+        self.decoder = codecs.getincrementaldecoder(self.encoding)()
+        # Bitmask of the current states. When looking for matches, this does not include the start state,
+        # which is added back in at every position.
+        self.mask = self.dfa.startmask if not self.matches else 0
+        # Number of inputs read so far (only kept track of when looking for matches)
+        self.position = 0
+        # End of the previous chunk which might be the start of a delimiter, so it has not been run yet
+        self.held = ""
+        # True if anything has been fed since the last delimiter
+        self.pending = False
+
+    def feed(self, chunk):
+        """
+        Runs the automaton over the next piece of the input.
+        :param chunk: The next piece, as a string or as bytes
+        :return: A list of the results which were completed by this piece. When looking at records, that is
+                True or False for every record which ended, in order. When looking for matches, that is the position
+                (number of inputs from the start of the stream) right after the end of every match.
+        """
+        if isinstance(chunk, (bytes, bytearray, memoryview)):
+            chunk = self.decoder.decode(chunk)
+        if self.matches:
+            return self.feedmatches(chunk)
+        return self.feedrecords(chunk)
+
+    def close(self):
+        """
+        Ends the stream. If there is a record which was not followed by a delimiter, its result is reported now.
+        :return: Same as self.feed
+        """
+        chunk = self.decoder.decode(b"", final=True)
+        results = self.feed(chunk) if chunk else []
+        if not self.matches and self.pending:
+            self.mask = self.dfa.runmask(self.held, self.mask) if self.mask else 0
+            results.append(self.mask & self.dfa.finalmask != 0)
+        self.reset()
+        return results
+
+    def feedrecords(self, chunk):
+        dfa = self.dfa
+        chunk = self.held + chunk
+        records = chunk.split(self.delimiter)
+        # The last piece is not a whole record yet. Its last few inputs might be the start of a delimiter
+        # that continues in the next chunk, so they are held back.
+        last = records.pop()
+        keep = len(self.delimiter) - 1
+        if keep > 0 and len(last) > 0:
+            self.held = last[-keep:]
+            last = last[:-keep]
+        else:
+            self.held = ""
+
+        results = []
+        mask = self.mask
+        for record in records:
+            if mask:
+                mask = dfa.runmask(record, mask)
+            results.append(mask & dfa.finalmask != 0)
+            mask = dfa.startmask
+        if mask and last:
+            mask = dfa.runmask(last, mask)
+        self.mask = mask
+        self.pending = bool(last or self.held) or (self.pending and not records)
+        return results
+
+    def feedmatches(self, chunk):
+        dfa = self.dfa
+        nextmask = dfa.nextmask
+        symbolids = dfa.symbolids
+        classify = dfa.classify
+        startmask = dfa.startmask
+        finalmask = dfa.finalmask
+        mask = self.mask
+        position = self.position
+        results = []
+        for symbol in chunk:
+            position += 1
+            symbolid = symbolids.get(symbol)
+            if symbolid is None:
+                symbolid = classify(symbol)
+            mask = nextmask(mask | startmask, symbolid)
+            if mask & finalmask:
+                results.append(position)
+        self.mask = mask
+        self.position = position
+        return results
+
+    def scan(self, stream, buffersize=1 << 20):
+        """
+        Runs the automaton over everything in a readable stream (anything with a read method, like an open file),
+        reading buffersize at a time.
+        :param stream: The stream to read from, in either text or binary mode
+        :param buffersize: Number of characters or bytes to read at a time
+        :return: A generator of the results, in the same format as self.feed
+        """
+        self.reset()
+        while True:
+            chunk = stream.read(buffersize)
+            if not chunk:
+                break
+            yield from self.feed(chunk)
+        yield from self.close()
+
+    def scanfile(self, filepath, buffersize=1 << 20):
+        """
+        Runs the automaton over a whole file. The file is memory mapped, so that the operating system takes care
+        of reading it, and only buffersize bytes of it are decoded at a time.
+        :param filepath: Path to the file
+        :param buffersize: Number of bytes to decode at a time
+        :return: A generator of the results, in the same format as self.feed
+        """
+        self.reset()
+        with open(filepath, "rb") as file:
+            if file.seek(0, 2) == 0:
+                # Empty files cannot be memory mapped
+                yield from self.close()
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for start in range(0, len(mapped), buffersize):
+                    yield from self.feed(mapped[start:start + buffersize])
+        yield from self.close()
@@ -0,0 +1,109 @@
+"""
+Checks big batches of inputs against an automaton using several processes at once.
+
+The automaton is compiled once into EdgeArrays (see engine.EdgeArrays), whose arrays are copied into a block of
+shared memory. Every worker process attaches to that block when it starts, and uses the arrays in it directly,
+so the transitions are never pickled or copied for each batch of inputs.
+"""
+import collections
+import concurrent.futures
+import itertools
+import os
+from multiprocessing import shared_memory
+
+from engine import EdgeArrays
+
+# The automaton used by this worker process, and the shared memory it lives in. (See attach)
+workeredges = None
+workermemory = None
+
+
+def attach(name, edgecount, symbols, startmask, finalmask, classes):
+    """
+    Runs once in every worker process when it starts, to attach to the shared memory holding the automaton.
+    :param name: Name of the shared memory block
+    :param edgecount: Number of transitions in the arrays
+    :param symbols: Same as EdgeArrays.symbols
+    :param startmask: Same as EdgeArrays.startmask
+    :param finalmask: Same as EdgeArrays.finalmask
+    :param classes: Same as EdgeArrays.classes
+    """
+    global workeredges, workermemory
+    workermemory = shared_memory.SharedMemory(name=name)
+    edgekeys, edgetargets = unpack(workermemory.buf, edgecount)
+    workeredges = EdgeArrays.frombuffers(edgekeys, edgetargets, symbols, startmask, finalmask, classes)
+
+
+def unpack(buffer, edgecount):
+    """
+    :param buffer: A buffer which holds edgekeys followed by edgetargets, as written by accepts_parallel
+    :param edgecount: Number of transitions in the arrays
+    :return: The two arrays, as memoryviews of the buffer
+    """
+    view = memoryview(buffer)
+    edgekeys = view[:8 * edgecount].cast("q")
+    edgetargets = view[8 * edgecount:12 * edgecount].cast("i")
+    return edgekeys, edgetargets
+
+
+def checkchunk(words):
+    """
+    Runs in a worker process to check one chunk of inputs.
+    :param words: A list of inputs
+    :return: A bytearray with one entry per input, which is 1 if that input is accepted and 0 otherwise
+    """
+    return workeredges.acceptsmany(words)
+
+
+def chunked(words, chunksize):
+    iterator = iter(words)
+    while True:
+        chunk = list(itertools.islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def accepts_parallel(automaton, words, processes=None, chunksize=10000):
+    """
+    Checks a batch of inputs against an automaton, split into chunks which are checked in parallel.
+    The results always come back in the same order as the inputs, no matter which chunk finishes first.
+    Only a few chunks per process are read from words at a time, so it can be a generator of any length.
+    :param automaton: The Automaton to check the inputs against
+    :param words: An iterable of inputs, each of which is an iterable of inputs to the automaton
+    :param processes: Number of worker processes. If None, one for every CPU.
+    :param chunksize: Number of inputs sent to a worker process at a time
+    :return: A bytearray with one entry per input: 1 if that input is accepted, 0 if it is not.
+    """
+    edges = automaton.compile()
+    if not isinstance(edges, EdgeArrays):
+        edges = EdgeArrays(automaton.states, automaton.startstate, automaton.finalstates)
+    edgecount = len(edges.edgekeys)
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    # SharedMemory cannot be empty, even if there are no transitions
+    memory = shared_memory.SharedMemory(create=True, size=max(12 * edgecount, 1))
+    try:
+        edgekeys, edgetargets = unpack(memory.buf, edgecount)
+        edgekeys[:] = memoryview(edges.edgekeys).cast("B").cast("q")
+        edgetargets[:] = memoryview(edges.edgetargets).cast("B").cast("i")
+        del edgekeys, edgetargets
+
+        results = bytearray()
+        with concurrent.futures.ProcessPoolExecutor(processes, initializer=attach,
+                                                    initargs=(memory.name, edgecount, edges.symbols,
+                                                              edges.startmask, edges.finalmask,
+                                                              edges.classes)) as executor:
+            # Keep a few chunks waiting for every process, and collect the results in order
+            pending = collections.deque()
+            for chunk in chunked(words, chunksize):
+                pending.append(executor.submit(checkchunk, chunk))
+                if len(pending) >= 2 * processes:
+                    results += pending.popleft().result()
+            while pending:
+                results += pending.popleft().result()
+        return results
+    finally:
+        memory.close()
+        memory.unlink()
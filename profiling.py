@@ -0,0 +1,148 @@
+"""
+Counts what an automaton does while it runs, to find out which parts of it are hot, and where a nondeterministic
+automaton blows up into many states at once. (See Automaton.profile)
+
+Nothing is counted unless profiling was turned on, and then the automaton runs inputs one step at a time through
+Profiler.advance instead of its usual fast loops, so profiling is slow but does not cost anything when it is off.
+"""
+import time
+from collections import Counter
+
+from engine import bits
+
+
+class Profiler:
+    """
+    The counts of an automaton which is being profiled.
+    """
+
+    def __init__(self, callback=None):
+        """
+        :param callback: A function which is told about everything as it happens, or None. It is called with
+                    "step" and a tuple of the input and the set of states after every step, and with "layout" and
+                    a tuple of the number of the step and the energy after every step of a layout.
+        """
+        self.callback = callback
+        # visits[A] is the number of times state A was one of the current states, after a step or at the start
+        self.visits = Counter()
+        # edgehits[A, B] is the number of times the automaton went from state A to state B. (B can also be a state
+        # which was reached through epsilon transitions after that)
+        self.edgehits = Counter()
+        # activesizes[n] is the number of steps after which there were n current states. Big numbers mean that
+        # a nondeterministic automaton is keeping track of a lot of states at once.
+        self.activesizes = Counter()
+        # Number of steps, and the time they took. (Not counting the time spent counting)
+        self.steps = 0
+        self.seconds = 0.0
+        # One list for every layout, of the energy after each step of the simulation
+        self.layouts = []
+
+    def visit(self, compiled, mask):
+        """
+        Counts a set of states as current, without a step. (For example, the start states)
+        :param compiled: The CompiledAutomaton which the states belong to
+        :param mask: Bitmask of the states
+        """
+        names = compiled.statenames
+        for stateid in bits(mask):
+            self.visits[names[stateid]] += 1
+
+    def advance(self, compiled, mask, symbol):
+        """
+        Advances a set of states by one input, and counts everything about the step.
+        :param compiled: The CompiledAutomaton to step
+        :param mask: Bitmask of the current states
+        :param symbol: The input
+        :return: Bitmask of the next states
+        """
+        started = time.perf_counter()
+        symbolid = compiled.symbolid(symbol)
+        nextmask = compiled.nextmask(mask, symbolid)
+        self.seconds += time.perf_counter() - started
+        self.steps += 1
+
+        names = compiled.statenames
+        if symbolid is not None:
+            for stateid in bits(mask):
+                for otherid in bits(compiled.nextmask(1 << stateid, symbolid)):
+                    self.edgehits[names[stateid], names[otherid]] += 1
+        self.visit(compiled, nextmask)
+        self.activesizes[bin(nextmask).count("1")] += 1
+        if self.callback is not None:
+            self.callback("step", (symbol, compiled.names(nextmask)))
+        return nextmask
+
+    def step(self, compiled, currentstate, symbol):
+        """
+        Same as Automaton.getnextstate, but counted.
+        :param compiled: The CompiledAutomaton to step
+        :param currentstate: An iterable of the names of the current states
+        :param symbol: The input
+        :return: The set of names of the next states
+        """
+        return compiled.names(self.advance(compiled, compiled.mask(currentstate), symbol))
+
+    def run(self, compiled, word):
+        """
+        Same as CompiledAutomaton.runmask starting from the start state, but counted.
+        :param compiled: The CompiledAutomaton to run
+        :param word: An iterable of inputs
+        :return: Bitmask of the states after the whole input
+        """
+        mask = compiled.startmask
+        self.visit(compiled, mask)
+        for symbol in word:
+            if not mask:
+                break
+            mask = self.advance(compiled, mask, symbol)
+        return mask
+
+    def watchlayout(self, progress=None):
+        """
+        Makes a function to give to Automaton.layout as its progress, which counts the energy after every step.
+        :param progress: Another progress function, which is called too, or None
+        :return: The function
+        """
+        energies = []
+        self.layouts.append(energies)
+
+        def watch(step, positions, energy):
+            energies.append(energy)
+            if self.callback is not None:
+                self.callback("layout", (step, energy))
+            if progress is not None:
+                progress(step, positions, energy)
+        return watch
+
+    def stepspersecond(self):
+        """
+        :return: The number of steps per second, not counting the time spent counting, or None if nothing has been
+                timed yet
+        """
+        return self.steps / self.seconds if self.seconds else None
+
+    def heat(self):
+        """
+        :return: A dictionary of how often each state was current, as a fraction of how often the most visited
+                state was, so that the hottest state is 1.0. States which were never current are left out.
+        """
+        if not self.visits:
+            return {}
+        most = max(self.visits.values())
+        return {state: count / most for state, count in self.visits.items()}
+
+    def summary(self, top=10):
+        """
+        :param top: Number of the most visited states and most taken transitions to include
+        :return: A dictionary of the counts, which can be written out as JSON
+        """
+        return {
+            "steps": self.steps,
+            "seconds": self.seconds,
+            "stepspersecond": self.stepspersecond(),
+            "hotstates": self.visits.most_common(top),
+            "hotedges": [[state, otherstate, count] for (state, otherstate), count in self.edgehits.most_common(top)],
+            "activesizes": {str(size): count for size, count in sorted(self.activesizes.items())},
+            "layouts": [{"iterations": len(energies), "energy": energies[-1] if energies else None}
+                        for energies in self.layouts]
+        }
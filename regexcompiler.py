@@ -0,0 +1,202 @@
+"""
+Turns regular expressions into automata, using Thompson's construction.
+
+The supported syntax is:
+    a           The input "a". Any character other than the special characters below stands for itself.
+    \\*          A special character (one of \\ | * + ? ( ) [ ] .) which stands for itself instead.
+    .           Any input in the alphabet.
+    [abc]       Any one of the inputs a, b or c. Ranges like [a-z] are allowed too.
+    [^abc]      Any input in the alphabet other than a, b or c.
+    RS          R followed by S.
+    R|S         Either R or S.
+    R*          R, any number of times (including zero).
+    R+          R, at least once.
+    R?          R, or nothing.
+    (R)         Grouping.
+An empty pattern (or an empty side of a |) matches only the empty input.
+"""
+from engine import EPSILON
+
+
+class ThompsonBuilder:
+    """
+    Builds the transitions of an automaton for a regular expression while it is being parsed.
+
+    Every part of the expression becomes a "fragment": a pair of a start state and an end state, where the end
+    state has no transitions out of it yet. Fragments are glued together with epsilon transitions, so the
+    automaton has only a few states for each character of the pattern, and it takes linear time to build.
+    """
+
+    def __init__(self, pattern, alphabet=None):
+        """
+        :param pattern: The regular expression
+        :param alphabet: An iterable of all the inputs. This is needed for . and [^...], and if it is given,
+                    then every input used in the pattern has to be in it.
+        """
+        self.pattern = pattern
+        self.alphabet = None if alphabet is None else list(dict.fromkeys(str(symbol) for symbol in alphabet))
+        self.known = None if alphabet is None else set(self.alphabet)
+        self.position = 0
+        # Same format as Automaton.states, but with lists of inputs
+        self.transitions = {}
+
+    def newstate(self):
+        name = str(len(self.transitions))
+        self.transitions[name] = {}
+        return name
+
+    def connect(self, state, otherstate, inputs):
+        self.transitions[state].setdefault(otherstate, []).extend(inputs)
+
+    def error(self, message):
+        raise ValueError("{} at position {} of the regular expression {!r}".format(message, self.position,
+                                                                                   self.pattern))
+
+    def build(self):
+        """
+        Parses the whole pattern.
+        :return: The specification of the automaton, in the same format as the JSON file
+        """
+        start, end = self.alternation()
+        if self.position != len(self.pattern):
+            # The only way to stop early is an unmatched closing parenthesis
+            self.error("Unmatched )")
+        return {
+            "name": self.pattern,
+            "description": "Built from the regular expression {}".format(self.pattern),
+            "transitions": self.transitions,
+            "start": start,
+            "finalstates": [end]
+        }
+
+    def peek(self):
+        if self.position < len(self.pattern):
+            return self.pattern[self.position]
+        return None
+
+    def alternation(self):
+        fragments = [self.concatenation()]
+        while self.peek() == "|":
+            self.position += 1
+            fragments.append(self.concatenation())
+        if len(fragments) == 1:
+            return fragments[0]
+        start = self.newstate()
+        end = self.newstate()
+        for fragmentstart, fragmentend in fragments:
+            self.connect(start, fragmentstart, [EPSILON])
+            self.connect(fragmentend, end, [EPSILON])
+        return start, end
+
+    def concatenation(self):
+        start = end = self.newstate()
+        while self.peek() is not None and self.peek() not in "|)":
+            fragmentstart, fragmentend = self.repetition()
+            self.connect(end, fragmentstart, [EPSILON])
+            end = fragmentend
+        return start, end
+
+    def repetition(self):
+        start, end = self.atom()
+        while self.peek() is not None and self.peek() in "*+?":
+            operator = self.peek()
+            self.position += 1
+            newstart = self.newstate()
+            newend = self.newstate()
+            self.connect(newstart, start, [EPSILON])
+            self.connect(end, newend, [EPSILON])
+            if operator in "*?":
+                # Skip over it entirely
+                self.connect(newstart, newend, [EPSILON])
+            if operator in "*+":
+                # Go back around for another time
+                self.connect(end, start, [EPSILON])
+            start, end = newstart, newend
+        return start, end
+
+    def atom(self):
+        character = self.peek()
+        if character is None or character in "*+?":
+            self.error("Expected an input")
+        self.position += 1
+        if character == "(":
+            fragment = self.alternation()
+            if self.peek() != ")":
+                self.error("Missing )")
+            self.position += 1
+            return fragment
+        if character == "[":
+            inputs = self.characterclass()
+        elif character == ".":
+            inputs = self.everything()
+        elif character == "\\":
+            inputs = [self.escaped()]
+        elif character in "])":
+            self.error("Unmatched {}".format(character))
+        else:
+            inputs = [character]
+        if self.known is not None:
+            for symbol in inputs:
+                if symbol not in self.known:
+                    self.error("The input {!r} is not in the alphabet".format(symbol))
+        start = self.newstate()
+        end = self.newstate()
+        self.connect(start, end, inputs)
+        return start, end
+
+    def escaped(self):
+        character = self.peek()
+        if character is None:
+            self.error("Nothing to escape")
+        self.position += 1
+        return character
+
+    def everything(self):
+        if self.alphabet is None:
+            self.error("An alphabet is needed for . and [^...]")
+        return list(self.alphabet)
+
+    def characterclass(self):
+        negated = self.peek() == "^"
+        if negated:
+            self.position += 1
+        inputs = []
+        # A ] right at the start is just the character ]
+        first = True
+        while True:
+            character = self.peek()
+            if character is None:
+                self.error("Missing ]")
+            self.position += 1
+            if character == "]" and not first:
+                break
+            first = False
+            if character == "\\":
+                character = self.escaped()
+            if self.peek() == "-" and self.position + 1 < len(self.pattern) and \
+                    self.pattern[self.position + 1] != "]":
+                self.position += 1
+                last = self.peek()
+                self.position += 1
+                if last == "\\":
+                    last = self.escaped()
+                if ord(last) < ord(character):
+                    self.error("Invalid range {}-{}".format(character, last))
+                inputs.extend(chr(code) for code in range(ord(character), ord(last) + 1))
+            else:
+                inputs.append(character)
+        inputs = list(dict.fromkeys(inputs))
+        if negated:
+            excluded = set(inputs)
+            return [symbol for symbol in self.everything() if symbol not in excluded]
+        return inputs
+
+
+def compileregex(pattern, alphabet=None):
+    """
+    Builds a nondeterministic automaton (with epsilon transitions) for a regular expression.
+    :param pattern: The regular expression. (See the top of this file for the syntax)
+    :param alphabet: An iterable of all the inputs, or None. (See ThompsonBuilder)
+    :return: The specification of the automaton, in the same format as the JSON file
+    """
+    return ThompsonBuilder(pattern, alphabet).build()
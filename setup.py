@@ -6,6 +6,7 @@ import sys
 all_build_options = {
     'packages': [],
     'excludes': [],
+    # Run "python binaryformat.py Samples/*.json" first to bundle compiled samples, which open much faster
     'include_files': ["Samples/"]
 }
 
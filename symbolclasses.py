@@ -0,0 +1,242 @@
+"""
+Character classes, which let a single label on a transition stand for many inputs at once.
+
+A label which starts with [ and ends with ] (and is longer than one character) is a character class:
+    [abc]       Any one of the characters a, b or c.
+    [a-z0-9]    Any character in one of the ranges. (Both ends are included)
+    [^abc]      Any character other than a, b or c. [^] is any character at all.
+    [\\]\\-]      A \\ makes the next character stand for itself, for \\ ] - and ^.
+Any other label is a single input, as before. Classes only ever match inputs which are a single character.
+
+Classes are stored as tuples of (first, last) ranges of character codes, which are sorted, do not overlap and
+do not touch. When an automaton is compiled, the characters are split into the fewest pieces such that every
+transition either takes all of a piece or none of it (see partition), so the automaton only ever has to
+look at one input per piece.
+"""
+from bisect import bisect_right
+
+# The highest character code
+MAXCODE = 0x10FFFF
+
+# Characters which have to be escaped inside of a class
+SPECIAL = "\\]-^"
+
+
+def isclass(label):
+    """
+    :param label: A label of a transition
+    :return: True if the label is a character class, and not a single input
+    """
+    return len(label) > 1 and label[0] == "[" and label[-1] == "]"
+
+
+def merge(ranges):
+    """
+    :param ranges: An iterable of (first, last) ranges of character codes, in any order
+    :return: The same characters as a tuple of ranges which are sorted, do not overlap and do not touch
+    """
+    result = []
+    for first, last in sorted(ranges):
+        if result and first <= result[-1][1] + 1:
+            if last > result[-1][1]:
+                result[-1] = (result[-1][0], last)
+        else:
+            result.append((first, last))
+    return tuple(result)
+
+
+def complement(ranges):
+    """
+    :param ranges: Ranges of character codes, as returned by merge
+    :return: The ranges of all the other characters
+    """
+    result = []
+    start = 0
+    for first, last in ranges:
+        if first > start:
+            result.append((start, first - 1))
+        start = last + 1
+    if start <= MAXCODE:
+        result.append((start, MAXCODE))
+    return tuple(result)
+
+
+def parseclass(label):
+    """
+    :param label: A character class, like "[a-z]"
+    :return: The characters in it, as a tuple of ranges of character codes (See merge)
+    :raises ValueError: If the class is not valid
+    """
+    if not isclass(label):
+        raise ValueError("{!r} is not a character class".format(label))
+    body = label[1:-1]
+    negated = body.startswith("^")
+    if negated:
+        body = body[1:]
+    # Each character, and whether it was escaped (since an escaped - does not make a range)
+    tokens = []
+    position = 0
+    while position < len(body):
+        if body[position] == "\\":
+            if position + 1 == len(body):
+                raise ValueError("Nothing to escape at the end of the character class {!r}".format(label))
+            tokens.append((body[position + 1], True))
+            position += 2
+        else:
+            tokens.append((body[position], False))
+            position += 1
+    ranges = []
+    index = 0
+    while index < len(tokens):
+        first = tokens[index][0]
+        if index + 2 < len(tokens) and tokens[index + 1] == ("-", False):
+            last = tokens[index + 2][0]
+            if ord(last) < ord(first):
+                raise ValueError("Invalid range {}-{} in the character class {!r}".format(first, last, label))
+            ranges.append((ord(first), ord(last)))
+            index += 3
+        else:
+            ranges.append((ord(first), ord(first)))
+            index += 1
+    ranges = merge(ranges)
+    return complement(ranges) if negated else ranges
+
+
+def formatclass(ranges):
+    """
+    Turns ranges of character codes back into a label. (The opposite of parseclass)
+    :param ranges: Ranges of character codes, as returned by merge
+    :return: The character itself if there is only one, otherwise a character class. Whichever of [...] and [^...]
+            is shorter is used.
+    """
+    if len(ranges) == 1 and ranges[0][0] == ranges[0][1]:
+        return chr(ranges[0][0])
+
+    def body(ranges):
+        text = []
+        for first, last in ranges:
+            text.append(escape(chr(first)))
+            if last > first + 1:
+                text.append("-")
+            if last > first:
+                text.append(escape(chr(last)))
+        return "".join(text)
+
+    plain = "[" + body(ranges) + "]"
+    negated = "[^" + body(complement(ranges)) + "]"
+    return negated if len(negated) < len(plain) else plain
+
+
+def escape(character):
+    return "\\" + character if character in SPECIAL else character
+
+
+def pieces(rangesets):
+    """
+    Cuts the characters into pieces at every place where one of the sets starts or ends.
+    :param rangesets: A list of sets of characters, each of which is a tuple of ranges of character codes
+    :return: A list of (first, last, members) for every piece which is in at least one of the sets, in order,
+            where members is a frozenset of the indices in rangesets of the sets which contain that piece.
+    """
+    # At each of these codes, some sets start (+1) or stop (-1)
+    events = {}
+    for index, ranges in enumerate(rangesets):
+        for first, last in ranges:
+            events.setdefault(first, []).append((index, 1))
+            events.setdefault(last + 1, []).append((index, -1))
+    result = []
+    active = {}
+    points = sorted(events)
+    for point, nextpoint in zip(points, points[1:]):
+        for index, change in events[point]:
+            count = active.get(index, 0) + change
+            if count:
+                active[index] = count
+            else:
+                del active[index]
+        if active:
+            result.append((point, nextpoint - 1, frozenset(active)))
+    return result
+
+
+def partition(rangesets):
+    """
+    Splits the characters into classes, so that each of the sets either contains the whole of a class or none of it,
+    and characters which are in exactly the same sets are in the same class. These are the fewest classes possible.
+    :param rangesets: A list of sets of characters, each of which is a tuple of ranges of character codes
+    :return: A list of (ranges, members) for every class, in order of their first character, where members is a
+            sorted tuple of the indices in rangesets of the sets which contain that class.
+            Characters which are not in any of the sets are not in any class.
+    """
+    classes = {}
+    for first, last, members in pieces(rangesets):
+        classes.setdefault(members, []).append((first, last))
+    return [(merge(ranges), tuple(sorted(members))) for members, ranges in classes.items()]
+
+
+class CharClasses:
+    """
+    Finds which class an input is in, with a binary search over the ranges of all the classes.
+    """
+
+    def __init__(self, classes):
+        """
+        :param classes: An iterable of (ranges, symbolid) for every class, where ranges are the characters in it
+                    (which do not overlap any other class) and symbolid is the id of the class
+        """
+        # ranges[symbolid] is the ranges of character codes of the class with that id
+        self.ranges = {}
+        # starts[i] is the first character code of the i-th range, and ids[i] is the id of the class of that range,
+        # or None for the characters between classes. Each range goes until the next one starts.
+        self.starts = []
+        self.ids = []
+        end = None
+        for ranges, symbolid in classes:
+            self.ranges[symbolid] = ranges
+        for first, last, symbolid in sorted((first, last, symbolid) for symbolid, ranges in self.ranges.items()
+                                            for first, last in ranges):
+            if end is not None and end < first:
+                self.starts.append(end)
+                self.ids.append(None)
+            self.starts.append(first)
+            self.ids.append(symbolid)
+            end = last + 1
+        if end is not None and end <= MAXCODE:
+            self.starts.append(end)
+            self.ids.append(None)
+
+    def classify(self, symbol):
+        """
+        :param symbol: An input. A character class can also be given, if it is entirely inside of one class.
+        :return: The id of the class which the input is in, or None if it is not in any of them
+        """
+        if len(symbol) == 1:
+            ranges = ((ord(symbol), ord(symbol)),)
+        elif isclass(symbol):
+            try:
+                ranges = parseclass(symbol)
+            except ValueError:
+                # A malformed class (like [z-a]) is just an input which is not in any of them
+                return None
+            if not ranges:
+                return None
+        else:
+            return None
+        symbolid = None
+        for first, last in ranges:
+            index = bisect_right(self.starts, first) - 1
+            # Each entry of self.starts is a range of a single class (or of none), so the whole range has to be
+            # inside of that one entry
+            if index < 0 or index + 1 < len(self.starts) and self.starts[index + 1] <= last:
+                return None
+            if self.ids[index] is None or symbolid is not None and self.ids[index] != symbolid:
+                return None
+            symbolid = self.ids[index]
+        return symbolid
+
+    def example(self, symbolid):
+        """
+        :param symbolid: The id of a class
+        :return: One of the characters in that class
+        """
+        return chr(self.ranges[symbolid][0][0])
@@ -0,0 +1,120 @@
+import pytest
+
+from analysis import AnalysisIndex
+from automata import Automaton
+from engine import EPSILON
+
+
+def specification():
+    # s -a-> t -b-> f, with a loop between t and u, a dead state d, and a state x which cannot be reached
+    return {"transitions": {"s": {"t": ["a"], "d": ["c"]}, "t": {"f": ["b"], "u": ["a"]}, "u": {"t": ["a", "b"]},
+                            "f": {}, "d": {"d": ["a"]}, "x": {"f": ["a"]}},
+            "start": "s", "finalstates": ["f"]}
+
+
+def summary(index):
+    """
+    :return: Everything that an AnalysisIndex knows about, in a form which can be compared
+    """
+    return {"outdegree": index.outdegree, "indegree": index.indegree, "alphabet": index.alphabet(),
+            "symbolcounts": +index.symbolcounts, "reachable": index.reachable(), "coreachable": index.coreachable(),
+            "sccs": {frozenset(component) for component in index.sccs()}}
+
+
+def assertuptodate(automaton):
+    assert summary(automaton.analyze()) == summary(AnalysisIndex(automaton))
+
+
+def test_analysis():
+    index = Automaton(data=specification()).analyze()
+    assert index.reachable() == {"s", "t", "u", "f", "d"}
+    assert index.coreachable() == {"s", "t", "u", "f", "x"}
+    assert index.useful() == {"s", "t", "u", "f"}
+    assert index.alphabet() == {"a", "b", "c"}
+    assert index.outdegree["t"] == 2
+    assert index.indegree["t"] == 2
+    assert index.indegree["f"] == 2
+
+
+def test_sccs_order():
+    components = [frozenset(component) for component in Automaton(data=specification()).analyze().sccs()]
+    assert frozenset({"t", "u"}) in components
+    # Every component comes after the ones it has transitions to
+    assert components.index(frozenset({"f"})) < components.index(frozenset({"t", "u"}))
+    assert components.index(frozenset({"t", "u"})) < components.index(frozenset({"s"}))
+
+
+def test_alphabet_leaves_out_epsilon():
+    automaton = Automaton(data=specification())
+    automaton.addtransition("f", "s", EPSILON)
+    assert automaton.analyze().alphabet() == {"a", "b", "c"}
+
+
+@pytest.mark.parametrize("edit", [
+    lambda automaton: automaton.addtransition("d", "f", ["b"]),
+    lambda automaton: automaton.addtransition("f", "x", ["c"]),
+    lambda automaton: automaton.addtransition("t", "f", ["a", "c"]),
+    lambda automaton: automaton.deletetransition("t", "f", ["b"]),
+    lambda automaton: automaton.deletetransition("u", "t", ["a"]),
+    lambda automaton: automaton.deletetransition("s", "t", EPSILON),
+    lambda automaton: automaton.addstate("n", False, True),
+    lambda automaton: automaton.addstate("f", False, False),
+    lambda automaton: automaton.removestate("u"),
+    lambda automaton: automaton.removestate("x"),
+])
+def test_index_is_kept_up_to_date(edit):
+    automaton = Automaton(data=specification())
+    assertuptodate(automaton)
+    edit(automaton)
+    assertuptodate(automaton)
+
+
+def test_index_after_freeze_and_thaw():
+    automaton = Automaton(data=specification())
+    automaton.analyze().useful()
+    automaton.freeze()
+    assert automaton.index is None
+    assertuptodate(automaton)
+    automaton.thaw()
+    assert automaton.index is None
+    assertuptodate(automaton)
+
+
+def test_index_after_editing_frozen():
+    automaton = Automaton(data=specification())
+    automaton.freeze()
+    automaton.analyze().useful()
+    automaton.addtransition("d", "f", ["b"])
+    assertuptodate(automaton)
+    assert automaton.analyze().useful() == {"s", "t", "u", "f", "d"}
+
+
+def test_trim():
+    automaton = Automaton(data=specification())
+    assert automaton.trim() == {"d", "x"}
+    assert set(automaton.states) == {"s", "t", "u", "f"}
+    assert automaton.accepts("ab")
+    assert automaton.accepts("aaab")
+    assert not automaton.accepts("c")
+    assertuptodate(automaton)
+    assert automaton.trim() == set()
+
+
+def test_trim_keeps_start_state():
+    automaton = Automaton(data={"transitions": {"s": {"t": ["a"]}, "t": {}}, "start": "s", "finalstates": []})
+    assert automaton.trim() == {"t"}
+    assert set(automaton.states) == {"s"}
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_prune(compact):
+    pruned = Automaton(data=specification(), compact=compact, prune=True)
+    unpruned = Automaton(data=specification(), compact=compact)
+    pruned.start()
+    assert pruned.step("c") == set()
+    unpruned.start()
+    assert unpruned.step("c") == {"d"}
+    for word in ["ab", "aaab", "c", "ca", "", "abb"]:
+        assert pruned.accepts(word) == unpruned.accepts(word)
+    # Pruning only changes what is run, not the states
+    assert set(pruned.states) == set(unpruned.states)
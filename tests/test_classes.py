@@ -0,0 +1,97 @@
+import pytest
+
+from automata import Automaton
+from engine import splitclasses
+from symbolclasses import CharClasses, MAXCODE, formatclass, parseclass, partition
+
+
+def codes(first, last):
+    return ord(first), ord(last)
+
+
+def test_parseclass():
+    assert parseclass("[a-cx]") == (codes("a", "c"), codes("x", "x"))
+    assert parseclass("[cba]") == (codes("a", "c"),)
+    assert parseclass("[\\]\\-]") == ((ord("-"), ord("-")), (ord("]"), ord("]")))
+    assert parseclass("[^]") == ((0, MAXCODE),)
+    assert parseclass("[^b]") == ((0, ord("a")), (ord("c"), MAXCODE))
+
+
+@pytest.mark.parametrize("label", ["[z-a]", "[a\\]", "abc"])
+def test_parseclass_malformed(label):
+    with pytest.raises(ValueError):
+        parseclass(label)
+
+
+@pytest.mark.parametrize("label", ["[a-z]", "[a-cx-z]", "[\\]\\-]", "[^a]"])
+def test_formatclass_round_trip(label):
+    assert parseclass(formatclass(parseclass(label))) == parseclass(label)
+
+
+def test_formatclass_single_character():
+    assert formatclass((codes("a", "a"),)) == "a"
+
+
+def test_partition():
+    # [a-m] and [h-z] overlap on [h-m]
+    classes = partition([(codes("a", "m"),), (codes("h", "z"),)])
+    assert sorted(classes) == [((codes("a", "g"),), (0,)), ((codes("h", "m"),), (0, 1)), ((codes("n", "z"),), (1,))]
+
+
+def test_splitclasses():
+    # 0 -a-> 1, 0 -[a-c]-> 1, 0 -b-> 2, and an input which is not a single character
+    symbols, edges, classes = splitclasses(["a", "b", "word"], [(0, 0, 1), (0, 1, 2), (0, 2, 1)],
+                                           [(0, 1, parseclass("[a-c]"))])
+    assert symbols[0] == "word"
+    assert classes.classify("a") == classes.classify("c") != classes.classify("b")
+    # b goes to both 1 and 2, so it is a class of its own
+    assert set(edges) == {(0, 0, 1), (0, symbols.index("[ac]"), 1), (0, symbols.index("b"), 1),
+                          (0, symbols.index("b"), 2)}
+
+
+def charclasses():
+    return CharClasses([(parseclass("[a-m]"), 0), (parseclass("[n-z]"), 1), (parseclass("[0-9]"), 2)])
+
+
+def test_classify_characters():
+    classes = charclasses()
+    assert classes.classify("a") == 0
+    assert classes.classify("m") == 0
+    assert classes.classify("n") == 1
+    assert classes.classify("5") == 2
+    assert classes.classify("A") is None
+    assert classes.classify("ab") is None
+
+
+def test_classify_classes():
+    classes = charclasses()
+    assert classes.classify("[b-d]") == 0
+    assert classes.classify("[ace]") == 0
+    # These are not entirely inside of one class
+    assert classes.classify("[a-z]") is None
+    assert classes.classify("[a0]") is None
+    assert classes.classify("[a-]") is None
+    assert classes.classify("[^a]") is None
+
+
+@pytest.mark.parametrize("label", ["[z-a]", "[a\\]"])
+def test_classify_malformed(label):
+    assert charclasses().classify(label) is None
+
+
+def automaton():
+    return Automaton(data={"transitions": {"s": {"t": ["[a-z]"]}, "t": {}}, "start": "s", "finalstates": ["t"]})
+
+
+def test_accepts_classes():
+    assert automaton().accepts("q")
+    assert automaton().accepts(["[b-d]"])
+    assert not automaton().accepts("Q")
+    assert not automaton().accepts(["[a-z0]"])
+
+
+def test_accepts_malformed_class():
+    assert not automaton().accepts(["[z-a]"])
+    frozen = automaton()
+    frozen.freeze()
+    assert not frozen.accepts(["[z-a]"])
@@ -0,0 +1,23 @@
+from automata import Automaton
+
+
+def test_subset_named_like_a_state():
+    # The subset {a, b} must not be confused with the state called "{a,b}"
+    automaton = Automaton(data={"transitions": {"s": {"a": ["x"], "b": ["x"], "{a,b}": ["y"]},
+                                                "a": {}, "b": {}, "{a,b}": {}},
+                                "start": "s", "finalstates": ["{a,b}"]})
+    deterministic = automaton.determinize()
+    assert len(deterministic.states) == 3
+    assert not deterministic.accepts("x")
+    assert deterministic.accepts("y")
+
+
+def test_subsets_of_names_with_commas():
+    # The subsets {"a,b", "c"} and {"a", "b,c"} must get different names
+    automaton = Automaton(data={"transitions": {"s": {"a,b": ["x"], "c": ["x"], "a": ["y"], "b,c": ["y"]},
+                                                "a,b": {}, "c": {}, "a": {}, "b,c": {}},
+                                "start": "s", "finalstates": ["c"]})
+    deterministic = automaton.determinize()
+    assert len(deterministic.states) == 3
+    assert deterministic.accepts("x")
+    assert not deterministic.accepts("y")
@@ -0,0 +1,53 @@
+from automata import Automaton
+from engine import EPSILON
+
+
+def chain():
+    # p -ε-> q -a-> r -ε-> s, and only s is final
+    return Automaton(data={"transitions": {"p": {"q": [EPSILON]}, "q": {"r": ["a"]}, "r": {"s": [EPSILON]}, "s": {}},
+                           "start": "p", "finalstates": ["s"]})
+
+
+def test_closure_of_start():
+    automaton = chain()
+    automaton.start()
+    assert automaton.currentstate == {"p", "q"}
+
+
+def test_closure_after_step():
+    automaton = chain()
+    assert automaton.accepts("a")
+    assert not automaton.accepts("")
+    assert not automaton.accepts("aa")
+
+
+def test_addtransition_epsilon():
+    automaton = chain()
+    automaton.addtransition("p", "s", EPSILON)
+    assert automaton.states["p"]["s"] == {EPSILON}
+    assert automaton.accepts("")
+
+
+def test_deletetransition_epsilon():
+    automaton = chain()
+    automaton.deletetransition("r", "s", EPSILON)
+    assert "s" not in automaton.states["r"]
+    assert "r" not in automaton.predecessors["s"]
+    assert not automaton.accepts("a")
+
+
+def test_deletetransition_epsilon_frozen():
+    automaton = chain()
+    automaton.freeze()
+    automaton.deletetransition("p", "q", EPSILON)
+    assert automaton.states["p"] == {}
+    assert not automaton.accepts("a")
+
+
+def test_deletetransition_keeps_other_inputs():
+    automaton = chain()
+    automaton.addtransition("r", "s", ["b"])
+    automaton.deletetransition("r", "s", EPSILON)
+    assert automaton.states["r"]["s"] == {"b"}
+    assert not automaton.accepts("a")
+    assert automaton.accepts("ab")
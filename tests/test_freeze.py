@@ -0,0 +1,46 @@
+import binaryformat
+from automata import Automaton
+from engine import EPSILON
+
+
+def specification():
+    # p -ε-> q -a-> r -ε-> s, and only s is final
+    return {"transitions": {"p": {"q": [EPSILON]}, "q": {"r": ["a"]}, "r": {"s": [EPSILON]}, "s": {}},
+            "start": "p", "finalstates": ["s"]}
+
+
+def transitions(automaton):
+    return {state: {otherstate: set(inputs) for otherstate, inputs in automaton.states[state].items()}
+            for state in automaton.states}
+
+
+def test_frozen_states_are_the_given_transitions():
+    automaton = Automaton(data=specification())
+    before = transitions(automaton)
+    automaton.freeze()
+    assert transitions(automaton) == before
+    assert "s" not in automaton.states["q"]
+    assert set(automaton.predecessors["s"]) == {"r"}
+    assert automaton.accepts("a")
+
+
+def test_thaw_and_todict_keep_the_given_transitions():
+    automaton = Automaton(data=specification())
+    before = transitions(automaton)
+    automaton.freeze()
+    assert Automaton(data=automaton.todict()).states == before
+    automaton.thaw()
+    assert automaton.states == before
+    assert automaton.accepts("a")
+
+
+def test_binary_keeps_the_given_transitions(tmp_path):
+    automaton = Automaton(data=specification())
+    before = transitions(automaton)
+    filepath = str(tmp_path / ("chain" + binaryformat.EXTENSION))
+    automaton.savebinary(filepath)
+    opened = Automaton()
+    opened.openbinary(filepath)
+    assert transitions(opened) == before
+    assert opened.accepts("a")
+    assert not opened.accepts("")